@@ -1,106 +1,302 @@
-import streamlit as st
+import contextvars
 from utils.openai_client import OpenAIClient
-from config.prompts import BLOG_WRITER_PROMPT
-import textwrap
+from utils.concurrency import TaskError, map_ordered, thread_pool
+from utils.streaming import StreamCollector, drain
+from utils.model_router import get_route, stream_with_route
+from utils.prompt_assembly import TEMPLATES, get_template, revision_messages
+from utils.chunking import DEFAULT_TOKEN_BUDGET, MarkdownChunker
+from utils.tokens import count_tokens, plan_max_tokens
+from utils.markdown_assembler import assemble
+from utils.chunk_memo import get_chunk_memo
+from utils.output_budget import get_output_budget
+from utils.metrics import record_chunk_reuse, record_section_quality
+from utils.section_quality import section_problems
+from utils.pipeline import StageFailed
 
-def chunk_newsletter(newsletter_content: str, chunk_size: int = 2000) -> list:
-    return textwrap.wrap(newsletter_content, chunk_size, break_long_words=False, break_on_hyphens=False)
+# Requests are built for the first model of the "blog" route in config.models
+BLOG_MODEL = get_route("blog").primary
+# Bump whenever the sampling settings change so that sections stored for
+# incremental runs are generated again; prompt and route changes are picked up
+# by _memo_version
+BLOG_PROMPT_VERSION = "1"
+# Incremental runs write sections from the context_segment extraction of each newsletter chunk
+BLOG_TEMPLATES = ("blog_intro", "blog_body", "blog_final", "context_segment")
+# Bounds of the max_tokens reserved per chunk; sections that outgrow the
+# reservation are resumed up to MAX_CONTINUATIONS times
+MIN_OUTPUT_TOKENS = 1000
+MAX_OUTPUT_TOKENS = 8000
+MAX_CONTINUATIONS = 2
+# Sections rewritten per blog at most when they fail the local quality checks
+MAX_QUALITY_REWRITES = 3
+
+def chunk_newsletter(newsletter_content: str, token_budget: int = DEFAULT_TOKEN_BUDGET, chunker=None) -> list:
+    """Split the newsletter into chunks of whole sections and paragraphs.
+
+    Any object with a split(text) method can be passed as chunker; by default
+    markdown-aware chunks of at most token_budget tokens are produced.
+    """
+    chunker = chunker or MarkdownChunker(token_budget=token_budget, model=BLOG_MODEL)
+    return chunker.split(newsletter_content)
 
 def calculate_tokens(text: str) -> int:
-    """Rough estimation of tokens based on words (1 token ≈ 0.75 words)"""
-    return len(text.split()) * 4 // 3
+    """Token count of text for the blog model"""
+    return count_tokens(text, BLOG_MODEL)
+
+def chunk_template(chunk_index: int, total_chunks: int):
+    """The intro template for the first chunk, the one with the conclusion for the last, the body one otherwise."""
+    if chunk_index == 0:
+        return get_template("blog_intro")
+    if chunk_index == total_chunks - 1:
+        return get_template("blog_final")
+    return get_template("blog_body")
+
+def _chunk_request(chunk: str, chunk_index: int, total_chunks: int) -> dict:
+    messages = chunk_template(chunk_index, total_chunks).messages(part=chunk_index + 1, chunk=chunk)
+
+    # Reserve what earlier sections needed for a chunk this size, then clamp
+    # to what fits in the model's context window next to the prompt. The
+    # budget is not mentioned in the prompt, so the prompt stays the same
+    # when the reservation changes
+    desired_tokens = get_output_budget().plan("blog", calculate_tokens(chunk), MIN_OUTPUT_TOKENS, MAX_OUTPUT_TOKENS)
+    max_output_tokens = plan_max_tokens(messages, BLOG_MODEL, desired_tokens)
+
+    return dict(
+        model=BLOG_MODEL,
+        messages=messages,
+        temperature=0.3,
+        max_tokens=max_output_tokens,
+        presence_penalty=0.0,
+        frequency_penalty=1.0
+    )
+
+def _finish_chunk(content: str, chunk_index: int) -> str:
+    chunk_content = content.strip()
+
+    if chunk_index == 0 and not chunk_content.startswith('#'):
+        chunk_content = "# " + chunk_content
+
+    return chunk_content
+
+def _complete_chunk(client, request: dict) -> str:
+    # Streamed even when nobody watches: a chunk takes minutes, and only a
+    # stream notices a cancelled run between events and closes its request
+    return drain(stream_with_route(client, "blog", request, max_continuations=MAX_CONTINUATIONS))
+
+def generate_chunk(client, chunk: str, chunk_index: int, total_chunks: int) -> str:
+    """Generate the blog section for a single newsletter chunk."""
+    content = _complete_chunk(client, _chunk_request(chunk, chunk_index, total_chunks))
+    _observe_output(chunk, content)
+    return _finish_chunk(content, chunk_index)
+
+def _observe_output(chunk: str, content: str):
+    get_output_budget().observe("blog", calculate_tokens(chunk), calculate_tokens(content), content)
+
+def revise_chunk(client, chunk: str, chunk_index: int, total_chunks: int, section: str, problems: list) -> str:
+    """Ask for the section of one chunk again, telling the model what the quality checks found."""
+    request = _chunk_request(chunk, chunk_index, total_chunks)
+    request["messages"] = revision_messages(request["messages"], section, problems)
+    content = _complete_chunk(client, request)
+    return _finish_chunk(content, chunk_index)
+
+def enforce_quality(client, chunks: list, sections: list, max_concurrency: int = 1,
+                    budget: int = MAX_QUALITY_REWRITES) -> list:
+    """Rewrite only the sections that fail the local quality checks, at most budget of them.
+
+    A rewrite replaces its section only if it has fewer problems than the
+    original; a rewrite that fails keeps the original. Returns the sections
+    with the rewrites that were kept.
+    """
+    problems = section_problems(sections)
+    failing = [chunk_index for chunk_index, found in enumerate(problems) if found]
+    chosen = failing[:budget]
+
+    def rewrite(_, chunk_index):
+        try:
+            return revise_chunk(client, chunks[chunk_index], chunk_index, len(chunks),
+                                sections[chunk_index], problems[chunk_index])
+        except Exception:
+            return None
 
-def generate_blog(newsletter_context: str) -> str:
+    revised = map_ordered(rewrite, chosen, max_workers=max_concurrency) if chosen else []
+    result = list(sections)
+    fixed = 0
+    for chunk_index, candidate in zip(chosen, revised):
+        if candidate is None:
+            continue
+        trial = result[:chunk_index] + [candidate] + result[chunk_index + 1:]
+        if len(section_problems(trial)[chunk_index]) < len(problems[chunk_index]):
+            result[chunk_index] = candidate
+            fixed += 1
+    record_section_quality(len(sections), len(failing), len(chosen), fixed)
+    return result
+
+def _checked_sections(client, chunks: list, keys: list, sections: list, max_concurrency: int, incremental: bool,
+                      check_quality: bool) -> list:
+    if not check_quality:
+        return sections
+    checked = enforce_quality(client, chunks, sections, max_concurrency)
+    for chunk_index, (section, kept) in enumerate(zip(sections, checked)):
+        if kept is not section:
+            _remember_section(keys, chunk_index, kept, incremental)
+    return checked
+
+def _failed(chunk_index: int, e: Exception) -> StageFailed:
+    return StageFailed(f"Blog generation error in chunk {chunk_index + 1}: {str(e)}")
+
+def _memo_version() -> str:
+    templates = ",".join(TEMPLATES[name].key for name in BLOG_TEMPLATES)
+    return f"{BLOG_PROMPT_VERSION}:{templates}:{','.join(get_route('blog').models)}"
+
+def _blog_chunks(newsletter_context: str, context_parts) -> tuple:
+    """The chunks the sections are written from and the memo keys of those chunks."""
+    if context_parts is None:
+        chunks = chunk_newsletter(newsletter_context)
+        return chunks, chunks
+    return [part for _, part in context_parts], [source for source, _ in context_parts]
+
+def _reused_sections(keys: list, incremental: bool) -> list:
+    """Sections stored for unchanged chunks by an earlier incremental run, None for the rest."""
+    if not incremental:
+        return [None] * len(keys)
+    sections = get_chunk_memo().lookup(keys, _memo_version())
+    record_chunk_reuse(sum(section is not None for section in sections), len(keys))
+    return sections
+
+def _remember_section(keys: list, chunk_index: int, section: str, incremental: bool):
+    if incremental:
+        get_chunk_memo().remember(keys[chunk_index], chunk_index, len(keys), _memo_version(), section)
+
+def generate_blog(newsletter_context: str, max_concurrency: int = 1, incremental: bool = False,
+                  on_section=None, check_quality: bool = False, context_parts: list = None) -> str:
+    """Generate the blog chunk by chunk.
+
+    With max_concurrency > 1 up to that many chunks are generated at the same
+    time; sections are still stitched together in chunk order. With
+    incremental=True chunks whose text is unchanged since an earlier
+    incremental run reuse the section written then, and only the others are
+    sent to the model. on_section(chunk_index, section) is called as soon as
+    each section is finished, possibly from a worker thread and out of order.
+    With check_quality=True the finished sections are checked locally and
+    only the ones that fail are rewritten, up to MAX_QUALITY_REWRITES; the
+    rewrites are not reported to on_section. A chunk whose request fails
+    raises StageFailed naming the chunk and the cause.
+
+    context_parts, the (newsletter chunk, context) pairs of
+    context_extractor.extract_context_parts, replaces chunking
+    newsletter_context: every part becomes one chunk, and incremental runs
+    recognise it by its newsletter chunk, so an edit to the newsletter only
+    regenerates the sections of the chunks it touched.
+    """
     client = OpenAIClient.get_client()
-    chunks = chunk_newsletter(newsletter_context)
-    full_blog_content = ""
-    previous_content = ""
-
-    for chunk_index, chunk in enumerate(chunks):
-        # Calculate dynamic max_tokens based on chunk size
-        chunk_tokens = calculate_tokens(chunk)
-        max_output_tokens = min(8000, max(2000, chunk_tokens * 2))  # Dynamic allocation between 2000-5000
-
-        if chunk_index == 0:
-            user_message = (
-                f"NEWSLETTER CONTENT PART {chunk_index + 1}:\n\n{chunk}\n\n"
-                "INSTRUCTIONS:\n"
-                "<Introduction>"
-                "- Start the introduction of the blog with a heading. The heading must be from the newsletter.\n" 
-                "-From the newsletter content, Generate the blog mirroring the newsletter effectively. Extract the introductory content of the newsletter and start with a strong Introduction of 300-400 words\n."
-                 "- Keep the tone conversational and engaging.\n"
-                 "- Do not use AI generated phrases or words.\n"
-                 "- Avoid using bullet points, numbering or visualizations such as table , diagrams.\n"
-                 "- Ensure all the information is covered from the newsletter. Including heading , subheadings , titles , paragraphs etc.\n"
-                 "- Write the paragraph in a detailed way to make the content easy to understand.\n"
-                 "- Present the blog as a story to establish connection with the audience.\n"
-                 "- Avoid using jargons.\n"
-                 "- If the content of the newsletter is covered then the introduction has ended </introduction>, move onto the next chunk to process new information.\n"
-                "10. IMPORTANT: Only write about information present in the newsletter. Stop when the content is exhausted.\n"
-                f"Note: You have {max_output_tokens} tokens available for this section."
-            )
+    chunks, keys = _blog_chunks(newsletter_context, context_parts)
+    reused = _reused_sections(keys, incremental)
+
+    def produce(chunk_index, chunk):
+        if reused[chunk_index] is not None:
+            section = reused[chunk_index]
         else:
-            user_message = (
-                f"CONTINUE WITH NEWSLETTER PART {chunk_index + 1}:\n\n{chunk}\n\n"
-                "<body>"
-                "INSTRUCTIONS:\n"
-                "-. Use proper markdown formatting with appropriate headings and subheadings from the newsletter content.\n"
-                "1. Present the blog as if you're explaining it to a colleague, avoiding technical jargon and try to mirror the newsletter.\n"
-                "2. Continue the blog post coherently from the previous section.\n"
-                "3. Maintain the same writing style and depth as of the newsletter.\n"
-                "4. Write atleast 5-6 sections of the blog. Each section must be explained in detail for ease of understanding.\n"
-                "5. Ensure all the information from the newsletter being processed is covered.\n"
-                "6. Keep the information accurate and consistent with the newsletter.\n"
-                "7. For each section, generate detailed explanations/paragraphs upto (600 words). Expand on the keypoints of each section and use information from the newsletter to make the user learn effectively.\n"
-                "<Restrictions>"
-                "- Do not use phrases like In this newsletter, or In this blog.\n" 
-                "- Do not use AI generated phrases or sentences." 
-                "- Do not use short concise sentences."
-                "- Each section must be fully explained with detailed information while also maintaining the smooth flow of the blog."
-                "- Do not explain the sections in 2-3 lines of paragraphs. Expand on it and keep it engaging by following the newsletter content."
-                "- Do not use bullet points numbering or any visuals that hinders information."
-                "- Do not add any information that is not mentioned in the newsletter."
-                "</Restrictions>"
-                "8. Stop writing when you've covered all the new information.\n"
-                "</body>"
-                "<Conclusion>"
-                f"{'10. Once all the newsletter content has been covered, End with a comprehensive conclusion of 200-300 words that ties together the key points.' if chunk_index == len(chunks)-1 else ''}\n"
-                "</Conclusion>"
-                f"Note: You have {max_output_tokens} tokens available for this section."
-            )
+            section = generate_chunk(client, chunk, chunk_index, len(chunks))
+            _remember_section(keys, chunk_index, section, incremental)
+        if on_section is not None:
+            on_section(chunk_index, section)
+        return section
 
+    pending = sum(section is None for section in reused)
+    if max_concurrency > 1 and pending > 1:
         try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a precise blog writer who ONLY uses information from the provided newsletter content. Stop writing when you've covered all the information."},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.3,
-                max_tokens=max_output_tokens,
-                presence_penalty=0.0,
-                frequency_penalty=1.0
-            )
+            sections = map_ordered(produce, chunks, max_workers=max_concurrency)
+        except TaskError as e:
+            raise _failed(e.index, e.error) from e.error
+    else:
+        sections = []
+        for chunk_index, chunk in enumerate(chunks):
+            try:
+                sections.append(produce(chunk_index, chunk))
+            except Exception as e:
+                raise _failed(chunk_index, e) from e
 
-            chunk_content = response.choices[0].message.content.strip()
+    sections = _checked_sections(client, chunks, keys, sections, max_concurrency, incremental, check_quality)
+    # One pass that normalises headings and drops content repeated across chunks
+    return assemble(sections)
 
-            if chunk_index == 0 and not chunk_content.startswith('#'):
-                chunk_content = "# " + chunk_content
+def stream_blog(newsletter_context: str, max_concurrency: int = 1, incremental: bool = False,
+                on_section=None, check_quality: bool = False, context_parts: list = None):
+    """Streaming variant of generate_blog.
 
-            full_blog_content += "\n\n" + chunk_content
-            previous_content = chunk_content
+    The first chunk to be generated is streamed token by token. With
+    max_concurrency > 1 the remaining chunks are generated in the background
+    meanwhile and each is yielded whole, in chunk order, once it is ready;
+    otherwise every chunk is streamed in turn. Reused sections are yielded
+    whole. on_section is called as in generate_blog; background chunks report
+    as soon as they finish, not when they are yielded. Quality rewrites run
+    after the last chunk and are not streamed. context_parts is used as in
+    generate_blog. Returns the same text as generate_blog.
+    """
+    client = OpenAIClient.get_client()
+    chunks, keys = _blog_chunks(newsletter_context, context_parts)
+    reused = _reused_sections(keys, incremental)
+    pending = [chunk_index for chunk_index, section in enumerate(reused) if section is None]
+
+    def publish(chunk_index, section):
+        if on_section is not None:
+            on_section(chunk_index, section)
+        return section
 
-        except Exception as e:
-            st.error(f"Blog generation error in chunk {chunk_index + 1}: {str(e)}")
-            return ""
+    for chunk_index, section in enumerate(reused):
+        if section is not None:
+            publish(chunk_index, section)
+
+    executor = None
+    background = {}
+    if max_concurrency > 1 and len(pending) > 1:
+        # One worker slot is taken by the chunk streamed in the foreground
+        executor = thread_pool(max(1, max_concurrency - 1))
+        for chunk_index in pending[1:]:
+            background[chunk_index] = executor.submit(
+                contextvars.copy_context().run,
+                lambda chunk_index: publish(
+                    chunk_index, generate_chunk(client, chunks[chunk_index], chunk_index, len(chunks))
+                ),
+                chunk_index
+            )
 
-    # Final formatting
-    formatted_content = full_blog_content.replace('\n#', '\n\n#').replace('\n##', '\n\n##')
-    
+    sections = []
+    chunk_index = 0
     try:
-        with open("README.md", "w", encoding="utf-8") as f:
-            f.write(formatted_content)
+        for chunk_index, chunk in enumerate(chunks):
+            if reused[chunk_index] is not None:
+                section = reused[chunk_index]
+                yield "\n\n" + section
+            elif chunk_index in background:
+                section = background[chunk_index].result()
+                _remember_section(keys, chunk_index, section, incremental)
+                yield "\n\n" + section
+            else:
+                started = False
+                yield "\n\n"
+                stream = StreamCollector(stream_with_route(
+                    client, "blog", _chunk_request(chunk, chunk_index, len(chunks)), max_continuations=MAX_CONTINUATIONS
+                ))
+                for delta in stream:
+                    if not started:
+                        delta = delta.lstrip()
+                        if not delta:
+                            continue
+                        if chunk_index == 0 and not delta.startswith('#'):
+                            yield "# "
+                        started = True
+                    yield delta
+                _observe_output(chunk, stream.value)
+                section = _finish_chunk(stream.value, chunk_index)
+                _remember_section(keys, chunk_index, section, incremental)
+                publish(chunk_index, section)
+            sections.append(section)
     except Exception as e:
-        st.error(f"Error saving to README.md: {str(e)}")
+        raise _failed(chunk_index, e) from e
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-    return formatted_content
+    sections = _checked_sections(client, chunks, keys, sections, max_concurrency, incremental, check_quality)
+    # One pass that normalises headings and drops content repeated across chunks
+    return assemble(sections)
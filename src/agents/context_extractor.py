@@ -1,19 +1,161 @@
-import streamlit as st
 from utils.openai_client import OpenAIClient
-from config.prompts import NEWSLETTER_CONTEXT_PROMPT
+from utils.concurrency import TaskError, map_ordered
+from utils.model_router import complete_with_route, get_route, stream_with_route
+from utils.chunking import DEFAULT_TOKEN_BUDGET, MarkdownChunker
+from utils.tokens import count_tokens, get_tokenizer
+from utils.prompt_assembly import get_template
+from utils.pipeline import StageFailed
 
-def extract_context(newsletter: str) -> str:
+# Requests are built for the first model of the "context" route in config.models
+CONTEXT_MODEL = get_route("context").primary
+# Newsletters longer than this are extracted segment by segment and merged
+MAP_REDUCE_MIN_TOKENS = 12000
+SEGMENT_TOKENS = 6000
+# Largest amount of partial context merged by a single reduce call
+REDUCE_INPUT_TOKENS = 24000
+# Partial contexts are cut to this length so that every reduce call merges
+# at least two of them and the final merge always fits
+MAX_PARTIAL_TOKENS = REDUCE_INPUT_TOKENS // 2
+
+def _context_request(newsletter: str) -> dict:
+    return dict(
+        model=CONTEXT_MODEL,
+        messages=get_template("context").messages(newsletter=newsletter),
+        temperature=0.7
+    )
+
+def _segment_request(segment: str, segment_index: int, total_segments: int) -> dict:
+    return dict(
+        model=CONTEXT_MODEL,
+        messages=get_template("context_segment").messages(
+            part=segment_index + 1, total=total_segments, segment=segment
+        ),
+        temperature=0.7
+    )
+
+def _merge_request(partials: list) -> dict:
+    parts = "\n\n".join(f"PART {index + 1}:\n{partial}" for index, partial in enumerate(partials))
+    return dict(
+        model=CONTEXT_MODEL,
+        messages=get_template("context_merge").messages(parts=parts),
+        temperature=0.3
+    )
+
+def needs_map_reduce(newsletter: str) -> bool:
+    return count_tokens(newsletter, CONTEXT_MODEL) > MAP_REDUCE_MIN_TOKENS
+
+def split_newsletter(newsletter: str) -> list:
+    return MarkdownChunker(token_budget=SEGMENT_TOKENS, model=CONTEXT_MODEL).split(newsletter)
+
+def _complete(client, request: dict) -> str:
+    return complete_with_route(client, "context", request).strip()
+
+def _failed(e: Exception) -> StageFailed:
+    if isinstance(e, TaskError):
+        return StageFailed(f"Context extraction error in part {e.index + 1}: {str(e.error)}")
+    return StageFailed(f"Context extraction error: {str(e)}")
+
+def _fit_partial(partial: str) -> str:
+    if count_tokens(partial, CONTEXT_MODEL) <= MAX_PARTIAL_TOKENS:
+        return partial
+    return get_tokenizer(CONTEXT_MODEL).split(partial, MAX_PARTIAL_TOKENS)[0]
+
+def _group_partials(partials: list) -> list:
+    """Pack consecutive partial contexts into groups of at most REDUCE_INPUT_TOKENS."""
+    groups = [[]]
+    group_tokens = 0
+    for partial in partials:
+        tokens = count_tokens(partial, CONTEXT_MODEL)
+        if groups[-1] and group_tokens + tokens > REDUCE_INPUT_TOKENS:
+            groups.append([])
+            group_tokens = 0
+        groups[-1].append(partial)
+        group_tokens += tokens
+    return groups
+
+def _map_and_reduce(client, newsletter: str, max_concurrency: int) -> list:
+    """Extract every segment in parallel and merge until one reduce call remains.
+
+    Returns the partial contexts that the final merge request combines.
+    """
+    segments = split_newsletter(newsletter)
+    partials = map_ordered(
+        lambda segment_index, segment: _complete(client, _segment_request(segment, segment_index, len(segments))),
+        segments,
+        max_workers=max_concurrency
+    )
+    while True:
+        partials = [_fit_partial(partial) for partial in partials]
+        groups = _group_partials(partials)
+        if len(groups) == 1:
+            return partials
+        partials = map_ordered(
+            lambda group_index, group: _complete(client, _merge_request(group)),
+            groups,
+            max_workers=max_concurrency
+        )
+
+def extract_context(newsletter: str, max_concurrency: int = 4) -> str:
+    """Extract the newsletter's context.
+
+    Short newsletters take a single request. Longer ones are split into
+    segments that are extracted in parallel (up to max_concurrency at a time)
+    and the partial contexts are merged by a reduce call. Raises StageFailed
+    with the cause when a request fails.
+    """
     client = OpenAIClient.get_client()
     try:
-        response = client.chat.completions.create(
-            model="chatgpt-4o-latest",
-            messages=[
-                {"role": "system", "content": NEWSLETTER_CONTEXT_PROMPT},
-                {"role": "user", "content": f"Process this newsletter and extract its complete context:\n\n{newsletter}"}
-            ],
-            temperature=0.7
-        )
-        return response.choices[0].message.content.strip()
+        if not needs_map_reduce(newsletter):
+            return _complete(client, _context_request(newsletter))
+        partials = _map_and_reduce(client, newsletter, max_concurrency)
+        if len(partials) == 1:
+            return partials[0]
+        return _complete(client, _merge_request(partials))
+    except Exception as e:
+        raise _failed(e) from e
+
+def extract_context_parts(newsletter: str, max_concurrency: int = 4, known: list = None) -> list:
+    """(newsletter chunk, context extracted from it) pairs, one per blog-sized chunk of the newsletter.
+
+    An opt-in alternative to extract_context for incremental runs: there is
+    no merge call, so the context of a chunk depends on that chunk alone and
+    the blog sections of unchanged chunks can be recognised and kept. Chunks
+    found in known, the pairs of an earlier run, keep their context and are
+    not sent again.
+    """
+    client = OpenAIClient.get_client()
+    chunks = MarkdownChunker(token_budget=DEFAULT_TOKEN_BUDGET, model=CONTEXT_MODEL).split(newsletter)
+    known_parts = dict(known or [])
+
+    def extract(chunk_index, chunk):
+        if chunk in known_parts:
+            return known_parts[chunk]
+        return _complete(client, _segment_request(chunk, chunk_index, len(chunks)))
+
+    try:
+        parts = map_ordered(extract, chunks, max_workers=max_concurrency)
+        return list(zip(chunks, parts))
+    except Exception as e:
+        raise _failed(e) from e
+
+def stream_context(newsletter: str, max_concurrency: int = 4):
+    """Streaming variant of extract_context.
+
+    Yields text deltas as they arrive and returns the same value as
+    extract_context once the stream is exhausted. For long newsletters only
+    the final merge is streamed.
+    """
+    client = OpenAIClient.get_client()
+    try:
+        if not needs_map_reduce(newsletter):
+            request = _context_request(newsletter)
+        else:
+            partials = _map_and_reduce(client, newsletter, max_concurrency)
+            if len(partials) == 1:
+                yield partials[0]
+                return partials[0]
+            request = _merge_request(partials)
+        content = yield from stream_with_route(client, "context", request)
+        return content.strip()
     except Exception as e:
-        st.error(f"Context extraction error: {str(e)}")
-        return "" 
\ No newline at end of file
+        raise _failed(e) from e
@@ -1,45 +1,157 @@
 import json
-import streamlit as st
 from utils.openai_client import OpenAIClient
-from config.prompts import SEO_EXPERT_PROMPT
+from utils.model_router import complete_with_route, get_route, stream_with_route
+from utils.text_patch import apply_edits, number_blocks
+from utils.seo_engine import analyze, get_seo_index
+from utils.prompt_assembly import get_template
+from utils.metrics import record_notice
 
-def generate_seo_metadata(blog_text: str) -> dict:
-    client = OpenAIClient.get_client()
-    try:
-        response = client.chat.completions.create(
-            model="chatgpt-4o-latest",
-            messages=[
-                {"role": "system", "content": SEO_EXPERT_PROMPT},
-                {"role": "user", "content": f"Optimize this content and generate SEO metadata:\n\n{blog_text}"}
-            ],
+# Requests are built for the first model of the "seo" route in config.models
+SEO_MODEL = get_route("seo").primary
+# "edits" asks for targeted changes that are patched into the blog locally;
+# "rewrite" is the original mode that returns the whole blog in the JSON;
+# "local" skips the model and only computes the metadata locally
+SEO_MODES = ("edits", "rewrite", "local")
+# The edits answer holds the metadata and a handful of edits, never the blog
+SEO_EDITS_MAX_TOKENS = 1500
+# Resume a JSON answer cut off by max_tokens instead of asking for it again
+SEO_MAX_CONTINUATIONS = 1
+
+METADATA_FIELDS = {
+    "page_title": str,
+    "meta_title": str,
+    "meta_description": str,
+    "focus_keywords": list,
+    "url_slug": str,
+}
+
+def _seo_request(blog_text: str, mode: str = "edits") -> dict:
+    if mode not in SEO_MODES:
+        raise ValueError(f"Unknown SEO mode '{mode}', expected one of {', '.join(SEO_MODES)}")
+    if mode == "local":
+        raise ValueError("The local SEO mode does not call the model")
+    if mode == "rewrite":
+        return dict(
+            model=SEO_MODEL,
+            messages=get_template("seo_rewrite").messages(blog=blog_text),
             temperature=0.3
         )
-        seo_json_str = response.choices[0].message.content.strip()
-        seo_json_str = seo_json_str.replace('```json', '').replace('```', '').strip()
+    return dict(
+        model=SEO_MODEL,
+        messages=get_template("seo_edits").messages(numbered_blog=number_blocks(blog_text)),
+        temperature=0.3,
+        max_tokens=SEO_EDITS_MAX_TOKENS
+    )
+
+def local_metadata(blog_text: str) -> dict:
+    """Keywords, titles, description and slug computed without a model call.
+
+    The keyword ranking is weighted with the document-frequency index of
+    past posts; the blog itself is only added by index_post once its run is
+    archived.
+    """
+    return analyze(blog_text, get_seo_index())
+
+def index_post(results: dict, key: str) -> bool:
+    """Add a finished run's blog to the document-frequency index, once per key (e.g. the newsletter digest).
+
+    Called when a run is archived rather than on every analysis, so reruns
+    and SEO passes over the same post do not count as new documents.
+    """
+    blog_text = (results.get("seo") or {}).get("seo_enhanced_content") or results["blog"]
+    return get_seo_index().add_document(blog_text, key=key)
+
+def _fallback_metadata(blog_text: str) -> dict:
+    return {"seo_enhanced_content": blog_text, **local_metadata(blog_text)}
+
+def _validate_metadata(seo_metadata: dict, required_fields: list):
+    if not isinstance(seo_metadata, dict):
+        raise ValueError("SEO response is not a JSON object")
+    missing_fields = [field for field in required_fields if field not in seo_metadata]
+    if missing_fields:
+        raise ValueError(f"Missing fields: {', '.join(missing_fields)}")
+    wrong_types = [field for field, kind in METADATA_FIELDS.items() if not isinstance(seo_metadata[field], kind)]
+    if wrong_types:
+        raise ValueError(f"Fields with the wrong type: {', '.join(wrong_types)}")
+
+def _strip_json_fences(content: str) -> str:
+    return content.strip().replace('```json', '').replace('```', '').strip()
+
+def _seo_check(mode: str):
+    """Quality gate for the model route: what is wrong with an answer, or None if it is usable."""
+    def check(content: str):
         try:
-            seo_metadata = json.loads(seo_json_str)
-            required_fields = [
-                "seo_enhanced_content",
-                "page_title",
-                "meta_title",
-                "meta_description",
-                "focus_keywords",
-                "url_slug"
-            ]
-            missing_fields = [field for field in required_fields if field not in seo_metadata]
-            if missing_fields:
-                raise ValueError(f"Missing fields: {', '.join(missing_fields)}")
-            return seo_metadata
-        except json.JSONDecodeError:
-            st.error("Invalid JSON response from SEO agent")
-            return {
-                "seo_enhanced_content": blog_text,
-                "page_title": blog_text.split('\n')[0][:50] + "...",
-                "meta_title": blog_text.split('\n')[0][:50] + "...",
-                "meta_description": blog_text[:150] + "...",
-                "focus_keywords": ["blog", "article"],
-                "url_slug": blog_text.split('\n')[0].lower().replace(' ', '-')[:50]
-            }
+            seo_metadata = json.loads(_strip_json_fences(content))
+            if mode == "rewrite":
+                _validate_metadata(seo_metadata, ["seo_enhanced_content", *METADATA_FIELDS])
+            elif not isinstance(seo_metadata, dict):
+                raise ValueError("SEO response is not a JSON object")
+        except ValueError as e:
+            return str(e)
+        return None
+    return check
+
+def _parse_seo_response(content: str, blog_text: str, mode: str = "edits") -> dict:
+    try:
+        seo_metadata = json.loads(_strip_json_fences(content))
+    except json.JSONDecodeError:
+        record_notice("The SEO agent did not return valid JSON; the metadata was computed locally")
+        return _fallback_metadata(blog_text)
+
+    if mode == "rewrite":
+        _validate_metadata(seo_metadata, ["seo_enhanced_content", *METADATA_FIELDS])
+        return seo_metadata
+
+    if not isinstance(seo_metadata, dict):
+        raise ValueError("SEO response is not a JSON object")
+    # Fields the model left out or got wrong are filled in by the local engine
+    metadata = local_metadata(blog_text)
+    metadata.update({
+        field: seo_metadata[field] for field, kind in METADATA_FIELDS.items()
+        if isinstance(seo_metadata.get(field), kind) and seo_metadata[field]
+    })
+    edits = seo_metadata.get("edits")
+    seo_enhanced_content, report = apply_edits(blog_text, edits if isinstance(edits, list) else [])
+    return {
+        "seo_enhanced_content": seo_enhanced_content,
+        **metadata,
+        "seo_edits": report.as_dict(),
+    }
+
+def generate_seo_metadata(blog_text: str, mode: str = "edits") -> dict:
+    """SEO metadata plus the optimized blog under "seo_enhanced_content".
+
+    In "edits" mode the model only returns targeted edits, which are applied
+    to blog_text locally, so the answer grows with the number of edits rather
+    than with the length of the blog. In "local" mode no model is called at
+    all and the blog is returned unchanged with locally computed metadata.
+    If the model call fails, the blog is returned unchanged with local
+    metadata and the error is recorded with utils.metrics.record_notice.
+    """
+    if mode == "local":
+        return _fallback_metadata(blog_text)
+    client = OpenAIClient.get_client()
+    try:
+        content = complete_with_route(client, "seo", _seo_request(blog_text, mode), _seo_check(mode),
+                                      max_continuations=SEO_MAX_CONTINUATIONS)
+        return _parse_seo_response(content, blog_text, mode)
+    except Exception as e:
+        record_notice(f"SEO optimization failed, the metadata was computed locally: {str(e)}")
+        return _fallback_metadata(blog_text)
+
+def stream_seo_metadata(blog_text: str, mode: str = "edits"):
+    """Streaming variant of generate_seo_metadata.
+
+    Yields the raw JSON deltas and returns the same dict as
+    generate_seo_metadata once the stream is exhausted.
+    """
+    if mode == "local":
+        return _fallback_metadata(blog_text)
+    client = OpenAIClient.get_client()
+    try:
+        content = yield from stream_with_route(client, "seo", _seo_request(blog_text, mode), _seo_check(mode),
+                                               max_continuations=SEO_MAX_CONTINUATIONS)
+        return _parse_seo_response(content, blog_text, mode)
     except Exception as e:
-        st.error(f"Error in SEO optimization: {str(e)}")
-        return {"seo_enhanced_content": blog_text} 
\ No newline at end of file
+        record_notice(f"SEO optimization failed, the metadata was computed locally: {str(e)}")
+        return _fallback_metadata(blog_text)
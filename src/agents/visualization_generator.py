@@ -1,37 +1,242 @@
+import contextvars
 import json
-import streamlit as st
+import re
 from utils.openai_client import OpenAIClient
-from config.prompts import VISUALIZATION_EXPERT_PROMPT
+from utils.concurrency import map_ordered, thread_pool
+from utils.model_router import complete_with_route, get_route, stream_with_route
+from utils.mermaid import strip_fences, validate_mermaid
+from utils.prompt_assembly import get_template
+from utils.metrics import record_notice
 
-def generate_visuals(blog_text: str) -> list:
-    client = OpenAIClient.get_client()
+# Requests are built for the first model of the "visuals" route in config.models
+VISUALS_MODEL = get_route("visuals").primary
+# "sections" draws one diagram per top-ranked blog section, concurrently;
+# "whole" sends the entire blog in one request as before
+VISUALS_MODES = ("sections", "whole")
+MAX_SECTION_VISUALS = 3
+# Sections shorter than this have too little substance for a diagram
+MIN_SECTION_WORDS = 60
+MAX_REPAIR_ATTEMPTS = 1
+
+_JSON_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_HEADING = re.compile(r"^#{1,6}\s+(.*)$")
+# Words that signal processes, comparisons or structure worth drawing
+_DIAGRAM_CUES = re.compile(
+    r"\b(step|steps|process|workflow|pipeline|stage|stages|layer|layers|architecture|compare|comparison|versus|"
+    r"vs|flow|sequence|lifecycle|framework|components?|first|second|third|then|finally)\b",
+    re.IGNORECASE
+)
+
+def _visuals_request(blog_text: str) -> dict:
+    return dict(
+        model=VISUALS_MODEL,
+        messages=get_template("visuals").messages(blog=blog_text),
+        temperature=0.7
+    )
+
+def _section_request(heading: str, body: str) -> dict:
+    return dict(
+        model=VISUALS_MODEL,
+        messages=get_template("visuals_section").messages(heading=heading, body=body),
+        temperature=0.7
+    )
+
+def _repair_request(diagram: dict, errors: list) -> dict:
+    return dict(
+        model=VISUALS_MODEL,
+        messages=get_template("visuals_repair").messages(
+            errors="\n- ".join(errors), mermaid_code=diagram.get("mermaid_code", "")
+        ),
+        temperature=0.2
+    )
+
+def _load_diagrams(content: str) -> list:
+    # Only the outer fence is removed; diagrams may carry their own ```mermaid fences
+    visuals_str = _JSON_FENCE.sub("", content.strip()).strip()
+    visuals_data = json.loads(visuals_str)
+    if isinstance(visuals_data, dict) and "diagrams" in visuals_data:
+        return visuals_data["diagrams"]
+    if isinstance(visuals_data, dict) and "mermaid_code" in visuals_data:
+        return [visuals_data]
+    if isinstance(visuals_data, list):
+        return visuals_data
+    raise ValueError("Unexpected visuals format")
+
+def _visuals_check(content: str):
+    """Quality gate for the model route: what is wrong with an answer, or None if it is usable."""
+    try:
+        diagrams = [d for d in (_clean_diagram(d) for d in _load_diagrams(content)) if d is not None]
+    except ValueError as e:
+        return str(e)
+    if not diagrams:
+        return "no diagrams"
+    if all(validate_mermaid(diagram["mermaid_code"]) for diagram in diagrams):
+        return "no diagram is valid Mermaid"
+    return None
+
+def _parse_visuals_response(content: str) -> list:
     try:
-        user_message = (f"Create 2-3 strategic visualizations using Mermaid.js for the following blog content. "
-                        f"Explain the Mermaid.js code briefly."
-                       f"Return a valid JSON response containing the diagrams and a brief code explanations.\n\n"
-                       f"Content:\n{blog_text}")
-        response = client.chat.completions.create(
-            model="chatgpt-4o-latest",
-            messages=[
-                {"role": "system", "content": VISUALIZATION_EXPERT_PROMPT},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.7
-        )
-        visuals_str = response.choices[0].message.content.strip()
-        visuals_str = visuals_str.replace('```json', '').replace('```', '').strip()
+        return _load_diagrams(content)
+    except json.JSONDecodeError:
+        record_notice("The visuals agent did not return valid JSON; no diagrams were drawn")
+        return []
+    except ValueError:
+        record_notice("The visuals agent returned an unexpected format; no diagrams were drawn")
+        return []
+
+def split_sections(blog_text: str) -> list:
+    """(heading, body) for every markdown section of the blog, in order."""
+    sections = []
+    heading, body = "", []
+    for line in blog_text.splitlines():
+        match = _HEADING.match(line.strip())
+        if match:
+            if body and "".join(body).strip():
+                sections.append((heading, "\n".join(body).strip()))
+            heading, body = match.group(1).strip("* "), []
+        else:
+            body.append(line)
+    if body and "".join(body).strip():
+        sections.append((heading, "\n".join(body).strip()))
+    return sections
+
+def rank_sections(sections: list, limit: int = MAX_SECTION_VISUALS) -> list:
+    """Indexes of the sections best suited to a diagram, in blog order.
+
+    Sections are scored by length, boosted by words that describe steps,
+    layers or comparisons.
+    """
+    scores = []
+    for index, (heading, body) in enumerate(sections):
+        words = len(body.split())
+        if words < MIN_SECTION_WORDS:
+            continue
+        cues = len(_DIAGRAM_CUES.findall(f"{heading} {body}"))
+        scores.append((words * (1 + cues / 10), index))
+    return sorted(index for _, index in sorted(scores, reverse=True)[:limit])
+
+def _clean_diagram(diagram) -> dict:
+    if not isinstance(diagram, dict) or not isinstance(diagram.get("mermaid_code"), str):
+        return None
+    return {**diagram, "mermaid_code": strip_fences(diagram["mermaid_code"])}
+
+def _validated(client, diagram: dict) -> dict:
+    """Return the diagram once it passes validation, repairing only if it does not; None if it never does."""
+    for attempt in range(MAX_REPAIR_ATTEMPTS + 1):
+        errors = validate_mermaid(diagram["mermaid_code"])
+        if not errors:
+            return diagram
+        if attempt == MAX_REPAIR_ATTEMPTS:
+            break
         try:
-            visuals_data = json.loads(visuals_str)
-            if isinstance(visuals_data, dict) and "diagrams" in visuals_data:
-                return visuals_data["diagrams"]
-            elif isinstance(visuals_data, list):
-                return visuals_data
-            else:
-                st.warning("Unexpected visuals format. Using empty list.")
-                return []
-        except json.JSONDecodeError:
-            st.error("Invalid JSON response from visuals agent")
-            return []
+            content = complete_with_route(client, "visuals", _repair_request(diagram, errors), _visuals_check)
+            repaired = [_clean_diagram(d) for d in _load_diagrams(content)]
+        except Exception:
+            break
+        repaired = [d for d in repaired if d is not None]
+        if not repaired:
+            break
+        diagram = {**diagram, **repaired[0]}
+    return None
+
+def validate_diagrams(client, diagrams: list) -> list:
+    """Keep the diagrams whose Mermaid code is valid, repairing the invalid ones."""
+    cleaned = [d for d in (_clean_diagram(diagram) for diagram in diagrams) if d is not None]
+    return [d for d in (_validated(client, diagram) for diagram in cleaned) if d is not None]
+
+def _section_visual(client, heading: str, body: str):
+    try:
+        content = complete_with_route(client, "visuals", _section_request(heading, body), _visuals_check)
+        diagrams = [d for d in (_clean_diagram(d) for d in _load_diagrams(content))
+                    if d is not None]
+    except Exception as e:
+        record_notice(f"No diagram for section \"{heading}\": {str(e)}")
+        return None
+    if not diagrams:
+        return None
+    diagram = _validated(client, diagrams[0])
+    if diagram is not None and heading:
+        diagram["section"] = heading
+    return diagram
+
+def generate_section_visuals(client, blog_text: str, max_concurrency: int = MAX_SECTION_VISUALS) -> list:
+    """One validated diagram for each top-ranked section, generated concurrently.
+
+    A section whose request or diagram fails is left out; the others are kept.
+    """
+    sections = split_sections(blog_text)
+    chosen = [sections[index] for index in rank_sections(sections)]
+    visuals = map_ordered(
+        lambda index, section: _section_visual(client, *section),
+        chosen,
+        max_workers=max_concurrency
+    )
+    return [visual for visual in visuals if visual is not None]
+
+def visualize_section_stream(stream, max_concurrency: int = MAX_SECTION_VISUALS) -> list:
+    """Pipelined "sections" mode fed by a utils.pipeline.SectionStream.
+
+    A diagram request starts for each section long enough to draw as soon as
+    its blog chunk arrives, up to MAX_SECTION_VISUALS, while later chunks are
+    still being written. Sections are taken in arrival order because the rest
+    of the blog is not known yet. Once the stream closes the diagrams are
+    returned in blog order; if no section qualified, the finished blog gets a
+    single whole-blog request instead.
+    """
+    client = OpenAIClient.get_client()
+    executor = thread_pool(max_concurrency)
+    futures = []
+    try:
+        for chunk_index, text in stream:
+            for position, (heading, body) in enumerate(split_sections(text)):
+                if len(futures) == MAX_SECTION_VISUALS:
+                    break
+                if len(body.split()) < MIN_SECTION_WORDS:
+                    continue
+                future = executor.submit(contextvars.copy_context().run, _section_visual, client, heading, body)
+                futures.append(((chunk_index, position), future))
+        visuals = [future.result() for _, future in sorted(futures, key=lambda item: item[0])]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if not futures:
+        return generate_visuals("\n\n".join(stream.sections()), mode="whole")
+    return [visual for visual in visuals if visual is not None]
+
+def generate_visuals(blog_text: str, mode: str = "sections") -> list:
+    """Mermaid diagrams for the blog; invalid diagrams are repaired or dropped one by one.
+
+    In "sections" mode the top-ranked sections each get their own request,
+    all running at once, so the stage takes about as long as one section.
+    Blogs without enough sections fall back to a single whole-blog request.
+    Failures leave diagrams out and are recorded with
+    utils.metrics.record_notice.
+    """
+    if mode not in VISUALS_MODES:
+        raise ValueError(f"Unknown visuals mode '{mode}', expected one of {', '.join(VISUALS_MODES)}")
+    client = OpenAIClient.get_client()
+    try:
+        if mode == "sections" and rank_sections(split_sections(blog_text)):
+            return generate_section_visuals(client, blog_text)
+        content = complete_with_route(client, "visuals", _visuals_request(blog_text), _visuals_check)
+        return validate_diagrams(client, _parse_visuals_response(content))
+    except Exception as e:
+        record_notice(f"Generating visuals failed: {str(e)}")
+        return []
+
+def stream_visuals(blog_text: str, mode: str = "sections"):
+    """Streaming variant of generate_visuals.
+
+    Yields the raw JSON deltas and returns the same list as generate_visuals
+    once the stream is exhausted. Section requests run concurrently and are
+    not streamed.
+    """
+    if mode == "sections" and rank_sections(split_sections(blog_text)):
+        return generate_visuals(blog_text, mode)
+    client = OpenAIClient.get_client()
+    try:
+        content = yield from stream_with_route(client, "visuals", _visuals_request(blog_text), _visuals_check)
+        return validate_diagrams(client, _parse_visuals_response(content))
     except Exception as e:
-        st.error(f"Error generating visuals: {str(e)}")
-        return [] 
\ No newline at end of file
+        record_notice(f"Generating visuals failed: {str(e)}")
+        return []
@@ -0,0 +1,356 @@
+"""Headless batch runner for the newsletter → blog pipeline.
+
+Usage:
+    python batch.py newsletters/ --output out/ --workers 4
+    python batch.py newsletters.jsonl --output out/ --executor process
+
+Inputs are either a directory of .md/.txt files or a JSONL file whose lines
+carry an "id" and the newsletter under "newsletter", "content" or "text".
+Each input gets its own output bundle; bundles that already exist are
+skipped, so an interrupted run can simply be started again. Every finished
+item is also kept in the run store (utils.run_store), where the UI's past
+run search finds it.
+With --near-duplicates, newsletters nearly identical to an earlier run
+reuse that run's results or extracted context instead of a full run.
+--incremental keeps the blog sections of chunks unchanged since an earlier
+run and --chunk-context extracts the context chunk by chunk, so that those
+chunks are recognised after the newsletter was edited.
+--deadline stops a newsletter that takes longer than that many seconds and
+--hedge resends slow requests (see utils.model_router).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from utils.openai_client import OpenAIClient
+from utils.concurrency import thread_pool
+from utils.pipeline import SectionStream, Stage, StageFailed, run_stages
+from utils.response_cache import bypass_cache
+from utils.usage import track_usage
+from utils.metrics import start_metrics_server, trace_run
+from utils.streaming import StreamCollector
+from utils.run_store import get_run_store, result_files, write_files_atomically
+from utils.newsletter_index import NEAR_DUPLICATE_THRESHOLD, get_newsletter_index, newsletter_digest
+from utils.deadlines import Cancelled, cancel_scope
+from utils.model_router import get_route, hedged_requests
+from agents.context_extractor import extract_context, extract_context_parts
+from agents.blog_generator import generate_blog, stream_blog
+from agents.seo_optimizer import generate_seo_metadata, index_post
+from agents.visualization_generator import generate_visuals, visualize_section_stream
+
+NEWSLETTER_FIELDS = ("newsletter", "content", "text")
+INPUT_SUFFIXES = (".md", ".txt")
+
+
+def load_newsletters(source: str) -> list:
+    """Return (item_id, newsletter) pairs from a directory or a JSONL file."""
+    items = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            stem, suffix = os.path.splitext(name)
+            if suffix.lower() in INPUT_SUFFIXES:
+                with open(os.path.join(source, name), encoding="utf-8") as f:
+                    items.append((stem, f.read()))
+        return items
+
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = next((record[field] for field in NEWSLETTER_FIELDS if record.get(field)), None)
+            if text is None:
+                raise ValueError(f"{source}:{line_number} has no {'/'.join(NEWSLETTER_FIELDS)} field")
+            items.append((str(record.get("id", line_number)), text))
+    return items
+
+
+def safe_name(item_id: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in item_id) or "item"
+
+
+def bundle_dir(output_dir: str, item_id: str) -> str:
+    return os.path.join(output_dir, safe_name(item_id))
+
+
+def run_pipeline(newsletter: str, blog_concurrency: int = 1, parallel_stages: bool = True,
+                 incremental: bool = False, seo_mode: str = "edits", pipelined: bool = False,
+                 check_quality: bool = False, context: str = None, deadline: float = None, hedge: bool = False,
+                 chunk_context: bool = False, context_parts: list = None,
+                 on_stage_start=None, on_stage_done=None, on_blog_delta=None) -> dict:
+    """Run extract → blog → SEO and visuals for one newsletter.
+
+    With parallel_stages=False the stages run one after another and the
+    visuals are drawn from the SEO-enhanced blog. With pipelined=True (only
+    together with parallel stages) the visuals stage starts alongside the
+    blog and draws each section as soon as its chunk is written. With
+    check_quality=True blog sections that fail the local quality checks are
+    rewritten before the blog stage finishes. A context extracted by an
+    earlier run of a near-identical newsletter can be passed as context to
+    skip the extraction. With incremental=True blog sections of chunks that
+    are unchanged since an earlier incremental run are kept. The context is
+    extracted from the whole newsletter unless chunk_context=True, which
+    extracts it chunk by chunk instead: every blog section is then written
+    from one newsletter chunk alone, but after an edit only the chunks it
+    touched are extracted and written again. The results then carry the
+    (newsletter chunk, context) pairs under "context_parts"; passing those of
+    an earlier run as context_parts reuses them for the chunks that are
+    unchanged, whatever chunk_context is, and takes precedence over context.
+    Each stage stops at the timeout of its model route
+    and the whole run after deadline seconds; with hedge=True slow requests
+    are hedged. When on_blog_delta is given the blog is streamed and every
+    text delta is passed to it.
+    """
+    pipelined = pipelined and parallel_stages
+    sections = SectionStream()
+    known_parts = context_parts
+    context_parts = []
+
+    def require(value, message):
+        if not value:
+            raise StageFailed(message)
+        return value
+
+    def run_context(results):
+        if context and not known_parts:
+            return context
+        if not chunk_context and not known_parts:
+            return require(extract_context(newsletter), "Failed to extract context from newsletter")
+        context_parts.extend(require(extract_context_parts(newsletter, known=known_parts),
+                                     "Failed to extract context from newsletter"))
+        return "\n\n".join(part for _, part in context_parts)
+
+    def run_blog(results):
+        # Consumers of the section stream stop as soon as the blog fails
+        try:
+            blog = require(write_blog(results, sections.put if pipelined else None), "Failed to generate blog content")
+        except BaseException as e:
+            sections.fail(e)
+            raise
+        sections.close()
+        return blog
+
+    def write_blog(results, on_section):
+        if on_blog_delta is None:
+            return generate_blog(results["context"], max_concurrency=blog_concurrency, incremental=incremental,
+                                 on_section=on_section, check_quality=check_quality,
+                                 context_parts=context_parts or None)
+        collector = StreamCollector(
+            stream_blog(results["context"], max_concurrency=blog_concurrency, incremental=incremental,
+                        on_section=on_section, check_quality=check_quality, context_parts=context_parts or None)
+        )
+        for delta in collector:
+            on_blog_delta(delta)
+        return collector.value
+
+    def visuals_input(results):
+        if parallel_stages:
+            return results["blog"]
+        return results["seo"].get("seo_enhanced_content", results["blog"])
+
+    def timeout(*names):
+        timeouts = [get_route(name).timeout for name in names]
+        return None if None in timeouts else sum(timeouts)
+
+    stages = [
+        Stage("context", run_context, timeout=timeout("context")),
+        Stage("blog", run_blog, depends_on=["context"], timeout=timeout("blog")),
+        Stage("seo", lambda r: generate_seo_metadata(r["blog"], mode=seo_mode), depends_on=["blog"],
+              timeout=timeout("seo")),
+    ]
+    if pipelined:
+        # Starts together with the blog and waits for its sections, so it gets the blog's time as well
+        stages.append(Stage("visuals", lambda r: visualize_section_stream(sections), depends_on=["context"],
+                            timeout=timeout("blog", "visuals")))
+    else:
+        stages.append(Stage("visuals", lambda r: generate_visuals(visuals_input(r)),
+                            depends_on=["blog"] if parallel_stages else ["blog", "seo"], timeout=timeout("visuals")))
+    with cancel_scope(deadline), hedged_requests(hedge):
+        results = run_stages(stages, concurrent=parallel_stages,
+                             on_stage_start=on_stage_start, on_stage_done=on_stage_done)
+    if context_parts:
+        results["context_parts"] = context_parts
+    return results
+
+
+def write_bundle(output_dir: str, item_id: str, results: dict, meta: dict, trace: dict):
+    """Write one bundle into a temporary directory and move it into place in one step."""
+    write_files_atomically(bundle_dir(output_dir, item_id), {
+        **result_files(results),
+        "meta.json": json.dumps(meta, indent=2),
+        "trace.json": json.dumps(trace, indent=2),
+    })
+
+
+def process_item(item_id: str, newsletter: str, output_dir: str, blog_concurrency: int, use_cache: bool,
+                 near_duplicates: str = "off", threshold: float = NEAR_DUPLICATE_THRESHOLD,
+                 deadline: float = None, hedge: bool = False, incremental: bool = False,
+                 chunk_context: bool = False) -> dict:
+    """Run and store one newsletter; returns a summary for the progress report.
+
+    With near_duplicates set to "results" or "context" a newsletter nearly
+    identical to an earlier run reuses that run's results or starts from
+    its extracted context; with incremental=True the blog sections of its
+    unchanged chunks are kept as well. incremental and chunk_context are
+    passed to run_pipeline.
+    """
+    started = time.perf_counter()
+    run_id = f"batch-{safe_name(item_id)}-{uuid.uuid4().hex[:8]}"
+    # Everything that touches the disk is inside the try, so a full disk or a
+    # locked index fails this item instead of the whole batch
+    with bypass_cache(not use_cache), track_usage() as usage, trace_run(item_id) as trace:
+        try:
+            index = get_newsletter_index() if near_duplicates != "off" else None
+            match = index.find(newsletter, threshold) if index is not None else None
+            reused = index.get(match["run_id"]) if match is not None else None
+            if reused is not None and near_duplicates == "results":
+                results = reused["results"]
+            else:
+                results = run_pipeline(newsletter, blog_concurrency, incremental=incremental,
+                                       context=reused["context"] if reused is not None else None,
+                                       context_parts=reused["results"].get("context_parts") if reused is not None
+                                       else None,
+                                       deadline=deadline, hedge=hedge, chunk_context=chunk_context)
+
+            meta = {
+                "id": item_id,
+                "run_id": run_id,
+                "status": "done",
+                "seconds": round(time.perf_counter() - started, 3),
+                "usage": usage.as_dict(),
+                "stages": trace.stage_summary(),
+                "notices": [f"{stage}: {message}" for stage, message in trace.notices()],
+            }
+            if reused is not None:
+                meta["near_duplicate_of"] = {"run_id": match["run_id"], "label": match["label"],
+                                             "similarity": round(match["similarity"], 3), "reused": near_duplicates}
+            if index is not None and not (reused is not None and near_duplicates == "results"):
+                index.add(newsletter, results["context"], results, label=item_id)
+            index_post(results, newsletter_digest(newsletter))
+            get_run_store().save(run_id, results)
+            # Written last: an existing bundle marks the item as done for later runs
+            write_bundle(output_dir, item_id, results, meta, trace.as_dict())
+        except (Exception, Cancelled) as e:
+            return {"id": item_id, "status": "failed", "error": str(e),
+                    "seconds": time.perf_counter() - started, "usage": usage.as_dict(),
+                    "stages": trace.stage_summary()}
+    return meta
+
+
+def _init_worker(api_key: str):
+    OpenAIClient.initialize(api_key)
+
+
+def run_batch(items: list, output_dir: str, api_key: str, workers: int = 4, executor_kind: str = "thread",
+              blog_concurrency: int = 1, use_cache: bool = True, near_duplicates: str = "off",
+              threshold: float = NEAR_DUPLICATE_THRESHOLD, deadline: float = None, hedge: bool = False,
+              incremental: bool = False, chunk_context: bool = False) -> dict:
+    os.makedirs(output_dir, exist_ok=True)
+    pending = [(item_id, text) for item_id, text in items
+               if not os.path.isdir(bundle_dir(output_dir, item_id))]
+    skipped = len(items) - len(pending)
+    print(f"{len(items)} newsletters, {skipped} already done, {len(pending)} to process", file=sys.stderr)
+
+    if executor_kind == "process":
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(api_key,))
+    else:
+        OpenAIClient.initialize(api_key)
+        executor = thread_pool(workers)
+
+    started = time.perf_counter()
+    done, failed, tokens = 0, [], 0
+    with executor:
+        futures = [
+            executor.submit(process_item, item_id, text, output_dir, blog_concurrency, use_cache,
+                            near_duplicates, threshold, deadline, hedge, incremental, chunk_context)
+            for item_id, text in pending
+        ]
+        for future in as_completed(futures):
+            summary = future.result()
+            tokens += summary["usage"]["total_tokens"]
+            if summary["status"] == "done":
+                done += 1
+            else:
+                failed.append({"id": summary["id"], "error": summary["error"]})
+            print(f"[{done + len(failed)}/{len(pending)}] {summary['id']}: {summary['status']} "
+                  f"in {summary['seconds']:.1f}s", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    minutes = elapsed / 60 if elapsed else 0
+    report = {
+        "total": len(items),
+        "skipped": skipped,
+        "done": done,
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 2),
+        "items_per_minute": round(done / minutes, 2) if minutes else 0.0,
+        "tokens": tokens,
+        "tokens_per_minute": round(tokens / minutes, 1) if minutes else 0.0,
+    }
+    with open(os.path.join(output_dir, "batch_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Transform many newsletters into blog bundles without the UI.")
+    parser.add_argument("source", help="directory of .md/.txt newsletters or a JSONL file")
+    parser.add_argument("--output", default="batch_output", help="directory for the output bundles")
+    parser.add_argument("--workers", type=int, default=4, help="newsletters processed at the same time")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--blog-concurrency", type=int, default=1, help="parallel chunks inside each blog")
+    parser.add_argument("--no-cache", action="store_true", help="ignore the local response cache")
+    parser.add_argument("--near-duplicates", choices=("off", "results", "context"), default="off",
+                        help="reuse the results or the extracted context of earlier runs of nearly identical "
+                             "newsletters")
+    parser.add_argument("--similarity", type=float, default=NEAR_DUPLICATE_THRESHOLD,
+                        help="similarity from 0 to 1 above which a newsletter counts as a near duplicate")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep the blog sections of chunks that are unchanged since an earlier incremental run")
+    parser.add_argument("--chunk-context", action="store_true",
+                        help="extract the context chunk by chunk instead of from the whole newsletter, so that "
+                             "--incremental recognises unchanged chunks of an edited newsletter")
+    parser.add_argument("--deadline", type=float, help="seconds after which a newsletter's run is stopped")
+    parser.add_argument("--hedge", action="store_true",
+                        help="resend requests that are slower than their route's hedge_after and use the first answer")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port while running")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"),
+                        help="defaults to the OPENAI_API_KEY environment variable")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("an OpenAI API key is required (--api-key or OPENAI_API_KEY)")
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    report = run_batch(
+        load_newsletters(args.source),
+        args.output,
+        args.api_key,
+        workers=args.workers,
+        executor_kind=args.executor,
+        blog_concurrency=args.blog_concurrency,
+        use_cache=not args.no_cache,
+        near_duplicates=args.near_duplicates,
+        threshold=args.similarity,
+        deadline=args.deadline,
+        hedge=args.hedge,
+        incremental=args.incremental,
+        chunk_context=args.chunk_context,
+    )
+    print(f"Processed {report['done']} newsletters ({len(report['failed'])} failed, {report['skipped']} skipped) "
+          f"in {report['elapsed_seconds']:.0f}s: {report['items_per_minute']} items/min, "
+          f"{report['tokens_per_minute']} tokens/min")
+    return 0 if not report["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
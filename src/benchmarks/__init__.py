@@ -0,0 +1 @@
+# Empty file to mark directory as Python package 
\ No newline at end of file
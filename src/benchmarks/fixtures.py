@@ -0,0 +1,49 @@
+"""Deterministic newsletters of increasing size for the benchmark suite."""
+import random
+
+# (sections, paragraphs per section, sentences per paragraph)
+SIZES = {
+    "small": (2, 2, 4),
+    "medium": (6, 3, 6),
+    "huge": (30, 4, 8),
+}
+
+_TOPICS = [
+    "data pipelines", "vector databases", "model evaluation", "prompt design", "agent orchestration",
+    "observability", "cost control", "retrieval quality", "fine-tuning", "deployment",
+    "latency budgets", "security reviews", "user research", "pricing", "team workflows",
+]
+_VERBS = ["improves", "changes", "simplifies", "complicates", "accelerates", "reshapes", "supports", "limits"]
+_OBJECTS = [
+    "the way teams ship features", "our onboarding flow", "weekly reporting", "the support backlog",
+    "how we plan quarters", "the architecture of new services", "our hiring plans", "customer retention",
+]
+_DETAILS = [
+    "according to the numbers we shared last month",
+    "which surprised several of our readers",
+    "as two of our partners explained in detail",
+    "once the initial migration was complete",
+    "even though the tooling is still young",
+    "and the trend is likely to continue next year",
+]
+
+
+def make_newsletter(size: str, seed: int = 7) -> str:
+    sections, paragraphs, sentences = SIZES[size]
+    rng = random.Random(f"{size}-{seed}")
+    lines = [f"# Weekly Briefing: {rng.choice(_TOPICS).title()}", ""]
+    for section in range(sections):
+        topic = rng.choice(_TOPICS)
+        lines += [f"## {section + 1}. Notes on {topic}", ""]
+        for _ in range(paragraphs):
+            paragraph = " ".join(
+                f"{rng.choice(_TOPICS).capitalize()} {rng.choice(_VERBS)} {rng.choice(_OBJECTS)}, "
+                f"{rng.choice(_DETAILS)}."
+                for _ in range(sentences)
+            )
+            lines += [paragraph, ""]
+    return "\n".join(lines).strip()
+
+
+def newsletters() -> dict:
+    return {size: make_newsletter(size) for size in SIZES}
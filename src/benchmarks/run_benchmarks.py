@@ -0,0 +1,150 @@
+"""Offline benchmark suite for the newsletter → blog pipeline.
+
+Record the fixtures once against the live API:
+    python -m benchmarks.run_benchmarks --record --api-key sk-...
+
+Then replay them as often as needed, without network access:
+    python -m benchmarks.run_benchmarks --latency-scale 0 --output bench.json
+
+latency-scale 0 measures only local overhead; 1 replays the recorded API
+latency so concurrency changes show up in the end-to-end numbers.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from utils.openai_client import OpenAIClient
+from utils.cassette import Cassette
+from utils.markdown_assembler import assemble
+from agents.context_extractor import extract_context
+from agents.blog_generator import chunk_newsletter, generate_blog
+from agents.seo_optimizer import generate_seo_metadata
+from agents.visualization_generator import generate_visuals
+from benchmarks.fixtures import SIZES, newsletters
+from batch import run_pipeline
+
+CASSETTE_DIR = os.path.join(os.path.dirname(__file__), "cassettes")
+
+
+def measure(func, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {
+        "runs": repeat,
+        "min_s": round(min(timings), 6),
+        "median_s": round(statistics.median(timings), 6),
+        "mean_s": round(statistics.mean(timings), 6),
+        "max_s": round(max(timings), 6),
+    }
+
+
+@contextmanager
+def scratch_directory():
+    """Run inside a temporary directory so agents that write files leave the tree alone."""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(previous)
+
+
+def record(api_key: str, cassette_dir: str, blog_concurrency: int):
+    OpenAIClient.initialize(api_key)
+    cassette = Cassette(cassette_dir, mode="record", upstream=OpenAIClient.lease)
+    OpenAIClient.use_cassette(cassette)
+    with scratch_directory():
+        for size, newsletter in newsletters().items():
+            started = time.perf_counter()
+            run_pipeline(newsletter, blog_concurrency)
+            print(f"recorded {size} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+def run(cassette_dir: str, latency_scale: float, repeat: int, blog_concurrency: int) -> dict:
+    cassette = Cassette(cassette_dir, mode="replay", latency_scale=latency_scale)
+    OpenAIClient.use_cassette(cassette)
+    results = []
+    skipped = []
+
+    def add(name, size, func, runs=repeat, **extra):
+        results.append({"benchmark": name, "size": size, **extra, **measure(func, runs)})
+
+    with scratch_directory():
+        for size, newsletter in newsletters().items():
+            chunks = chunk_newsletter(newsletter)
+            add("chunk_newsletter", size, lambda: chunk_newsletter(newsletter), runs=max(repeat, 20),
+                chars=len(newsletter), chunks=len(chunks))
+            add("assemble_blog", size, lambda: assemble(chunks), runs=max(repeat, 20))
+
+            # One untimed pass gathers the intermediate outputs each agent needs as input
+            misses = cassette.misses
+            context = extract_context(newsletter)
+            blog = generate_blog(context, max_concurrency=blog_concurrency) if context else ""
+            if blog:
+                generate_seo_metadata(blog)
+                generate_visuals(blog)
+            if cassette.misses > misses or not blog:
+                skipped.append({"size": size, "reason": "no complete recording in the cassette"})
+                continue
+
+            add("extract_context", size, lambda: extract_context(newsletter))
+            add("generate_blog", size, lambda: generate_blog(context, max_concurrency=blog_concurrency),
+                chunks=len(chunk_newsletter(context)), blog_concurrency=blog_concurrency)
+            add("generate_seo_metadata", size, lambda: generate_seo_metadata(blog))
+            add("generate_visuals", size, lambda: generate_visuals(blog))
+            add("pipeline", size, lambda: run_pipeline(newsletter, blog_concurrency),
+                blog_concurrency=blog_concurrency)
+
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency_scale": latency_scale,
+        "repeat": repeat,
+        "sizes": {size: dict(zip(("sections", "paragraphs", "sentences"), shape)) for size, shape in SIZES.items()},
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against recorded API responses.")
+    parser.add_argument("--record", action="store_true", help="call the live API and record the fixtures")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    parser.add_argument("--cassettes", default=CASSETTE_DIR, help="directory of recorded responses")
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="0 replays instantly, 1 reproduces the recorded latency")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--blog-concurrency", type=int, default=4)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        if not args.api_key:
+            parser.error("recording needs an OpenAI API key (--api-key or OPENAI_API_KEY)")
+        record(args.api_key, args.cassettes, args.blog_concurrency)
+        return 0
+
+    report = run(args.cassettes, args.latency_scale, args.repeat, args.blog_concurrency)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
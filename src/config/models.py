@@ -0,0 +1,77 @@
+import json
+import os
+
+# Models tried in order for each stage. A later model is only called when the
+# answer of the one before fails the stage's quality checks, so put the fast,
+# cheap models first. min_words rejects answers that are too short to be
+# useful; a truncated answer (finish_reason "length") always escalates.
+# timeout is the deadline of the whole stage in seconds. With hedged requests
+# switched on, a call still unanswered after hedge_after seconds is sent
+# again; set it near the usual slowest answers of the stage, or 0 to never
+# hedge (blog chunks take minutes, so a second copy would mostly be waste).
+DEFAULT_ROUTES = {
+    "context": {"models": ["gpt-4o-mini", "chatgpt-4o-latest"], "min_words": 50, "timeout": 300, "hedge_after": 45},
+    "blog": {"models": ["gpt-4"], "min_words": 150, "timeout": 1800, "hedge_after": 0},
+    "seo": {"models": ["gpt-4o-mini", "chatgpt-4o-latest"], "min_words": 0, "timeout": 600, "hedge_after": 60},
+    "visuals": {"models": ["gpt-4o-mini", "chatgpt-4o-latest"], "min_words": 0, "timeout": 300, "hedge_after": 30},
+}
+
+# A JSON file with the same shape as DEFAULT_ROUTES; stages it lists replace the defaults
+MODEL_ROUTES_PATH = os.environ.get("MODEL_ROUTES_PATH", os.path.join(os.path.dirname(__file__), "model_routes.json"))
+
+
+def load_routes() -> dict:
+    """DEFAULT_ROUTES overridden by MODEL_ROUTES_PATH and then by the MODEL_ROUTES environment variable (JSON)."""
+    routes = {stage: dict(route) for stage, route in DEFAULT_ROUTES.items()}
+    overrides = []
+    if os.path.exists(MODEL_ROUTES_PATH):
+        with open(MODEL_ROUTES_PATH, encoding="utf-8") as f:
+            overrides.append(json.load(f))
+    if os.environ.get("MODEL_ROUTES"):
+        overrides.append(json.loads(os.environ["MODEL_ROUTES"]))
+    for override in overrides:
+        for stage, route in override.items():
+            if isinstance(route, list):
+                route = {"models": route}
+            routes[stage] = {**routes.get(stage, {"min_words": 0}), **route}
+    for stage, route in routes.items():
+        if not route.get("models"):
+            raise ValueError(f"Model route for stage '{stage}' lists no models")
+    return routes
+
+
+# Requests and tokens per minute allowed for each model. Defaults follow the
+# lower usage tiers; override them to match the account's actual limits.
+# Models without an entry get FALLBACK_RATE_LIMIT.
+DEFAULT_RATE_LIMITS = {
+    "gpt-4": {"rpm": 500, "tpm": 10000},
+    "gpt-4o": {"rpm": 500, "tpm": 30000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    "chatgpt-4o-latest": {"rpm": 200, "tpm": 30000},
+}
+FALLBACK_RATE_LIMIT = {"rpm": 200, "tpm": 30000}
+
+# A JSON file with the same shape as DEFAULT_RATE_LIMITS; models it lists replace the defaults
+RATE_LIMITS_PATH = os.environ.get("RATE_LIMITS_PATH", os.path.join(os.path.dirname(__file__), "rate_limits.json"))
+
+
+def load_rate_limits() -> dict:
+    """DEFAULT_RATE_LIMITS overridden by RATE_LIMITS_PATH and then by the RATE_LIMITS environment variable (JSON).
+
+    An override may give only rpm or only tpm; the other keeps its default.
+    """
+    limits = {model: dict(limit) for model, limit in DEFAULT_RATE_LIMITS.items()}
+    overrides = []
+    if os.path.exists(RATE_LIMITS_PATH):
+        with open(RATE_LIMITS_PATH, encoding="utf-8") as f:
+            overrides.append(json.load(f))
+    if os.environ.get("RATE_LIMITS"):
+        overrides.append(json.loads(os.environ["RATE_LIMITS"]))
+    for override in overrides:
+        for model, limit in override.items():
+            limits[model] = {**limits.get(model, FALLBACK_RATE_LIMIT), **limit}
+    for model, limit in limits.items():
+        for name in ("rpm", "tpm"):
+            if not isinstance(limit.get(name), (int, float)) or limit[name] <= 0:
+                raise ValueError(f"Rate limit '{name}' of model '{model}' must be a positive number")
+    return limits
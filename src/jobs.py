@@ -0,0 +1,315 @@
+"""Background jobs for pipeline runs.
+
+A job is submitted with the newsletter and the run options and gets an id
+straight away. Worker threads (or processes) run the pipeline and write the
+progress, a live preview of the blog and finally the results into a local
+SQLite store, so any client that knows the id can poll the job. This keeps
+a run alive across Streamlit reruns and closed browser tabs, unless the job
+was submitted with abandon_after: then it is cancelled once no client has
+watched it for that many seconds. A job can also be cancelled outright.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils.openai_client import OpenAIClient
+from utils.response_cache import bypass_cache
+from utils.rate_limiter import scheduler_session
+from utils.streaming import track_time_to_first_token
+from utils.metrics import RunTrace, trace_run
+from utils.newsletter_index import get_newsletter_index, newsletter_digest
+from utils.run_store import get_run_store
+from utils.deadlines import Cancelled, cancel_scope
+from batch import run_pipeline
+from agents.seo_optimizer import index_post
+
+JOBS_PATH = os.environ.get("JOBS_PATH", os.path.join(".cache", "jobs.sqlite3"))
+DEFAULT_MAX_JOBS = 200
+# Seconds between writes of the streamed blog preview to the store
+PREVIEW_INTERVAL = 0.5
+
+ACTIVE_STATUSES = ("queued", "running")
+JSON_FIELDS = ("options", "stages", "results", "trace", "time_to_first_token")
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class JobStore:
+    """Jobs and their results in a SQLite file shared by the UI and the workers.
+
+    Only the newest max_jobs finished jobs are kept. Each process opens its
+    own connection; WAL mode lets the workers write while clients read.
+    """
+
+    def __init__(self, path: str = JOBS_PATH, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.path = path
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " newsletter TEXT NOT NULL,"
+            " options TEXT NOT NULL,"
+            " stages TEXT,"
+            " preview TEXT,"
+            " results TEXT,"
+            " trace TEXT,"
+            " time_to_first_token TEXT,"
+            " error TEXT,"
+            " cancel_reason TEXT,"
+            " last_seen REAL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        # Stores created before jobs could be cancelled
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("cancel_reason", "TEXT"), ("last_seen", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+        self._conn.commit()
+
+    def create(self, newsletter: str, options: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, newsletter, options, stages, last_seen, created_at, updated_at)"
+                " VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, newsletter, json.dumps(options), json.dumps({"running": [], "done": []}), now, now, now)
+            )
+            self._prune()
+            self._conn.commit()
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        columns = []
+        values = []
+        for name, value in fields.items():
+            columns.append(f"{name} = ?")
+            values.append(json.dumps(value) if name in JSON_FIELDS and value is not None else value)
+        columns.append("updated_at = ?")
+        values += [time.time(), job_id]
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {', '.join(columns)} WHERE id = ?", values)
+            self._conn.commit()
+
+    def get(self, job_id: str):
+        """Return the job as a dict, or None if there is no such job."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            names = [column[0] for column in cursor.description]
+        if row is None:
+            return None
+        job = dict(zip(names, row))
+        for name in JSON_FIELDS:
+            if job[name] is not None:
+                job[name] = json.loads(job[name])
+        return job
+
+    def recent(self, limit: int = 20) -> list:
+        """Id, status and timestamps of the newest jobs, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, status, created_at, updated_at FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(("id", "status", "created_at", "updated_at"), row)) for row in rows]
+
+    def touch(self, job_id: str):
+        """Record that a client is still watching the job."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET last_seen = ? WHERE id = ?", (time.time(), job_id))
+            self._conn.commit()
+
+    def request_cancel(self, job_id: str, reason: str):
+        """Ask the worker running the job to stop; it notices within a fraction of a second.
+
+        A job still waiting for a worker is cancelled right away and skipped once a worker takes it.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET cancel_reason = COALESCE(cancel_reason, ?),"
+                " error = CASE WHEN status = 'queued' THEN ? ELSE error END,"
+                " status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,"
+                " updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                (reason, reason, time.time(), job_id, *ACTIVE_STATUSES)
+            )
+            self._conn.commit()
+
+    def cancel_reason(self, job_id: str, abandon_after: float = None):
+        """Why the job should stop, or None: a cancel request, or no client for abandon_after seconds."""
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_reason, last_seen FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return "The job no longer exists"
+        reason, last_seen = row
+        if reason is None and abandon_after and last_seen is not None and time.time() - last_seen > abandon_after:
+            reason = f"The run was stopped because nobody has followed it for {abandon_after:g}s"
+        return reason
+
+    def abandon_active(self, reason: str):
+        """Fail the jobs left queued or running by a worker pool that no longer exists."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE status IN (?, ?)",
+                (reason, time.time(), *ACTIVE_STATUSES)
+            )
+            self._conn.commit()
+
+    def _prune(self):
+        self._conn.execute(
+            "DELETE FROM jobs WHERE status NOT IN (?, ?) AND id NOT IN"
+            " (SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+            (*ACTIVE_STATUSES, self.max_jobs)
+        )
+
+
+def run_job(job_id: str, store_path: str, newsletter: str, api_key: str, options: dict):
+    """Run one job to completion, recording its progress in the store.
+
+    A module-level function so that it can also be sent to a process pool.
+    """
+    store = JobStore(store_path)
+    OpenAIClient.initialize(api_key)
+    reason = store.cancel_reason(job_id, options.get("abandon_after"))
+    if reason is not None:
+        store.update(job_id, status="cancelled", error=reason)
+        return
+    store.update(job_id, status="running")
+
+    # A near-identical newsletter was processed before: take its results as
+    # they are, or start from its extracted context
+    reused = get_newsletter_index().get(options["reuse_run"]) if options.get("reuse_run") else None
+    if reused is not None and options.get("reuse") == "results":
+        store.update(job_id, status="done", results=reused["results"], trace=RunTrace(job_id).as_dict(),
+                     time_to_first_token={})
+        return
+
+    running, done = [], []
+    preview = []
+    last_preview = 0.0
+
+    def on_stage_start(stage):
+        running.append(stage.name)
+        store.update(job_id, stages={"running": running, "done": done})
+
+    def on_stage_done(stage, result, results):
+        running.remove(stage.name)
+        done.append(stage.name)
+        store.update(job_id, stages={"running": running, "done": done})
+
+    def on_blog_delta(delta):
+        nonlocal last_preview
+        preview.append(delta)
+        now = time.monotonic()
+        if now - last_preview >= PREVIEW_INTERVAL:
+            store.update(job_id, preview="".join(preview))
+            last_preview = now
+
+    with bypass_cache(not options.get("use_cache", True)), \
+            scheduler_session(options.get("session_id") or job_id), \
+            cancel_scope(poll=lambda: store.cancel_reason(job_id, options.get("abandon_after"))), \
+            track_time_to_first_token() as time_to_first_token, trace_run(job_id) as trace:
+        try:
+            results = run_pipeline(
+                newsletter,
+                blog_concurrency=options.get("blog_concurrency", 1),
+                parallel_stages=options.get("parallel_stages", True),
+                incremental=options.get("incremental", False),
+                seo_mode=options.get("seo_mode", "edits"),
+                pipelined=options.get("pipelined", False),
+                check_quality=options.get("check_quality", False),
+                context=reused["context"] if reused is not None else None,
+                context_parts=reused["results"].get("context_parts") if reused is not None else None,
+                deadline=options.get("deadline"),
+                hedge=options.get("hedge_requests", False),
+                chunk_context=options.get("chunk_context", False),
+                on_stage_start=on_stage_start,
+                on_stage_done=on_stage_done,
+                on_blog_delta=on_blog_delta if options.get("stream_output") else None,
+            )
+        except Cancelled as e:
+            store.update(job_id, status="cancelled", error=str(e), preview=None, trace=trace.as_dict())
+            return
+        except Exception as e:
+            store.update(job_id, status="failed", error=str(e), trace=trace.as_dict())
+            return
+
+    # Archive and index the run before reporting it done, so a client that
+    # sees "done" also finds it in the history and for reuse
+    try:
+        get_run_store().save(job_id, results)
+        get_newsletter_index().add(newsletter, results["context"], results, label=job_id)
+        index_post(results, newsletter_digest(newsletter))
+    except Exception as e:
+        store.update(job_id, status="failed", error=f"Could not save the run: {e}", preview=None,
+                     trace=trace.as_dict())
+        return
+    store.update(job_id, status="done", results=results, preview=None, trace=trace.as_dict(),
+                 time_to_first_token=time_to_first_token)
+
+
+class JobQueue:
+    """Runs submitted jobs on a pool of worker threads or processes."""
+
+    def __init__(self, store: JobStore = None, workers: int = 2, executor_kind: str = "thread"):
+        if executor_kind not in ("thread", "process"):
+            raise ValueError("executor_kind must be 'thread' or 'process'")
+        self.store = store or JobStore()
+        # Jobs still marked active were owned by a pool that has since exited
+        self.store.abandon_active("The job was interrupted because the server restarted")
+        if executor_kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline-job")
+
+    def submit(self, newsletter: str, api_key: str, options: dict = None) -> str:
+        """Queue a pipeline run and return its job id. The API key is never stored."""
+        options = dict(options or {})
+        job_id = self.store.create(newsletter, options)
+        future = self._executor.submit(run_job, job_id, self.store.path, newsletter, api_key, options)
+        future.add_done_callback(lambda f: self._record_crash(job_id, f))
+        return job_id
+
+    def _record_crash(self, job_id: str, future):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error is not None:
+            self.store.update(job_id, status="failed", error=str(error) if error else "The job was cancelled")
+
+    def status(self, job_id: str):
+        return self.store.get(job_id)
+
+    def watch(self, job_id: str):
+        """Keep a job submitted with abandon_after alive; call it whenever its progress is shown."""
+        self.store.touch(job_id)
+
+    def cancel(self, job_id: str, reason: str = "The run was cancelled"):
+        self.store.request_cancel(job_id, reason)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide queue sized by the JOB_WORKERS and JOB_EXECUTOR environment variables."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(
+                workers=int(os.environ.get("JOB_WORKERS", "2")),
+                executor_kind=os.environ.get("JOB_EXECUTOR", "thread"),
+            )
+        return _queue
@@ -1,82 +1,24 @@
 import streamlit as st
 from utils.openai_client import OpenAIClient
-from agents.context_extractor import extract_context
-from agents.blog_generator import generate_blog
-from agents.seo_optimizer import generate_seo_metadata
-from agents.visualization_generator import generate_visuals
-import openai
+from utils.concurrency import current_session_id
+from utils.metrics import cached_token_ratio, start_metrics_server
+import time
 from datetime import datetime
-import textwrap
 import os
+from jobs import ACTIVE_STATUSES, get_job_queue
+from utils.newsletter_index import get_newsletter_index
+from utils.run_store import get_run_store
 
-def chunk_text(text, chunk_size=2000):
-    """Split text into chunks of approximately equal size."""
-    return textwrap.wrap(text, chunk_size, break_long_words=False, break_on_hyphens=False)
-
-def process_chunk(chunk, previous_context="", system_prompt="", is_first_chunk=False):
-    """Process individual chunks while maintaining context."""
-    if is_first_chunk:
-        context_prompt = chunk
-    else:
-        context_prompt = f"Previous content: {previous_context}\n\nContinue the blog post coherently without creating a new introduction. This is a continuation of the previous section. New content to process: {chunk}"
-
-    client = OpenAIClient.get_instance()
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": context_prompt}
-    ]
-    
-    response = client.create_chat_completion(
-        messages=messages,
-        max_tokens=2000,
-        temperature=0.7
-    )
-    
-    return response.choices[0].message['content']
-
-def generate_blog_with_chunking(text, system_prompt):
-    """Generate blog content using chunking approach."""
-    chunks = chunk_text(text)
-    full_content = ""
-    previous_context = ""
-    
-    for i, chunk in enumerate(chunks):
-        chunk_response = process_chunk(
-            chunk, 
-            previous_context, 
-            system_prompt, 
-            is_first_chunk=(i == 0)
-        )
-        
-        # For subsequent chunks, remove any accidental headings that look like introductions
-        if i > 0:
-            lines = chunk_response.split('\n')
-            filtered_lines = []
-            for line in lines:
-                if not (line.lower().startswith('# ') or 
-                       'introduction' in line.lower() or 
-                       'overview' in line.lower()):
-                    filtered_lines.append(line)
-            chunk_response = '\n'.join(filtered_lines)
-        
-        full_content += "\n" + chunk_response
-        previous_context = chunk_response[-500:]
-    
-    # Clean up any double newlines and spaces
-    full_content = '\n'.join(line for line in full_content.split('\n') if line.strip())
-    return full_content.strip()
-
-def save_as_readme(content):
-    """Save the generated blog content as README.md"""
-    # Ensure the content starts with a title
-    if not content.startswith('#'):
-        content = "# " + content
-    
-    # Clean up any multiple consecutive newlines
-    content = '\n'.join(line for line in content.split('\n') if line.strip())
-    
-    with open("README.md", "w", encoding="utf-8") as f:
-        f.write(content)
+STAGE_LABELS = {
+    "context": "Extracting strategic context...",
+    "blog": "Crafting strategic blog content...",
+    "seo": "Optimizing content for search visibility...",
+    "visuals": "Creating strategic visualizations...",
+}
+# Seconds between status checks while a background job is running
+JOB_POLL_INTERVAL = 0.5
+# With "Stop runs I leave", seconds without a status check after which a job is cancelled
+ABANDON_AFTER = 30
 
 def main():
     st.set_page_config(
@@ -87,12 +29,127 @@ def main():
     
     st.sidebar.title("Configuration")
     openai_api_key = st.sidebar.text_input("OpenAI API Key", type="password")
+    blog_concurrency = st.sidebar.slider(
+        "Parallel blog chunks",
+        min_value=1,
+        max_value=8,
+        value=4,
+        help="How many newsletter chunks are written at the same time. Use 1 to write them one after another."
+    )
+    parallel_stages = st.sidebar.checkbox(
+        "Run SEO and visuals in parallel",
+        value=True,
+        help="Start the SEO and visualization agents together once the blog is ready. "
+             "Untick to run every stage strictly one after another."
+    )
+    pipelined = st.sidebar.checkbox(
+        "Draw visuals while the blog is written",
+        value=True,
+        disabled=not parallel_stages,
+        help="Start a diagram for each blog section as soon as it is finished instead of waiting for "
+             "the whole blog. Needs parallel SEO and visuals."
+    )
+    stream_output = st.sidebar.checkbox(
+        "Stream output",
+        value=True,
+        help="Show the blog while it is being written instead of waiting for every chunk."
+    )
+    use_cache = st.sidebar.checkbox(
+        "Reuse cached responses",
+        value=True,
+        help="Answer repeated requests from the local response cache. Untick to force fresh generations."
+    )
+    incremental = st.sidebar.checkbox(
+        "Only rewrite changed chunks",
+        value=True,
+        help="Keep the blog sections of chunks that are unchanged since an earlier run and only send the "
+             "others to the model."
+    )
+    chunk_context = st.sidebar.checkbox(
+        "Extract context chunk by chunk",
+        value=False,
+        disabled=not incremental,
+        help="Extract the context of every newsletter chunk on its own instead of from the whole newsletter, "
+             "so that after an edit only the chunks it touched are extracted and written again. Each blog "
+             "section then only sees the context of its own chunk."
+    )
+    check_quality = st.sidebar.checkbox(
+        "Rewrite weak sections",
+        value=False,
+        help="Check every blog section locally for length, lists or tables, repetition and a missing "
+             "conclusion, and rewrite only the sections that fail (at most a few per blog)."
+    )
+    seo_mode = st.sidebar.radio(
+        "SEO changes",
+        ["edits", "rewrite", "local"],
+        format_func={"edits": "Targeted edits", "rewrite": "Full rewrite", "local": "Metadata only (local)"}.get,
+        help="Targeted edits patch headings, keywords and single paragraphs into the blog, which is much "
+             "faster for long posts. Full rewrite has the SEO agent return the whole blog again. "
+             "Metadata only computes keywords, titles, description and slug locally without a model call."
+    )
+    detect_duplicates = st.sidebar.checkbox(
+        "Check for earlier runs",
+        value=True,
+        help="Before a run, look up newsletters processed earlier that are nearly identical (e.g. re-sent "
+             "with a new date) and offer their results or context instead of a full run."
+    )
+    time_limit = st.sidebar.number_input(
+        "Time limit (minutes)",
+        min_value=0,
+        max_value=120,
+        value=20,
+        help="Stop a run that takes longer than this. Every stage also has its own limit. Use 0 for no run limit."
+    )
+    hedge_requests = st.sidebar.checkbox(
+        "Hedge slow requests",
+        value=False,
+        help="When a context, SEO or visuals request is unusually slow, send it a second time and use whichever "
+             "answer arrives first. Cuts the slowest runs at the price of some duplicate requests."
+    )
+    stop_when_left = st.sidebar.checkbox(
+        "Stop runs I leave",
+        value=True,
+        help="Cancel a run and its outstanding requests once this page has stopped following it, e.g. after the "
+             "tab was closed. Untick to let runs finish in the background and open them later from Recent runs."
+    )
+    show_timings = st.sidebar.checkbox(
+        "Show timing breakdown",
+        value=False,
+        help="After each run, list the wall time, tokens and estimated cost of every stage."
+    )
+
+    if os.environ.get("METRICS_PORT"):
+        # Prometheus-style metrics for every API call and stage of this process
+        start_metrics_server(int(os.environ["METRICS_PORT"]))
     
     if openai_api_key:
         OpenAIClient.initialize(openai_api_key)
     else:
         st.warning("Please enter your OpenAI API key to begin.")
         return
+
+    if OpenAIClient.cache is not None:
+        cache_stats = OpenAIClient.cache.stats()
+        st.sidebar.caption(
+            f"Response cache: {cache_stats['entries']} entries, "
+            f"{cache_stats['hits']} hits / {cache_stats['misses']} misses"
+        )
+
+    # Runs execute in background jobs, so a rerun or a reopened tab can pick them up again
+    job_queue = get_job_queue()
+    recent_jobs = {job["id"]: job for job in job_queue.store.recent()}
+    if recent_jobs:
+        st.sidebar.selectbox(
+            "Recent runs",
+            [None] + list(recent_jobs),
+            format_func=lambda job_id: "—" if job_id is None else (
+                f"{datetime.fromtimestamp(recent_jobs[job_id]['created_at']).strftime('%Y-%m-%d %H:%M:%S')}"
+                f" · {recent_jobs[job_id]['status']}"
+            ),
+            key="recent_job",
+            on_change=lambda: st.session_state.update(job_id=st.session_state["recent_job"]),
+            help="Open the progress or results of an earlier run."
+        )
     
     st.title("Strategic Content Transformer")
     st.markdown("""
@@ -111,79 +168,220 @@ def main():
         if not newsletter_input.strip():
             st.error("Please provide newsletter content to transform.")
             return
-        
-        try:
-            progress = st.progress(0)
-            
-            with st.spinner("Extracting strategic context..."):
-                newsletter_context = extract_context(newsletter_input)
-                progress.progress(25)
-            if not newsletter_context:
-                st.error("Failed to extract context from newsletter")
-                return
-            
-            with st.spinner("Crafting strategic blog content..."):
-                blog_text = generate_blog(newsletter_context)
-                progress.progress(50)
-            if not blog_text:
-                st.error("Failed to generate blog content")
-                return
-            
-            with st.spinner("Optimizing content for search visibility..."):
-                seo_data = generate_seo_metadata(blog_text)
-                progress.progress(75)
-            
-            with st.spinner("Creating strategic visualizations..."):
-                visuals = generate_visuals(seo_data.get("seo_enhanced_content", blog_text))
-                progress.progress(100)
-            
-            st.success("✨ Content Transformation Complete!")
-            
-            blog_tab, seo_tab, visual_tab = st.tabs([
-                "Strategic Blog", "SEO Insights", "Visualizations"
-            ])
-            
-            # with blog_tab:
-            #     st.markdown("### Generated Blog Post")
-            #     formatted_blog = seo_data.get("seo_enhanced_content", blog_text)
-            #     st.markdown(formatted_blog)
-            
-            with seo_tab:
-                st.subheader("Search Optimization Details")
-                seo_display = {k: v for k, v in seo_data.items() if k != "seo_enhanced_content"}
-                st.json(seo_display)
-            
-            with visual_tab:
-                if visuals:
-                    for idx, visual in enumerate(visuals, 1):
-                        if isinstance(visual, dict):
-                            st.subheader(f"Visualization {idx}")
-                            if 'technical_explanation' in visual:
-                                st.markdown("**Purpose & Explanation:**")
-                                st.markdown(visual['technical_explanation'])
-                            if 'mermaid_code' in visual:
-                                st.markdown("**Diagram:**")
-                                st.markdown(f"```mermaid\n{visual['mermaid_code']}\n```")
-                                with st.expander("View Mermaid Code"):
-                                    st.code(visual['mermaid_code'], language='mermaid')
-                            st.markdown("---")
-                else:
-                    st.info("No visualizations were generated for this content")
-            
-            # Save as README.md
-            save_as_readme(blog_text)
-            
-            # Download button
-            st.download_button(
-                label="Download Blog Content",
-                data=blog_text,
-                file_name=f"blog_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
-                mime="text/markdown"
-            )
-        
-        except Exception as e:
-            st.error(f"An error occurred during processing: {str(e)}")
-            st.info("Please try again or contact support if the issue persists.")
+
+        options = {
+            "blog_concurrency": blog_concurrency,
+            "parallel_stages": parallel_stages,
+            "stream_output": stream_output,
+            "use_cache": use_cache,
+            "incremental": incremental,
+            "chunk_context": incremental and chunk_context,
+            "seo_mode": seo_mode,
+            "pipelined": pipelined,
+            "check_quality": check_quality,
+            "deadline": time_limit * 60 or None,
+            "hedge_requests": hedge_requests,
+            "abandon_after": ABANDON_AFTER if stop_when_left else None,
+            "session_id": current_session_id(),
+        }
+        match = get_newsletter_index().find(newsletter_input) if detect_duplicates else None
+        if match is None:
+            st.session_state.pop("near_duplicate", None)
+            st.session_state["job_id"] = job_queue.submit(newsletter_input, openai_api_key, options)
+        else:
+            st.session_state.pop("job_id", None)
+            st.session_state["near_duplicate"] = {"newsletter": newsletter_input, "options": options, "match": match}
+
+    if st.session_state.get("near_duplicate"):
+        choose_near_duplicate(job_queue, openai_api_key, st.session_state["near_duplicate"])
+
+    job_id = st.session_state.get("job_id")
+    if job_id:
+        show_job(job_queue, job_id, show_timings)
+
+    show_past_runs(get_run_store())
+
+def choose_near_duplicate(job_queue, openai_api_key, near_duplicate):
+    """Let the user reuse an earlier run of a near-identical newsletter instead of paying for a new one."""
+    match = near_duplicate["match"]
+    st.info(
+        f"This newsletter is {match['similarity']:.0%} similar to one processed on "
+        f"{datetime.fromtimestamp(match['created_at']).strftime('%Y-%m-%d %H:%M:%S')}."
+    )
+    choices = {
+        "results": "Show earlier results",
+        "context": "Reuse earlier context",
+        None: "Run from scratch",
+    }
+    for column, (reuse, label) in zip(st.columns(len(choices)), choices.items()):
+        if column.button(label, key=f"near_duplicate_{reuse}"):
+            options = dict(near_duplicate["options"])
+            if reuse is not None:
+                options.update(reuse_run=match["run_id"], reuse=reuse)
+            st.session_state.pop("near_duplicate")
+            st.session_state["job_id"] = job_queue.submit(near_duplicate["newsletter"], openai_api_key, options)
+            return
+    st.caption("Reusing the context skips the extraction, except for the chunks that changed when the earlier "
+               "run extracted it chunk by chunk. With \"Only rewrite changed chunks\" the blog sections of "
+               "unchanged chunks are kept as well if the earlier run used that option too.")
+
+def show_job(job_queue, job_id, show_timings):
+    """Follow a background job until it finishes, then show its results."""
+    try:
+        job = job_queue.status(job_id)
+        if job is None:
+            st.warning("This run is no longer available.")
+            return
+
+        if job["status"] in ACTIVE_STATUSES and st.button("Cancel run", key=f"cancel_{job_id}"):
+            job_queue.cancel(job_id)
+
+        progress = st.progress(0)
+        status = st.empty()
+        blog_preview = st.empty()
+        while job["status"] in ACTIVE_STATUSES:
+            job_queue.watch(job_id)
+            stages = job["stages"]
+            progress.progress(int(100 * len(stages["done"]) / len(STAGE_LABELS)))
+            if stages["running"]:
+                status.info(" ".join(STAGE_LABELS[name] for name in stages["running"]))
+            else:
+                status.info("Waiting for a free worker...")
+            if job["preview"]:
+                blog_preview.markdown(job["preview"] + " ▌")
+            time.sleep(JOB_POLL_INTERVAL)
+            job = job_queue.status(job_id)
+        progress.empty()
+        status.empty()
+        blog_preview.empty()
+
+        if job["status"] == "failed":
+            st.error(job["error"])
+            return
+        if job["status"] == "cancelled":
+            st.warning(job["error"])
+            return
+
+        show_results(job, show_timings)
+
+    except Exception as e:
+        st.error(f"An error occurred during processing: {str(e)}")
+        st.info("Please try again or contact support if the issue persists.")
+
+def show_results(job, show_timings):
+    results = job["results"]
+    blog_text = results["blog"]
+    seo_data = results["seo"]
+    visuals = results["visuals"]
+    stage_summary = job["trace"]["stages"]
+    time_to_first_token = job["time_to_first_token"]
+
+    st.success("✨ Content Transformation Complete!")
+    # Problems the run recovered from, e.g. SEO metadata computed locally after the SEO agent failed
+    for stage, message in job["trace"].get("notices", []):
+        st.warning(f"{stage}: {message}")
+    if time_to_first_token:
+        st.caption("Time to first token: " + ", ".join(
+            f"{stage} {seconds:.1f}s" for stage, seconds in time_to_first_token.items()
+        ))
+    prompt_tokens = sum(row["prompt_tokens"] for row in stage_summary)
+    if prompt_tokens:
+        st.caption(f"Prompt cache: {cached_token_ratio(stage_summary):.0%} of {prompt_tokens:,} prompt tokens")
+    for row in stage_summary:
+        if row.get("chunks_total"):
+            st.caption(f"Reused {row['chunks_reused']} of {row['chunks_total']} blog chunks")
+        if row.get("sections_failed"):
+            st.caption(f"{row['sections_failed']} blog section(s) failed the quality checks; "
+                       f"rewrote {row['sections_rewritten']}, {row['sections_fixed']} of them fixed")
+    if show_timings:
+        with st.expander("Timing breakdown", expanded=True):
+            st.table(stage_summary)
+
+    blog_tab, seo_tab, visual_tab = st.tabs([
+        "Strategic Blog", "SEO Insights", "Visualizations"
+    ])
+
+    # with blog_tab:
+    #     st.markdown("### Generated Blog Post")
+    #     formatted_blog = seo_data.get("seo_enhanced_content", blog_text)
+    #     st.markdown(formatted_blog)
+
+    with seo_tab:
+        st.subheader("Search Optimization Details")
+        seo_display = {k: v for k, v in seo_data.items() if k != "seo_enhanced_content"}
+        st.json(seo_display)
+
+    with visual_tab:
+        if visuals:
+            for idx, visual in enumerate(visuals, 1):
+                if isinstance(visual, dict):
+                    st.subheader(f"Visualization {idx}")
+                    if 'section' in visual:
+                        st.caption(f"Section: {visual['section']}")
+                    if 'technical_explanation' in visual:
+                        st.markdown("**Purpose & Explanation:**")
+                        st.markdown(visual['technical_explanation'])
+                    if 'mermaid_code' in visual:
+                        st.markdown("**Diagram:**")
+                        st.markdown(f"```mermaid\n{visual['mermaid_code']}\n```")
+                        with st.expander("View Mermaid Code"):
+                            st.code(visual['mermaid_code'], language='mermaid')
+                    st.markdown("---")
+        else:
+            st.info("No visualizations were generated for this content")
+
+    # Every run is kept in its own directory of the run store, so earlier
+    # results can be downloaded again without regenerating them
+    download_files(get_run_store(), job["id"], blog_text,
+                   f"blog_{datetime.fromtimestamp(job['created_at']).strftime('%Y%m%d_%H%M%S')}")
+
+def download_files(run_store, run_id, blog_text, file_stem):
+    blog_column, archive_column = st.columns(2)
+    blog_column.download_button(
+        label="Download Blog Content",
+        data=blog_text,
+        file_name=f"{file_stem}.md",
+        mime="text/markdown",
+        key=f"download_blog_{run_id}"
+    )
+    archive = run_store.archive(run_id)
+    if archive:
+        archive_column.download_button(
+            label="Download All Files",
+            data=archive,
+            file_name=f"{file_stem}.zip",
+            mime="application/zip",
+            help="Context, blog, SEO metadata and diagrams of this run.",
+            key=f"download_archive_{run_id}"
+        )
+
+def show_past_runs(run_store):
+    """Full-text search over the blogs, titles, keywords and slugs of earlier runs."""
+    with st.expander("Search past runs"):
+        query = st.text_input("Search", placeholder="Words from the blog, a keyword or a slug",
+                              key="past_run_query")
+        runs = run_store.search(query)
+        if not runs:
+            st.caption("No past runs match." if query.strip() else "No runs have been saved yet.")
+            return
+        run_id = st.selectbox(
+            "Runs",
+            [run["id"] for run in runs],
+            format_func={
+                run["id"]: f"{run['title']} · {datetime.fromtimestamp(run['created_at']).strftime('%Y-%m-%d %H:%M')}"
+                for run in runs
+            }.get,
+            key="past_run"
+        )
+        run = next(run for run in runs if run["id"] == run_id)
+        if run["snippet"]:
+            st.markdown(run["snippet"])
+        if run["keywords"]:
+            st.caption(f"Keywords: {run['keywords']}")
+        files = run_store.files(run_id)
+        if files:
+            download_files(run_store, run_id, files.get("blog_seo.md", files["blog.md"]),
+                           run["slug"] or f"blog_{datetime.fromtimestamp(run['created_at']).strftime('%Y%m%d_%H%M%S')}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import chunk_memo, newsletter_index, output_budget, run_store, seo_engine
+
+
+class FakeLLM:
+    """Stands in for the OpenAI client: answers every request with reply(request) and records the requests."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **request):
+        self.requests.append(request)
+        content = self.reply(request)
+        if request.get("stream"):
+            delta = SimpleNamespace(content=content)
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason="stop")], usage=None)])
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    """Point every persistent store the pipeline writes to at fresh files under tmp_path."""
+    monkeypatch.setattr(chunk_memo, "_memo", chunk_memo.ChunkMemo(str(tmp_path / "blog_chunks.sqlite3")))
+    monkeypatch.setattr(output_budget, "_planner",
+                        output_budget.OutputBudgetPlanner(str(tmp_path / "output_budget.sqlite3")))
+    monkeypatch.setattr(newsletter_index, "_index",
+                        newsletter_index.NewsletterIndex(str(tmp_path / "newsletters.sqlite3")))
+    monkeypatch.setattr(run_store, "_store", run_store.RunStore(str(tmp_path / "runs")))
+    monkeypatch.setattr(seo_engine, "_index", seo_engine.DocumentFrequencyIndex(str(tmp_path / "seo_index.sqlite3")))
+    return tmp_path
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Install a FakeLLM built from a reply function as the client every agent uses."""
+    pytest.importorskip("openai")
+    pytest.importorskip("streamlit")
+    from utils.openai_client import OpenAIClient
+
+    def install(reply):
+        llm = FakeLLM(reply)
+        monkeypatch.setattr(OpenAIClient, "client", llm)
+        return llm
+
+    return install
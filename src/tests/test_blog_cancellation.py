@@ -0,0 +1,56 @@
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from utils.deadlines import Cancelled, cancel_scope
+
+pytest.importorskip("openai")
+pytest.importorskip("streamlit")
+
+from agents.blog_generator import generate_chunk  # noqa: E402
+from utils.openai_client import CachedClient  # noqa: E402
+
+
+class SlowBackend:
+    """A backend that streams one word every 10ms for ten seconds and notes when its stream is closed."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=self)
+        self.events = 0
+        self.closed = threading.Event()
+
+    def create(self, **request):
+        assert request.get("stream"), "blog chunks must be streamed so that they can be cancelled"
+        return self._stream()
+
+    def _stream(self):
+        try:
+            for _ in range(1000):
+                time.sleep(0.01)
+                self.events += 1
+                delta = SimpleNamespace(content="word ")
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None)
+        finally:
+            self.closed.set()
+
+
+def test_cancelling_a_run_closes_the_chunk_request_in_flight(stores):
+    backend = SlowBackend()
+
+    @contextmanager
+    def lease():
+        yield backend
+
+    client = CachedClient(lease)
+    with cancel_scope() as token:
+        threading.Timer(0.2, token.cancel).start()
+        started = time.monotonic()
+        with pytest.raises(Cancelled):
+            generate_chunk(client, "Some newsletter text.", 0, 1)
+
+    assert time.monotonic() - started < 2
+    assert backend.closed.is_set()
+    assert backend.events < 100
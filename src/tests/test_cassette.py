@@ -0,0 +1,102 @@
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("streamlit")
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk  # noqa: E402
+
+from agents.blog_generator import _chunk_request  # noqa: E402
+from utils import output_budget  # noqa: E402
+from utils.cassette import Cassette, CassetteMiss  # noqa: E402
+from utils.openai_client import OpenAIClient  # noqa: E402
+from utils.output_budget import FixedOutputBudget, get_output_budget  # noqa: E402
+
+REQUEST = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "Say hello"}], "temperature": 0.3}
+ANSWER = "Hello there, this answer was recorded once and replayed afterwards."
+
+
+class Upstream:
+    """Answers like the API would, streamed or not, and counts the requests."""
+
+    def __init__(self):
+        self.requests = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **request):
+        self.requests += 1
+        if not request.get("stream"):
+            return ChatCompletion.model_validate({
+                "id": "chatcmpl-1", "object": "chat.completion", "created": 1, "model": request["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": ANSWER}}],
+            })
+        return iter([
+            ChatCompletionChunk.model_validate({
+                "id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 1, "model": request["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            })
+            for delta, finish in (({"role": "assistant", "content": ANSWER[:10]}, None),
+                                  ({"content": ANSWER[10:]}, None), ({}, "stop"))
+        ])
+
+    @contextmanager
+    def lease(self):
+        yield self
+
+
+def streamed_text(events) -> str:
+    return "".join(event.choices[0].delta.content or "" for event in events if event.choices)
+
+
+def test_recorded_responses_replay_without_upstream(tmp_path):
+    upstream = Upstream()
+    recorder = Cassette(str(tmp_path), mode="record", upstream=upstream.lease)
+    assert recorder.chat.completions.create(**REQUEST).choices[0].message.content == ANSWER
+    assert recorder.has(REQUEST)
+
+    player = Cassette(str(tmp_path))
+    assert player.chat.completions.create(**REQUEST).choices[0].message.content == ANSWER
+    # The key ignores how the answer is delivered, so a stream replays the same recording
+    assert streamed_text(player.chat.completions.create(stream=True, **REQUEST)) == ANSWER
+    assert upstream.requests == 1
+
+
+def test_recorded_streams_replay_as_streams(tmp_path):
+    upstream = Upstream()
+    recorder = Cassette(str(tmp_path), mode="record", upstream=upstream.lease)
+    assert streamed_text(recorder.chat.completions.create(stream=True, **REQUEST)) == ANSWER
+
+    player = Cassette(str(tmp_path))
+    events = list(player.chat.completions.create(stream=True, **REQUEST))
+    assert len(events) > 2
+    assert streamed_text(events) == ANSWER
+    assert events[-1].choices[0].finish_reason == "stop"
+
+
+def test_unrecorded_requests_miss(tmp_path):
+    player = Cassette(str(tmp_path))
+    with pytest.raises(CassetteMiss):
+        player.chat.completions.create(**{**REQUEST, "temperature": 0.9})
+    assert player.misses == 1
+
+
+def test_record_mode_needs_an_upstream(tmp_path):
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path), mode="record")
+
+
+def test_cassette_keys_do_not_depend_on_earlier_observations(stores, monkeypatch):
+    chunk = "A newsletter paragraph about vector search. " * 40
+    default_tokens = _chunk_request(chunk, 1, 3)["max_tokens"]
+    for n in range(output_budget.MIN_OBSERVATIONS):
+        get_output_budget().observe("blog", 100, 900, f"a long answer {n}")
+    assert _chunk_request(chunk, 1, 3)["max_tokens"] != default_tokens
+
+    monkeypatch.setattr(OpenAIClient, "client", OpenAIClient.client)
+    monkeypatch.setattr(OpenAIClient, "_instance", OpenAIClient._instance)
+    OpenAIClient.use_cassette(Cassette(str(stores / "cassettes")))
+    assert isinstance(get_output_budget(), FixedOutputBudget)
+    assert _chunk_request(chunk, 1, 3)["max_tokens"] == default_tokens
@@ -0,0 +1,50 @@
+import pytest
+
+from utils.chunking import CharacterChunker, MarkdownChunker, get_chunker
+from utils.tokens import WordTokenizer
+
+
+def chunker(budget: int) -> MarkdownChunker:
+    return MarkdownChunker(token_budget=budget, tokenizer=WordTokenizer())
+
+
+def section(title: str, words: int) -> str:
+    return f"## {title}\n\n" + " ".join(f"{title.lower()}{n}" for n in range(words)) + "."
+
+
+def test_sections_that_fit_are_packed_whole():
+    text = "\n\n".join(section(title, 30) for title in ("Alpha", "Beta", "Gamma"))
+    chunks = chunker(100).split(text)
+    assert chunks == [section("Alpha", 30) + "\n\n" + section("Beta", 30), section("Gamma", 30)]
+
+
+def test_every_chunk_fits_the_budget_and_nothing_is_lost():
+    paragraphs = [" ".join(f"Sentence {p}-{s} has a few words." for s in range(12)) for p in range(6)]
+    text = "# Title\n\n" + "\n\n".join(paragraphs)
+    tokenizer = WordTokenizer()
+    chunks = chunker(80).split(text)
+
+    assert len(chunks) > 1
+    assert all(tokenizer.count(chunk) <= 80 for chunk in chunks)
+    assert " ".join(" ".join(chunks).split()) == " ".join(text.split())
+
+
+def test_a_heading_stays_with_the_paragraph_after_it():
+    text = section("Alpha", 60) + "\n\n## Beta\n\n" + " ".join(f"beta{n}" for n in range(60)) + "."
+    chunks = chunker(90).split(text)
+    assert any(chunk.startswith("## Beta\n\nbeta0") for chunk in chunks)
+    assert all(chunk.strip() != "## Beta" for chunk in chunks)
+
+
+def test_oversized_sentence_is_cut_at_the_budget():
+    text = " ".join(f"w{n}" for n in range(300))
+    chunks = chunker(60).split(text)
+    tokenizer = WordTokenizer()
+    assert all(tokenizer.count(chunk) <= 60 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_registry():
+    assert isinstance(get_chunker("characters", chunk_size=10), CharacterChunker)
+    with pytest.raises(ValueError, match="Unknown chunker"):
+        get_chunker("nope")
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("httpx")
+
+from utils.client_pool import ClientPool  # noqa: E402
+
+
+class FakeClient:
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(ClientPool, "_create", lambda self, api_key: FakeClient(api_key))
+    return ClientPool(max_clients=2)
+
+
+def test_one_client_per_key_is_reused(pool):
+    with pool.lease("key-a") as first:
+        pass
+    with pool.lease("key-a") as again, pool.lease("key-b") as other:
+        assert again is first
+        assert other is not first
+    assert len(pool) == 2
+
+
+def test_least_recently_used_client_is_closed(pool):
+    with pool.lease("key-a") as a:
+        pass
+    with pool.lease("key-b"), pool.lease("key-c"):
+        pass
+    assert a.closed
+    assert len(pool) == 2
+
+
+def test_a_leased_client_is_closed_only_when_returned(pool):
+    with pool.lease("key-a") as a:
+        with pool.lease("key-b"), pool.lease("key-c"):
+            pass
+        assert not a.closed
+    assert a.closed
+
+
+def test_idle_clients_are_closed(pool):
+    pool.idle_timeout = 0
+    with pool.lease("key-a") as a:
+        pass
+    with pool.lease("key-b"):
+        pass
+    assert a.closed
@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from utils.concurrency import TaskError, map_ordered
+from utils.deadlines import Cancelled, cancel_scope, check_cancelled
+
+
+def test_results_keep_input_order():
+    def slow_first(index, item):
+        time.sleep(0.05 if index == 0 else 0)
+        return item * 2
+
+    assert map_ordered(slow_first, [1, 2, 3, 4], max_workers=4) == [2, 4, 6, 8]
+
+
+def test_empty_input():
+    assert map_ordered(lambda index, item: item, [], max_workers=4) == []
+
+
+def test_failure_names_the_failing_index():
+    def fail_on_two(index, item):
+        if item == 2:
+            raise ValueError("boom")
+        return item
+
+    with pytest.raises(TaskError) as raised:
+        map_ordered(fail_on_two, [0, 1, 2, 3], max_workers=2)
+    assert raised.value.index == 2
+    assert isinstance(raised.value.error, ValueError)
+
+
+def test_cancellation_is_noticed_while_calls_are_in_flight():
+    stopped = []
+
+    def in_flight(index, item):
+        # Stands in for a streamed request that checks its scope between events
+        for _ in range(500):
+            time.sleep(0.01)
+            try:
+                check_cancelled()
+            except Cancelled:
+                stopped.append(index)
+                raise
+
+    with cancel_scope() as token:
+        threading.Timer(0.1, token.cancel).start()
+        started = time.monotonic()
+        with pytest.raises(Cancelled):
+            map_ordered(in_flight, range(3), max_workers=3)
+    assert time.monotonic() - started < 2
+    time.sleep(0.2)
+    assert sorted(stopped) == [0, 1, 2]
+
+
+def test_deadline_stops_waiting_for_calls_that_never_check():
+    release = threading.Event()
+    with cancel_scope(timeout=0.2):
+        started = time.monotonic()
+        with pytest.raises(Cancelled):
+            map_ordered(lambda index, item: release.wait(5), range(2), max_workers=2)
+    release.set()
+    assert time.monotonic() - started < 2
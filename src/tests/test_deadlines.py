@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from utils import deadlines
+from utils.deadlines import (
+    MIN_REQUEST_TIMEOUT, Cancelled, CancelToken, DeadlineExceeded, cancel_scope, check_cancelled, request_timeout,
+)
+
+
+def test_outside_a_scope_nothing_is_cancelled():
+    check_cancelled()
+    assert request_timeout() is None
+
+
+def test_cancel_raises_with_the_reason():
+    with cancel_scope() as token:
+        check_cancelled()
+        token.cancel("Stopped by the user")
+        token.cancel("A later reason")
+        with pytest.raises(Cancelled, match="Stopped by the user"):
+            check_cancelled()
+
+
+def test_cancelled_is_not_an_exception():
+    # Agents catch Exception to degrade gracefully; a cancelled run must get past them
+    assert not issubclass(Cancelled, Exception)
+    assert issubclass(DeadlineExceeded, Cancelled)
+
+
+def test_deadline_names_the_scope():
+    with cancel_scope(timeout=0.05, label="the blog stage"):
+        time.sleep(0.1)
+        with pytest.raises(DeadlineExceeded, match="The blog stage ran past its deadline of 0.05s"):
+            check_cancelled()
+
+
+def test_cancelling_a_run_cancels_its_stages():
+    with cancel_scope() as run:
+        with cancel_scope(timeout=60) as stage:
+            run.cancel("Stopped by the user")
+            assert stage.cancelled
+            assert stage.reason == "Stopped by the user"
+
+
+def test_request_timeout_is_the_nearest_deadline():
+    with cancel_scope(timeout=30):
+        with cancel_scope(timeout=600):
+            assert 29 < request_timeout() <= 30
+        with cancel_scope():
+            assert 29 < request_timeout() <= 30
+    with cancel_scope(timeout=0.01):
+        time.sleep(0.02)
+        assert request_timeout() == MIN_REQUEST_TIMEOUT
+
+
+def test_poll_is_rate_limited(monkeypatch):
+    monkeypatch.setattr(deadlines, "CANCEL_POLL_INTERVAL", 0.05)
+    calls = []
+
+    def poll():
+        calls.append(1)
+        return "Cancelled elsewhere" if len(calls) == 2 else None
+
+    token = CancelToken(poll=poll)
+    token._polled = time.monotonic()
+    assert not token.cancelled
+    assert calls == []
+    time.sleep(0.06)
+    assert not token.cancelled
+    time.sleep(0.06)
+    assert token.cancelled
+    assert token.reason == "Cancelled elsewhere"
+
+
+def test_sleep_wakes_up_when_cancelled():
+    with cancel_scope(timeout=0.1):
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            deadlines.sleep(10)
+    assert time.monotonic() - started < 1
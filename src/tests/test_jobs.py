@@ -0,0 +1,138 @@
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("streamlit")
+pytest.importorskip("dotenv")
+
+import jobs  # noqa: E402
+from jobs import JobQueue, JobStore, run_job  # noqa: E402
+from utils.newsletter_index import get_newsletter_index  # noqa: E402
+from utils.openai_client import OpenAIClient  # noqa: E402
+from utils.run_store import get_run_store  # noqa: E402
+
+NEWSLETTER = "# Weekly Notes\n\n" + "\n\n".join(
+    f"## Topic {n}\n\n" + " ".join(f"Point {n}-{s} explains one part of the topic in plain words." for s in range(8))
+    for n in range(3)
+)
+
+
+def reply(request):
+    return "## Section\n\n" + request["messages"][-1]["content"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+@pytest.fixture
+def llm(stores, fake_llm, monkeypatch):
+    # Keep initialize() from replacing the fake client with a real one
+    monkeypatch.setattr(OpenAIClient, "_instance", object())
+    return fake_llm(reply)
+
+
+def test_create_and_update_round_trip(store):
+    job_id = store.create("text", {"blog_concurrency": 2})
+    job = store.get(job_id)
+    assert (job["status"], job["options"], job["stages"]) == ("queued", {"blog_concurrency": 2},
+                                                             {"running": [], "done": []})
+
+    store.update(job_id, status="done", results={"blog": "# Blog"})
+    job = store.get(job_id)
+    assert (job["status"], job["results"]) == ("done", {"blog": "# Blog"})
+    assert store.get("missing") is None
+    assert store.recent()[0]["id"] == job_id
+
+
+def test_cancelling_a_queued_job_takes_effect_at_once(store):
+    job_id = store.create("text", {})
+    store.request_cancel(job_id, "Stopped by the user")
+    job = store.get(job_id)
+    assert (job["status"], job["error"]) == ("cancelled", "Stopped by the user")
+
+
+def test_cancelling_a_running_job_leaves_it_to_the_worker(store):
+    job_id = store.create("text", {})
+    store.update(job_id, status="running")
+    store.request_cancel(job_id, "Stopped by the user")
+    store.request_cancel(job_id, "A later reason")
+    assert store.get(job_id)["status"] == "running"
+    assert store.cancel_reason(job_id) == "Stopped by the user"
+
+
+def test_finished_jobs_cannot_be_cancelled(store):
+    job_id = store.create("text", {})
+    store.update(job_id, status="done")
+    store.request_cancel(job_id, "Too late")
+    assert store.get(job_id)["status"] == "done"
+    assert store.cancel_reason(job_id) is None
+
+
+def test_unwatched_jobs_are_abandoned(store, monkeypatch):
+    job_id = store.create("text", {})
+    assert store.cancel_reason(job_id, abandon_after=60) is None
+    later = time.time() + 120
+    monkeypatch.setattr(jobs.time, "time", lambda: later)
+    assert "nobody has followed it for 60s" in store.cancel_reason(job_id, abandon_after=60)
+    store.touch(job_id)
+    assert store.cancel_reason(job_id, abandon_after=60) is None
+    assert store.cancel_reason("missing") == "The job no longer exists"
+
+
+def test_only_finished_jobs_are_pruned(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), max_jobs=2)
+    active = store.create("text", {})
+    finished = []
+    for _ in range(3):
+        job_id = store.create("text", {})
+        store.update(job_id, status="done")
+        finished.append(job_id)
+        time.sleep(0.01)
+    store.create("text", {})
+
+    assert store.get(active) is not None
+    assert store.get(finished[0]) is None
+
+
+def test_restart_fails_jobs_left_active(store):
+    queued = store.create("text", {})
+    done = store.create("text", {})
+    store.update(done, status="done")
+    store.abandon_active("The server restarted")
+    assert (store.get(queued)["status"], store.get(queued)["error"]) == ("failed", "The server restarted")
+    assert store.get(done)["status"] == "done"
+
+
+def test_run_job_archives_and_indexes_the_run(store, llm):
+    job_id = store.create(NEWSLETTER, {})
+    run_job(job_id, store.path, NEWSLETTER, "sk-test", {"parallel_stages": False})
+
+    job = store.get(job_id)
+    assert job["status"] == "done", job["error"]
+    assert job["results"]["blog"]
+    assert job["stages"]["done"]
+    assert get_run_store().search("")[0]["id"] == job_id
+    assert get_newsletter_index().find(NEWSLETTER)["label"] == job_id
+
+
+def test_run_job_skips_a_job_cancelled_while_queued(store, llm):
+    job_id = store.create(NEWSLETTER, {})
+    store.request_cancel(job_id, "Stopped by the user")
+    run_job(job_id, store.path, NEWSLETTER, "sk-test", {})
+    assert store.get(job_id)["status"] == "cancelled"
+    assert llm.requests == []
+
+
+def test_queue_runs_submitted_jobs(store, llm):
+    queue = JobQueue(store, workers=1)
+    try:
+        job_id = queue.submit(NEWSLETTER, "sk-test", {"parallel_stages": False})
+        deadline = time.monotonic() + 10
+        while queue.status(job_id)["status"] in ("queued", "running") and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        queue.shutdown()
+    assert queue.status(job_id)["status"] == "done"
@@ -0,0 +1,86 @@
+import random
+
+from utils.markdown_assembler import DEDUP_BANDS, DEDUP_NUM_PERM, DUPLICATE_THRESHOLD, MarkdownAssembler, assemble
+from utils.minhash import shingles
+
+PARAGRAPH = ("Teams that batch their model requests spend less on every newsletter because the cached prefix "
+             "is shared, the rate limiter sees fewer bursts and retries rarely overlap with fresh work.")
+
+
+def jaccard(first: str, second: str) -> float:
+    a, b = shingles(first, 3), shingles(second, 3)
+    return len(a & b) / len(a | b)
+
+
+def test_later_titles_are_demoted_and_repeated_titles_dropped():
+    text = assemble(["# Title\n\nOpening words of the post.", "# Title\n\n# Details\n\nMore words."])
+    assert text == "# Title\n\nOpening words of the post.\n\n## Details\n\nMore words."
+
+
+def test_repeated_framing_headings_are_dropped():
+    text = assemble([
+        "## Introduction\n\nThe first introduction of the post, written for the opening chunk.",
+        "## Introduction\n\nA different opening paragraph that a later chunk added on its own.\n\n"
+        "## 2. Conclusion\n\nA closing paragraph.",
+        "## Conclusion\n\nAnother closing paragraph.",
+    ])
+    assert text.count("Introduction") == 1
+    assert text.count("Conclusion") == 1
+
+
+def test_repeated_content_headings_are_kept_with_their_paragraphs():
+    text = assemble([
+        "## Example\n\nThe first example shows how requests are batched to share a prompt prefix.",
+        "## Caching\n\nCache keys cover everything that changes an answer.\n\n"
+        "## Example\n\nThe second example explains why replay needs every input to stay stable.",
+    ])
+    assert text.count("## Example") == 2
+    assert text.endswith("## Example\n\nThe second example explains why replay needs every input to stay stable.")
+
+
+def test_repeated_paragraphs_are_dropped_with_a_heading_left_empty():
+    assembler = MarkdownAssembler()
+    assembler.add(f"## Batching\n\n{PARAGRAPH}")
+    added = assembler.add(f"## Batching again\n\n{PARAGRAPH}\n\n## Next\n\nSomething new.")
+    assert added == "\n\n## Next\n\nSomething new."
+    assert assembler.dropped_paragraphs == 1
+
+
+def test_short_lines_are_never_deduplicated():
+    text = assemble(["First part.\n\nThanks for reading.", "Second part.\n\nThanks for reading."])
+    assert text.count("Thanks for reading.") == 2
+
+
+def test_code_is_copied_as_is():
+    section = "```python\n# not a heading\n\nprint(1)\n```"
+    assert assemble([section, section]).count("# not a heading") == 2
+
+
+def test_near_duplicates_at_the_threshold_are_found():
+    rng = random.Random(3)
+    words = PARAGRAPH.split()
+    found = tried = 0
+    for _ in range(200):
+        variant = list(words)
+        for position in rng.sample(range(len(words)), 2):
+            variant[position] = "changed"
+        variant = " ".join(variant)
+        if jaccard(PARAGRAPH, variant) < DUPLICATE_THRESHOLD + 0.05:
+            continue
+        tried += 1
+        assembler = MarkdownAssembler()
+        assembler.add(PARAGRAPH)
+        assembler.add(variant)
+        found += assembler.dropped_paragraphs
+    assert tried > 50
+    assert found / tried > 0.9
+
+
+def test_lsh_bands_put_the_threshold_on_the_steep_part_of_the_curve():
+    rows = DEDUP_NUM_PERM // DEDUP_BANDS
+
+    def candidate_probability(similarity):
+        return 1 - (1 - similarity ** rows) ** DEDUP_BANDS
+
+    assert candidate_probability(DUPLICATE_THRESHOLD) > 0.95
+    assert candidate_probability(0.2) < 0.2
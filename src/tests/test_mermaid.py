@@ -0,0 +1,31 @@
+from utils.mermaid import strip_fences, validate_mermaid
+
+
+def test_valid_diagrams_pass():
+    assert validate_mermaid("```mermaid\nflowchart LR\n  A[Start] --> B{Ready?}\n  B -->|yes| C(Ship)\n```") == []
+    assert validate_mermaid("sequenceDiagram\n  participant U\n  U->>S: request\n  loop retry\n    S-->>U: reply\n  end") == []
+    assert validate_mermaid('pie title Share\n  "Cache" : 40\n  "Network" : 60') == []
+
+
+def test_fences_are_stripped():
+    assert strip_fences("```mermaid\ngraph TD\nA-->B\n```") == "graph TD\nA-->B"
+
+
+def test_empty_and_unknown_diagrams_fail():
+    assert validate_mermaid("") == ["diagram is empty"]
+    assert validate_mermaid("%% only a comment") == ["diagram is empty"]
+    assert validate_mermaid("graph TD") == ["diagram has no content"]
+    assert validate_mermaid("diagram TD\nA-->B") == ["line 1: unknown diagram type 'diagram'"]
+
+
+def test_flowchart_errors():
+    assert validate_mermaid("flowchart XY\nA-->B") == ["line 1: unknown direction 'XY'"]
+    assert validate_mermaid("graph TD\nA -> B") == ["line 2: flowchart links use '-->', not '->'"]
+    assert validate_mermaid("graph TD\nsubgraph one\nA-->B") == ["1 subgraph(s) without 'end'"]
+    assert validate_mermaid("graph TD\nA[Start --> B") == ["line 2: '[' is never closed"]
+
+
+def test_sequence_and_pie_errors():
+    assert validate_mermaid("sequenceDiagram\nA talks to B") == ["line 2: expected 'A->>B: message', got 'A talks to B'"]
+    assert validate_mermaid("sequenceDiagram\nalt ok\nA->>B: hi") == ["1 block(s) without 'end'"]
+    assert validate_mermaid('pie\n"Cache" forty') == ["line 2: expected '\"label\" : value', got '\"Cache\" forty'"]
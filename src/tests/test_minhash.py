@@ -0,0 +1,45 @@
+import pytest
+
+from utils.minhash import LSHIndex, MinHasher, shingles, similarity
+
+TEXT = ("Vector databases trade exact recall for speed by clustering embeddings into cells "
+        "and only scanning the cells closest to the query at search time.")
+
+
+def test_shingles_are_lower_cased_word_ngrams():
+    assert shingles("One two Three four", size=2) == {"one two", "two three", "three four"}
+    assert shingles("Too short", size=5) == {"too short"}
+    assert shingles("", size=5) == set()
+
+
+def test_signatures_are_stable_across_hashers():
+    features = shingles(TEXT)
+    assert MinHasher(seed=3).signature(features) == MinHasher(seed=3).signature(features)
+    assert MinHasher(seed=3).signature(features) != MinHasher(seed=4).signature(features)
+
+
+def test_similarity_tracks_the_overlap():
+    hasher = MinHasher(num_perm=128)
+    original = hasher.signature(shingles(TEXT, 2))
+    edited = hasher.signature(shingles(TEXT.replace("search time", "query time"), 2))
+    unrelated = hasher.signature(shingles("Bread rises when yeast ferments the sugars in the dough overnight.", 2))
+
+    assert similarity(original, original) == 1.0
+    assert similarity(original, edited) > 0.7
+    assert similarity(original, unrelated) < 0.2
+
+
+def test_lsh_finds_near_duplicates_and_skips_unrelated_items():
+    hasher = MinHasher(num_perm=32)
+    index = LSHIndex(num_perm=32, bands=8)
+    index.add("original", hasher.signature(shingles(TEXT, 2)))
+    index.add("other", hasher.signature(shingles("Bread rises when yeast ferments the sugars overnight.", 2)))
+
+    matches = index.query(hasher.signature(shingles(TEXT.replace("speed", "latency"), 2)), 0.6)
+    assert [key for key, _ in matches] == ["original"]
+    assert index.query(hasher.signature(shingles("Completely different words about gardening.", 2)), 0.6) == []
+
+
+def test_bands_must_divide_the_signature():
+    with pytest.raises(ValueError):
+        LSHIndex(num_perm=32, bands=5)
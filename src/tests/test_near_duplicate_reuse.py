@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("streamlit")
+pytest.importorskip("dotenv")
+
+import batch
+from benchmarks.fixtures import make_newsletter
+from config.prompts import BLOG_CHUNK_SYSTEM_PROMPT
+from utils.newsletter_index import get_newsletter_index
+
+BLOG_ANSWER = "## Section\n\n" + "A paragraph of the blog with enough words to pass the length gate. " * 20
+
+
+def reply(request):
+    # Any other stage gets its own input back, so a context is as long as its newsletter
+    system = request["messages"][0]["content"]
+    return BLOG_ANSWER if system == BLOG_CHUNK_SYSTEM_PROMPT else request["messages"][-1]["content"]
+
+
+def blog_requests(llm):
+    return [request for request in llm.requests if request["messages"][0]["content"] == BLOG_CHUNK_SYSTEM_PROMPT]
+
+
+def edit_last_section(newsletter):
+    head, _, tail = newsletter.rpartition("\n\n")
+    return f"{head}\n\n{tail} One more sentence was added to the last paragraph."
+
+
+def process(newsletter, tmp_path, item_id, **options):
+    return batch.process_item(item_id, newsletter, str(tmp_path / "out"), 1, False, near_duplicates="context",
+                              incremental=True, **options)
+
+
+@pytest.mark.parametrize("chunk_context", [False, True])
+def test_reused_context_keeps_blog_sections(stores, fake_llm, chunk_context):
+    llm = fake_llm(reply)
+    newsletter = make_newsletter("medium")
+    first = process(newsletter, stores, "first", chunk_context=chunk_context)
+    assert first["status"] == "done"
+    written = len(blog_requests(llm))
+    assert written > 1
+
+    llm.requests.clear()
+    second = process(edit_last_section(newsletter), stores, "second", chunk_context=chunk_context)
+
+    assert second["status"] == "done"
+    assert second["near_duplicate_of"]["label"] == "first"
+    # The stored context is chunked like the first run's; with per-chunk
+    # context only the edited chunk is extracted and written again
+    assert len(blog_requests(llm)) == (1 if chunk_context else 0)
+
+
+def test_context_parts_are_stored_with_the_run(stores, fake_llm):
+    fake_llm(reply)
+    newsletter = make_newsletter("medium")
+    process(newsletter, stores, "first", chunk_context=True)
+
+    index = get_newsletter_index()
+    stored = index.get(index.find(newsletter)["run_id"])
+    chunks = [chunk for chunk, _ in stored["results"]["context_parts"]]
+    assert " ".join(chunks).split() == newsletter.split()
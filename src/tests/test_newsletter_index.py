@@ -0,0 +1,50 @@
+from utils.chunk_memo import ChunkMemo, chunk_position
+from utils.newsletter_index import NewsletterIndex, newsletter_digest
+
+NEWSLETTER = " ".join(f"Sentence {n} of the newsletter says something specific about topic {n % 7}." for n in range(60))
+
+
+def index(tmp_path, **options) -> NewsletterIndex:
+    return NewsletterIndex(str(tmp_path / "newsletters.sqlite3"), **options)
+
+
+def test_digest_ignores_case_and_whitespace():
+    assert newsletter_digest("Hello   World\n") == newsletter_digest("hello world")
+
+
+def test_exact_and_near_duplicates_are_found(tmp_path):
+    runs = index(tmp_path)
+    run_id = runs.add(NEWSLETTER, "context", {"blog": "# Blog"}, label="first")
+
+    assert runs.find(NEWSLETTER.upper())["similarity"] == 1.0
+    near = runs.find(NEWSLETTER.replace("Sentence 59", "Line 59"))
+    assert near["run_id"] == run_id and near["similarity"] >= 0.8
+    assert runs.find("A completely different newsletter about gardening and soil.") is None
+    assert runs.get(run_id) == {"run_id": run_id, "label": "first", "created_at": near["created_at"],
+                                "context": "context", "results": {"blog": "# Blog"}}
+
+
+def test_rerunning_a_newsletter_replaces_its_run(tmp_path):
+    runs = index(tmp_path)
+    first = runs.add(NEWSLETTER, "old context", {})
+    second = runs.add(NEWSLETTER, "new context", {})
+    assert runs.count() == 1
+    assert runs.get(first) is None
+    assert runs.get(second)["context"] == "new context"
+
+
+def test_only_the_newest_runs_are_kept(tmp_path):
+    runs = index(tmp_path, max_runs=2)
+    ids = [runs.add(f"{NEWSLETTER} Edition {n}.", "context", {}) for n in range(3)]
+    assert runs.count() == 2
+    assert runs.get(ids[0]) is None
+
+
+def test_chunk_memo_keys_on_text_version_and_position(tmp_path):
+    memo = ChunkMemo(str(tmp_path / "memo.sqlite3"))
+    memo.remember("chunk b", 1, 3, "v1", "section b")
+    assert memo.lookup(["chunk a", "chunk b", "chunk c"], "v1") == [None, "section b", None]
+    assert memo.lookup(["chunk a", "chunk b", "chunk c"], "v2") == [None, None, None]
+    # The same text as the last chunk gets the conclusion prompt, so it is a different section
+    assert memo.lookup(["chunk a", "chunk b"], "v1") == [None, None]
+    assert [chunk_position(n, 3) for n in range(3)] == ["first", "middle", "last"]
@@ -0,0 +1,54 @@
+from utils import output_budget
+from utils.output_budget import (
+    MIN_OBSERVATIONS, PLAN_STEP, FixedOutputBudget, OutputBudgetPlanner, get_output_budget,
+    pin_output_budget,
+)
+
+
+def planner(tmp_path) -> OutputBudgetPlanner:
+    return OutputBudgetPlanner(str(tmp_path / "output_budget.sqlite3"))
+
+
+def test_default_ratio_until_enough_observations(tmp_path):
+    budget = planner(tmp_path)
+    for n in range(MIN_OBSERVATIONS - 1):
+        budget.observe("blog", 1000, 500, f"answer {n}")
+    assert budget.observed_ratio("blog") is None
+    # 1000 * DEFAULT_RATIO rounded up to a whole step
+    assert budget.plan("blog", 1000, 0, 100000) == 4 * PLAN_STEP
+
+
+def test_plan_follows_the_observed_ratios(tmp_path):
+    budget = planner(tmp_path)
+    for n in range(MIN_OBSERVATIONS):
+        budget.observe("blog", 1000, 500, f"answer {n}")
+    assert budget.observed_ratio("blog") == 0.5
+    # 1000 * 0.5 * HEADROOM rounded up to a whole step
+    assert budget.plan("blog", 1000, 0, 100000) == PLAN_STEP * 2
+    assert budget.plan("blog", 1000, 2000, 100000) == 2000
+    assert budget.plan("blog", 1000, 0, 700) == 700
+    assert budget.observed_ratio("seo") is None
+
+
+def test_replayed_answers_are_recorded_once(tmp_path):
+    budget = planner(tmp_path)
+    for _ in range(MIN_OBSERVATIONS):
+        budget.observe("blog", 1000, 500, "the same cached answer")
+    assert budget.observed_ratio("blog") is None
+
+
+def test_observations_persist_across_instances(tmp_path):
+    budget = planner(tmp_path)
+    for n in range(MIN_OBSERVATIONS):
+        budget.observe("blog", 1000, 3000, f"answer {n}")
+    assert planner(tmp_path).observed_ratio("blog") == 3.0
+
+
+def test_pinned_budget_ignores_observations(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_budget, "_planner", planner(tmp_path))
+    pinned = pin_output_budget()
+    assert isinstance(pinned, FixedOutputBudget)
+    assert get_output_budget() is pinned
+    for n in range(MIN_OBSERVATIONS):
+        pinned.observe("blog", 1000, 500, f"answer {n}")
+    assert pinned.plan("blog", 1000, 0, 100000) == 2048
@@ -0,0 +1,135 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+
+from utils import rate_limiter  # noqa: E402
+from utils.deadlines import Cancelled, DeadlineExceeded, cancel_scope  # noqa: E402
+from utils.rate_limiter import RequestScheduler, TokenBucket  # noqa: E402
+
+MODEL = "test-model"
+REQUEST = {"model": MODEL, "messages": [{"role": "user", "content": "Hello there"}], "max_tokens": 100}
+
+
+class Transient(Exception):
+    pass
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    # Which openai errors count as transient is covered by test_transient_api_errors_are_retryable;
+    # here only the scheduler's bookkeeping around them matters
+    monkeypatch.setattr(rate_limiter, "is_retryable", lambda error: isinstance(error, Transient))
+    return RequestScheduler({MODEL: {"rpm": 600, "tpm": 60000}}, max_retries=3, base_delay=0.001, max_delay=0.001)
+
+
+def token_level(scheduler) -> float:
+    budget = scheduler._buckets_for(MODEL)[1]
+    budget._refill()
+    return budget.level
+
+
+def usage(prompt, completion):
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion)
+
+
+def test_transient_api_errors_are_retryable():
+    openai = pytest.importorskip("openai")
+    httpx = pytest.importorskip("httpx")
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+    def status_error(cls, code, headers=None):
+        return cls("error", response=httpx.Response(code, headers=headers, request=request), body=None)
+
+    assert rate_limiter.is_retryable(status_error(openai.RateLimitError, 429))
+    assert rate_limiter.is_retryable(status_error(openai.InternalServerError, 503))
+    assert rate_limiter.is_retryable(openai.APITimeoutError(request=request))
+    assert not rate_limiter.is_retryable(status_error(openai.BadRequestError, 400))
+    assert not rate_limiter.is_retryable(ValueError("bad"))
+    assert rate_limiter.retry_after_seconds(status_error(openai.RateLimitError, 429, {"retry-after": "2"})) == 2.0
+
+
+def test_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.wait_time(600) == pytest.approx(60.0, abs=0.5)
+    bucket.refund(1000)
+    assert bucket.level == 60
+
+
+def test_reservation_is_the_prompt_plus_max_tokens(scheduler):
+    estimate = scheduler.estimate_tokens(REQUEST)
+    assert estimate > 100
+    assert scheduler.estimate_tokens({**REQUEST, "max_tokens": None}) == estimate - 100 + 1000
+
+
+def test_unused_reservation_is_refunded(scheduler):
+    response = SimpleNamespace(usage=usage(10, 5))
+    assert scheduler.run(REQUEST, lambda: response) is response
+    assert token_level(scheduler) == pytest.approx(60000 - 15, abs=2)
+
+
+def test_failed_attempts_give_their_reservation_back(scheduler):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Transient("try again")
+        return SimpleNamespace(usage=usage(10, 5))
+
+    record = SimpleNamespace(queue_seconds=0.0, retries=0)
+    scheduler.run(REQUEST, flaky, record)
+    assert len(attempts) == 3
+    assert record.retries == 2
+    assert token_level(scheduler) == pytest.approx(60000 - 15, abs=2)
+
+
+def test_permanent_errors_are_not_retried(scheduler):
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.run(REQUEST, broken)
+    assert len(attempts) == 1
+    assert token_level(scheduler) == pytest.approx(60000, abs=2)
+
+
+def test_retries_stop_after_max_retries(scheduler):
+    attempts = []
+
+    def always_failing():
+        attempts.append(1)
+        raise Transient("still down")
+
+    with pytest.raises(Transient):
+        scheduler.run(REQUEST, always_failing)
+    assert len(attempts) == scheduler.max_retries + 1
+
+
+def test_cancellation_is_not_retried(scheduler):
+    attempts = []
+
+    def cancelled():
+        attempts.append(1)
+        raise Cancelled("user left")
+
+    with pytest.raises(Cancelled):
+        scheduler.run(REQUEST, cancelled)
+    assert len(attempts) == 1
+    assert token_level(scheduler) == pytest.approx(60000, abs=2)
+
+
+def test_waiting_for_budget_ends_with_the_deadline():
+    scheduler = RequestScheduler({MODEL: {"rpm": 1, "tpm": 60000}})
+    scheduler.acquire(MODEL, 10)
+    started = time.monotonic()
+    with cancel_scope(timeout=0.3), pytest.raises(DeadlineExceeded):
+        scheduler.acquire(MODEL, 10)
+    assert time.monotonic() - started < 2
@@ -0,0 +1,59 @@
+from utils import response_cache
+from utils.response_cache import ResponseCache, bypass_cache, cache_bypassed, make_cache_key
+
+REQUEST = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "Hi"}], "temperature": 0.3}
+
+
+def test_key_ignores_delivery_options_only():
+    assert make_cache_key(REQUEST) == make_cache_key({**REQUEST, "stream": True, "timeout": 30, "use_cache": True})
+    assert make_cache_key(REQUEST) != make_cache_key({**REQUEST, "temperature": 0.7})
+    assert make_cache_key(REQUEST) != make_cache_key({**REQUEST, "messages": [{"role": "user", "content": "Hey"}]})
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("k") is None
+    cache.put("k", "payload", "gpt-4")
+    assert cache.get("k") == "payload"
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "bytes": len("payload")}
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    cache.put("k", "payload")
+    now[0] += 59
+    assert cache.get("k") == "payload"
+    now[0] += 2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    for key in ("a", "b"):
+        now[0] += 1
+        cache.put(key, key)
+    now[0] += 1
+    cache.get("a")
+    now[0] += 1
+    cache.put("c", "c")
+    assert [cache.get(key) for key in ("a", "b", "c")] == ["a", None, "c"]
+
+
+def test_byte_limit_evicts_too(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+    cache.put("a", "x" * 6)
+    cache.put("b", "y" * 6)
+    assert cache.stats()["entries"] == 1
+    assert cache.get("b") == "y" * 6
+
+
+def test_bypass_is_scoped():
+    assert not cache_bypassed()
+    with bypass_cache():
+        assert cache_bypassed()
+    assert not cache_bypassed()
@@ -0,0 +1,83 @@
+import io
+import os
+import sqlite3
+import zipfile
+
+import pytest
+
+from utils.run_store import RunStore, write_files_atomically
+
+RESULTS = {
+    "context": "Context of the newsletter.",
+    "blog": "# Batching Requests\n\nHow batching model requests keeps pipelines cheap.",
+    "seo": {"page_title": "Batching Requests", "focus_keywords": ["batching requests"],
+            "url_slug": "batching-requests", "meta_description": "Why batching helps."},
+    "visuals": [{"mermaid_code": "graph TD\n    A --> B"}],
+}
+
+
+class FailingCommit:
+    """Wraps a connection so that commit() fails, like a locked database would."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def commit(self):
+        raise sqlite3.OperationalError("database is locked")
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def test_save_writes_files_and_indexes_them(tmp_path):
+    store = RunStore(str(tmp_path))
+    run_dir = store.save("run-1", RESULTS)
+
+    assert sorted(os.listdir(run_dir)) == ["blog.md", "context.md", "diagram_1.mmd", "seo.json", "visuals.json"]
+    [found] = store.search("batching")
+    assert (found["id"], found["title"], found["slug"]) == ("run-1", "Batching Requests", "batching-requests")
+    assert "**" in found["snippet"]
+    assert store.search("")[0]["id"] == "run-1"
+
+
+def test_a_run_is_saved_only_once(tmp_path):
+    store = RunStore(str(tmp_path))
+    store.save("run-1", RESULTS)
+    with pytest.raises(ValueError):
+        store.save("run-1", RESULTS)
+
+
+def test_a_failed_index_commit_leaves_nothing_behind(tmp_path):
+    store = RunStore(str(tmp_path))
+    conn = store._conn
+    store._conn = FailingCommit(conn)
+    with pytest.raises(sqlite3.OperationalError):
+        store.save("run-1", RESULTS)
+    store._conn = conn
+
+    assert not os.path.exists(store.run_dir("run-1"))
+    assert store.search("batching") == []
+    store.save("run-1", RESULTS)
+    assert [run["id"] for run in store.search("batching")] == ["run-1"]
+
+
+def test_an_unindexed_directory_is_replaced(tmp_path):
+    store = RunStore(str(tmp_path))
+    write_files_atomically(store.run_dir("run-1"), {"blog.md": "left over"})
+    store.save("run-1", RESULTS)
+    assert store.files("run-1")["blog.md"] == RESULTS["blog"]
+
+
+def test_search_input_cannot_break_the_query_syntax(tmp_path):
+    store = RunStore(str(tmp_path))
+    store.save("run-1", RESULTS)
+    assert store.search('batch" OR (') == []
+    assert [run["id"] for run in store.search("batch")] == ["run-1"]
+
+
+def test_archive_holds_every_file(tmp_path):
+    store = RunStore(str(tmp_path))
+    store.save("run-1", RESULTS)
+    with zipfile.ZipFile(io.BytesIO(store.archive("run-1"))) as archive:
+        assert set(archive.namelist()) == set(store.files("run-1"))
+    assert store.archive("unknown") == b""
@@ -0,0 +1,72 @@
+from utils.section_quality import MIN_CHUNK_WORDS, MIN_CONCLUSION_WORDS, MIN_INTRO_WORDS, section_problems
+
+
+def prose(words: int, topic: str) -> str:
+    """words words of paragraphs, no sentence or paragraph like any other."""
+    tokens = [f"{topic}{n}" for n in range(words)]
+    sentences = [" ".join(tokens[start:start + 10]) + "." for start in range(0, words, 10)]
+    return "\n\n".join(" ".join(sentences[start:start + 8]) for start in range(0, len(sentences), 8))
+
+
+def intro(words: int = 320) -> str:
+    return f"# Scaling Search\n\n## Why search slows down\n\n{prose(words, 'intro')}\n\n## Where the time goes\n\n{prose(200, 'time')}"
+
+
+def body(topic: str = "body", words_per_heading: int = 260) -> str:
+    return f"## Index layout\n\n{prose(words_per_heading, topic + 'a')}\n\n## Query planning\n\n{prose(words_per_heading, topic + 'b')}"
+
+
+def final(conclusion_words: int = 220) -> str:
+    return f"## Rolling it out\n\n{prose(300, 'rollout')}\n\n## Conclusion\n\n{prose(conclusion_words, 'wrap')}"
+
+
+def test_sections_meeting_the_prompt_targets_pass():
+    assert section_problems([intro(), body(), final()]) == [[], [], []]
+
+
+def test_chunk_shorter_than_the_prompt_target_fails():
+    # 300 words split over two headings: what the prompts forbid, even though every heading has real text
+    problems = section_problems([intro(), body(words_per_heading=150), final()])[1]
+    assert problems == [f"the section has 300 words, it needs at least {MIN_CHUNK_WORDS}"]
+
+
+def test_heading_with_a_couple_of_lines_fails():
+    section = body() + f"\n\n## Caching\n\n{prose(30, 'cache')}"
+    problems = section_problems([intro(), section, final()])[1]
+    assert problems == ['the part under "Caching" has 30 words, it needs at least 60']
+
+
+def test_short_introduction_fails():
+    problems = section_problems([intro(words=150), body(), final()])[0]
+    assert f"the introduction has 150 words, it needs at least {MIN_INTRO_WORDS}" in problems
+
+
+def test_short_conclusion_fails():
+    problems = section_problems([intro(), body(), final(conclusion_words=120)])[2]
+    assert problems == [f'the conclusion "Conclusion" has 120 words, it needs at least {MIN_CONCLUSION_WORDS}']
+
+
+def test_last_section_needs_a_conclusion():
+    problems = section_problems([intro(), body(), body("late")])[2]
+    assert any("there is no conclusion" in problem for problem in problems)
+
+
+def test_forbidden_formatting_fails():
+    section = body() + "\n\n- first point\n- second point\n\n| a | b |\n|---|---|\n\n```mermaid\ngraph TD\n```"
+    problems = section_problems([intro(), section, final()])[1]
+    assert "uses 2 bullet or numbered list item(s); write paragraphs instead" in problems
+    assert "contains a table; write paragraphs instead" in problems
+    assert "contains a code block or diagram; write paragraphs instead" in problems
+
+
+def test_sentence_repeated_word_for_word_fails():
+    sentence = "This exact sentence is written twice in the same section."
+    section = body() + f"\n\n{sentence} {sentence}"
+    problems = section_problems([intro(), section, final()])[1]
+    assert "repeats 1 sentence(s) word for word" in problems
+
+
+def test_section_repeating_an_earlier_one_fails():
+    problems = section_problems([intro(), body(), body(), final()])
+    assert problems[1] == []
+    assert problems[2] == ["mostly repeats earlier sections of the blog; cover the new newsletter content instead"]
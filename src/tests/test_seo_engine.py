@@ -0,0 +1,78 @@
+from utils.seo_engine import (
+    DESCRIPTION_MAX_CHARS, TITLE_MAX_CHARS, DocumentFrequencyIndex, analyze, candidate_phrases, describe, fit_title,
+    rank_keywords, slugify, trim_to_words,
+)
+
+BLOG = """# Vector Search at Scale
+
+Vector search finds the documents closest to a query embedding. Approximate nearest neighbour indexes make vector search fast enough for production traffic. This post explains how the indexes trade recall for latency.
+
+## Building the index
+
+An approximate nearest neighbour index groups embeddings into clusters so a query only scans a few of them.
+"""
+
+
+def test_slugify():
+    assert slugify("Vector Search at Scale!") == "vector-search-at-scale"
+    assert slugify("Café déjà vu") == "cafe-deja-vu"
+    long_slug = slugify("The complete and exhaustive guide to all of the ways that vector search can be made fast")
+    assert len(long_slug) <= 60
+    assert "the" not in long_slug.split("-")
+
+
+def test_trim_to_words():
+    assert trim_to_words("short", 10) == "short"
+    assert trim_to_words("one two three four", 12) == "one two…"
+
+
+def test_description_uses_whole_sentences_within_limits():
+    description = describe(BLOG)
+    assert description.startswith("Vector search finds the documents")
+    assert len(description) <= DESCRIPTION_MAX_CHARS
+    assert description.endswith(".")
+
+
+def test_title_is_fitted_to_the_limits():
+    assert fit_title("Vector search tips", "vector search") == "Vector search tips"
+    assert fit_title("Short title", "vector search") == "Short title: Vector Search"
+    assert len(fit_title("A very long title " * 10)) <= TITLE_MAX_CHARS
+
+
+def test_candidate_phrases_break_at_stop_words_and_punctuation():
+    assert candidate_phrases("The vector index, and the query planner.") == [("vector", "index"), ("query", "planner")]
+
+
+def test_keywords_prefer_recurring_multi_word_phrases():
+    keywords = rank_keywords(BLOG)
+    assert keywords[0] == "approximate nearest neighbour"
+    assert any("vector search" in keyword for keyword in keywords)
+    # A phrase is not repeated inside a longer one that was already chosen
+    assert not any(a != b and a in b for a in keywords for b in keywords)
+
+
+def test_words_every_post_uses_rank_lower(tmp_path):
+    index = DocumentFrequencyIndex(str(tmp_path / "seo.sqlite3"))
+    for n in range(5):
+        index.add_document(f"Post {n} about approximate nearest neighbour indexes.")
+    idf = index.idf(["neighbour", "vector"])
+    assert idf["neighbour"] < idf["vector"]
+    assert rank_keywords(BLOG, index)[0] != "approximate nearest neighbour"
+
+
+def test_documents_are_counted_once_per_key(tmp_path):
+    index = DocumentFrequencyIndex(str(tmp_path / "seo.sqlite3"))
+    assert index.add_document("First version of the post.", key="newsletter-1")
+    assert not index.add_document("Edited version of the post.", key="newsletter-1")
+    assert index.add_document("First version of the post.")
+    assert not index.add_document("First version of the post.")
+    assert index.document_count() == 2
+
+
+def test_analyze_returns_the_agent_shape():
+    seo = analyze(BLOG)
+    assert set(seo) == {"page_title", "meta_title", "meta_description", "focus_keywords", "url_slug"}
+    # The headline is under TITLE_MIN_CHARS, so the primary keyword is added to it
+    assert seo["page_title"] == "Vector Search at Scale: Approximate Nearest Neighbour"
+    assert seo["url_slug"] == slugify(seo["page_title"])
+    assert seo["focus_keywords"][0] == "approximate nearest neighbour"
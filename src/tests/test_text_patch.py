@@ -0,0 +1,44 @@
+from utils.text_patch import apply_edits, line_spans, number_blocks
+
+TEXT = "# Title\n\nFirst paragraph about caching.\n\n## Details\nSecond line here.\n"
+
+
+def test_blocks_are_the_non_blank_lines():
+    assert [TEXT[start:end] for start, end in line_spans(TEXT)] == [
+        "# Title", "First paragraph about caching.", "## Details", "Second line here."
+    ]
+    assert number_blocks(TEXT).splitlines()[2] == "[3] ## Details"
+
+
+def test_whole_block_and_snippet_edits():
+    patched, report = apply_edits(TEXT, [
+        {"block": 1, "replace": "# Caching Explained"},
+        {"block": 2, "find": "caching", "replace": "response caching"},
+    ])
+    assert patched == "# Caching Explained\n\nFirst paragraph about response caching.\n\n## Details\nSecond line here.\n"
+    assert report.as_dict() == {"applied": 2, "skipped": 0, "skipped_reasons": []}
+
+
+def test_edits_to_one_block_build_on_each_other():
+    patched, _ = apply_edits(TEXT, [
+        {"block": 4, "find": "Second", "replace": "Third"},
+        {"block": 4, "find": "here", "replace": "there"},
+    ])
+    assert "Third line there." in patched
+
+
+def test_bad_edits_are_skipped_and_the_rest_is_untouched():
+    patched, report = apply_edits(TEXT, [
+        {"block": 9, "replace": "nothing"},
+        {"block": 2, "find": "missing words", "replace": "x"},
+        {"block": "2", "replace": "x"},
+        "not an edit",
+    ])
+    assert patched == TEXT
+    assert report.applied == 0
+    assert report.as_dict()["skipped_reasons"] == [
+        "block 9 does not exist",
+        "snippet not found in block 2",
+        "edit needs an integer block and a replace string",
+        "edit needs an integer block and a replace string",
+    ]
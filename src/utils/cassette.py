@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from utils.response_cache import NON_SEMANTIC_PARAMS, make_cache_key
+
+# Number of deltas a replayed stream is split into
+REPLAY_STREAM_PIECES = 20
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+class Cassette:
+    """Record/replay backend for chat completions.
+
+    In "record" mode requests are sent upstream (a lease callable such as
+    OpenAIClient.lease) and each response is stored as one JSON file named
+    after the request's cache key, together with its measured latency. In
+    "replay" mode the stored responses are served without touching the
+    network; latency_scale=1.0 reproduces the recorded timing, 0 replays
+    instantly, and any other factor stretches or shrinks it.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", upstream=None, latency_scale: float = 0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError("mode must be 'record' or 'replay'")
+        if mode == "record" and upstream is None:
+            raise ValueError("record mode needs an upstream lease")
+        self.path = path
+        self.mode = mode
+        self.upstream = upstream
+        self.latency_scale = latency_scale
+        self.misses = 0
+        self.chat = _Chat(_CassetteCompletions(self))
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def lease(self):
+        yield self
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def has(self, kwargs: dict) -> bool:
+        return os.path.exists(self._file(make_cache_key(kwargs)))
+
+    def load(self, kwargs: dict) -> dict:
+        key = make_cache_key(kwargs)
+        try:
+            with open(self._file(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            raise CassetteMiss(f"No recorded response for {kwargs.get('model')} request {key[:12]} in {self.path}") from None
+
+    def save(self, kwargs: dict, response: dict, ttft: float, total: float):
+        key = make_cache_key(kwargs)
+        entry = {
+            "request": {k: v for k, v in kwargs.items() if k not in NON_SEMANTIC_PARAMS},
+            "response": response,
+            "timing": {"ttft_seconds": round(ttft, 4), "total_seconds": round(total, 4)},
+        }
+        temporary = self._file(key) + ".tmp"
+        with self._lock:
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(entry, f, indent=2, ensure_ascii=False)
+            os.replace(temporary, self._file(key))
+
+    def sleep(self, seconds: float):
+        if self.latency_scale and seconds > 0:
+            time.sleep(seconds * self.latency_scale)
+
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class _CassetteCompletions:
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def create(self, **kwargs):
+        if self.cassette.mode == "record":
+            if kwargs.get("stream"):
+                return self._record_stream(kwargs)
+            return self._record(kwargs)
+        entry = self.cassette.load(kwargs)
+        if kwargs.get("stream"):
+            return self._replay_stream(entry)
+        self.cassette.sleep(entry["timing"]["total_seconds"])
+        return ChatCompletion.model_validate(entry["response"])
+
+    def _record(self, kwargs):
+        started = time.perf_counter()
+        with self.cassette.upstream() as client:
+            response = client.chat.completions.create(**kwargs)
+        total = time.perf_counter() - started
+        self.cassette.save(kwargs, response.model_dump(mode="json"), total, total)
+        return response
+
+    def _record_stream(self, kwargs):
+        started = time.perf_counter()
+        ttft = None
+        parts = []
+        finish_reason = None
+        usage = None
+        last = None
+        with self.cassette.upstream() as client:
+            for event in client.chat.completions.create(**kwargs):
+                last = event
+                if event.usage is not None:
+                    usage = event.usage.model_dump(mode="json")
+                if event.choices:
+                    choice = event.choices[0]
+                    if choice.delta.content:
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        parts.append(choice.delta.content)
+                    finish_reason = choice.finish_reason or finish_reason
+                yield event
+        if last is None or finish_reason is None:
+            return
+        total = time.perf_counter() - started
+        response = {
+            "id": last.id,
+            "object": "chat.completion",
+            "created": last.created,
+            "model": last.model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(parts)},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        }
+        self.cassette.save(kwargs, response, ttft if ttft is not None else total, total)
+
+    def _replay_stream(self, entry):
+        response = entry["response"]
+        content = response["choices"][0]["message"]["content"] or ""
+        finish_reason = response["choices"][0]["finish_reason"]
+        ttft = entry["timing"]["ttft_seconds"]
+        pieces = max(1, min(REPLAY_STREAM_PIECES, len(content)))
+        size = -(-len(content) // pieces) if content else 1
+        gap = (entry["timing"]["total_seconds"] - ttft) / pieces
+
+        def chunk(delta, finish=None, usage=None, with_choice=True):
+            return ChatCompletionChunk.model_validate({
+                "id": response["id"],
+                "object": "chat.completion.chunk",
+                "created": response["created"],
+                "model": response["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if with_choice else [],
+                "usage": usage,
+            })
+
+        self.cassette.sleep(ttft)
+        for start in range(0, max(len(content), 1), size):
+            if start:
+                self.cassette.sleep(gap)
+            yield chunk({"role": "assistant", "content": content[start:start + size]})
+        yield chunk({}, finish=finish_reason)
+        if response.get("usage"):
+            yield chunk({}, usage=response["usage"], with_choice=False)
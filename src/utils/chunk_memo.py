@@ -0,0 +1,56 @@
+import hashlib
+import os
+import threading
+
+from utils.response_cache import ResponseCache
+
+CHUNK_MEMO_PATH = os.environ.get("CHUNK_MEMO_PATH", os.path.join(".cache", "blog_chunks.sqlite3"))
+CHUNK_MEMO_TTL_SECONDS = 30 * 24 * 60 * 60
+
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def chunk_position(chunk_index: int, total_chunks: int) -> str:
+    """The part of the prompt a chunk gets: the introduction, the body or the conclusion."""
+    if chunk_index == 0:
+        return "first"
+    if chunk_index == total_chunks - 1:
+        return "last"
+    return "middle"
+
+
+def chunk_memo_key(chunk: str, prompt_version: str, position: str) -> str:
+    payload = "\x00".join((prompt_version, position, chunk))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ChunkMemo:
+    """Blog sections already generated, keyed on chunk text, prompt version and chunk position.
+
+    Comparing a new newsletter's chunks against these keys tells which
+    chunks are unchanged since an earlier run; only the others need an LLM
+    call. Stored in the same SQLite format as the response cache.
+    """
+
+    def __init__(self, path: str = CHUNK_MEMO_PATH, ttl_seconds: float = CHUNK_MEMO_TTL_SECONDS):
+        self.store = ResponseCache(path, ttl_seconds=ttl_seconds)
+
+    def lookup(self, chunks: list, prompt_version: str) -> list:
+        """Previously generated section for each chunk, or None where it must be regenerated."""
+        return [
+            self.store.get(chunk_memo_key(chunk, prompt_version, chunk_position(index, len(chunks))))
+            for index, chunk in enumerate(chunks)
+        ]
+
+    def remember(self, chunk: str, chunk_index: int, total_chunks: int, prompt_version: str, section: str):
+        key = chunk_memo_key(chunk, prompt_version, chunk_position(chunk_index, total_chunks))
+        self.store.put(key, section)
+
+
+def get_chunk_memo() -> ChunkMemo:
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = ChunkMemo()
+        return _memo
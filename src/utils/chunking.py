@@ -0,0 +1,127 @@
+import re
+import textwrap
+
+from utils.tokens import get_tokenizer
+
+DEFAULT_TOKEN_BUDGET = 1500
+
+_HEADING = re.compile(r"^#{1,6}\s")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class CharacterChunker:
+    """The original fixed-width splitter; kept for comparison and fallback."""
+
+    def __init__(self, chunk_size: int = 2000):
+        self.chunk_size = chunk_size
+
+    def split(self, text: str) -> list:
+        return textwrap.wrap(text, self.chunk_size, break_long_words=False, break_on_hyphens=False)
+
+
+class MarkdownChunker:
+    """Pack whole markdown sections and paragraphs into chunks of at most token_budget tokens.
+
+    Sections (a heading plus its body) are kept together whenever they fit.
+    A section that is too large is split between paragraphs, a paragraph that
+    is too large between sentences, and only a single oversized sentence is
+    cut at a token boundary. Line breaks are preserved everywhere except
+    inside a paragraph that had to be split.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, model: str = "gpt-4", tokenizer=None):
+        self.token_budget = token_budget
+        self.tokenizer = tokenizer or get_tokenizer(model)
+
+    def split(self, text: str) -> list:
+        chunks = []
+        current = []
+        current_tokens = 0
+        separator_tokens = self.tokenizer.count("\n\n")
+
+        for block in self._blocks(text):
+            block_tokens = self.tokenizer.count(block)
+            if current and current_tokens + separator_tokens + block_tokens > self.token_budget:
+                chunks.append("\n\n".join(current))
+                current = []
+                current_tokens = 0
+            current.append(block)
+            current_tokens += block_tokens + (separator_tokens if len(current) > 1 else 0)
+
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks
+
+    def _blocks(self, text: str):
+        """Yield the largest units of text that each fit the budget."""
+        for section in self._sections(text):
+            if self.tokenizer.count(section) <= self.token_budget:
+                yield section
+                continue
+            heading = ""
+            for paragraph in self._paragraphs(section):
+                if _HEADING.match(paragraph) and "\n" not in paragraph:
+                    # Keep a bare heading with the paragraph that follows it
+                    heading = f"{heading}\n\n{paragraph}" if heading else paragraph
+                    continue
+                if heading:
+                    paragraph = f"{heading}\n\n{paragraph}"
+                    heading = ""
+                if self.tokenizer.count(paragraph) <= self.token_budget:
+                    yield paragraph
+                    continue
+                yield from self._pack(self._sentences(paragraph), " ")
+            if heading:
+                yield heading
+
+    def _pack(self, pieces, joiner: str):
+        current = ""
+        for piece in pieces:
+            candidate = f"{current}{joiner}{piece}" if current else piece
+            if self.tokenizer.count(candidate) <= self.token_budget:
+                current = candidate
+                continue
+            if current:
+                yield current
+            if self.tokenizer.count(piece) <= self.token_budget:
+                current = piece
+            else:
+                yield from self.tokenizer.split(piece, self.token_budget)
+                current = ""
+        if current:
+            yield current
+
+    @staticmethod
+    def _sections(text: str) -> list:
+        sections = []
+        current = []
+        for line in text.strip().splitlines():
+            if _HEADING.match(line) and any(l.strip() for l in current):
+                sections.append("\n".join(current).strip())
+                current = []
+            current.append(line)
+        if any(l.strip() for l in current):
+            sections.append("\n".join(current).strip())
+        return sections
+
+    @staticmethod
+    def _paragraphs(section: str) -> list:
+        return [p.strip() for p in re.split(r"\n\s*\n", section) if p.strip()]
+
+    @staticmethod
+    def _sentences(paragraph: str) -> list:
+        return [s for s in _SENTENCE_END.split(paragraph) if s]
+
+
+CHUNKERS = {
+    "markdown": MarkdownChunker,
+    "characters": CharacterChunker,
+}
+
+
+def get_chunker(name: str = "markdown", **options):
+    """Build a registered chunker by name, e.g. get_chunker("markdown", token_budget=2000)."""
+    try:
+        return CHUNKERS[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown chunker '{name}'. Available: {', '.join(CHUNKERS)}") from None
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import httpx
+import openai
+
+DEFAULT_REQUEST_TIMEOUT = 300.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+
+class _PooledClient:
+    def __init__(self, client):
+        self.client = client
+        self.active = 0
+        self.last_used = time.monotonic()
+        self.evicted = False
+
+
+class ClientPool:
+    """One configured OpenAI client per API key, shared by every thread that uses that key.
+
+    Each client owns an httpx connection pool with keep-alive, so concurrent
+    requests for the same key reuse TCP/TLS connections. Clients idle for
+    longer than idle_timeout, or the least recently used ones once more than
+    max_clients keys are held, are closed; a client is never closed while a
+    request leased from it is still running.
+    """
+
+    def __init__(self, max_clients: int = 16, idle_timeout: float = 900.0,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 max_connections: int = 20, max_keepalive_connections: int = 10):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.timeout = httpx.Timeout(request_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=idle_timeout
+        )
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _create(self, api_key: str):
+        http_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+        # Retries are handled by the RequestScheduler, which also honours the rate budgets
+        return openai.OpenAI(api_key=api_key, timeout=self.timeout, max_retries=0, http_client=http_client)
+
+    @contextmanager
+    def lease(self, api_key: str):
+        """Borrow the client for api_key for the duration of one request."""
+        with self._lock:
+            entry = self._clients.get(api_key)
+            if entry is None:
+                entry = _PooledClient(self._create(api_key))
+                self._clients[api_key] = entry
+            self._clients.move_to_end(api_key)
+            entry.active += 1
+            entry.last_used = time.monotonic()
+            self._evict()
+        try:
+            yield entry.client
+        finally:
+            with self._lock:
+                entry.active -= 1
+                entry.last_used = time.monotonic()
+                if entry.evicted and entry.active == 0:
+                    entry.client.close()
+
+    def _evict(self):
+        now = time.monotonic()
+        for api_key, entry in list(self._clients.items()):
+            if entry.active == 0 and now - entry.last_used > self.idle_timeout:
+                self._remove(api_key)
+        for api_key in list(self._clients):
+            if len(self._clients) <= self.max_clients:
+                break
+            self._remove(api_key)
+
+    def _remove(self, api_key: str):
+        entry = self._clients.pop(api_key)
+        entry.evicted = True
+        if entry.active == 0:
+            entry.client.close()
+
+    def close(self):
+        with self._lock:
+            for api_key in list(self._clients):
+                self._remove(api_key)
+
+    def __len__(self):
+        return len(self._clients)
@@ -0,0 +1,92 @@
+import contextvars
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from utils.deadlines import CANCEL_POLL_INTERVAL, check_cancelled
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # older Streamlit releases or headless use
+    add_script_run_ctx = None
+    get_script_run_ctx = None
+
+
+class TaskError(Exception):
+    """Raised by map_ordered when one of the submitted items fails."""
+
+    def __init__(self, index: int, error: BaseException):
+        super().__init__(str(error))
+        self.index = index
+        self.error = error
+
+
+def current_session_id(default: str = "default") -> str:
+    """Id of the Streamlit session running the calling thread."""
+    script_ctx = get_script_run_ctx() if get_script_run_ctx else None
+    return script_ctx.session_id if script_ctx is not None else default
+
+
+def thread_pool(max_workers: int) -> ThreadPoolExecutor:
+    """Create a thread pool whose workers can still talk to the Streamlit page."""
+    script_ctx = get_script_run_ctx() if get_script_run_ctx else None
+
+    def _attach_script_ctx():
+        if script_ctx is not None:
+            add_script_run_ctx(threading.current_thread(), script_ctx)
+
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=_attach_script_ctx)
+
+
+def map_ordered(func, items, max_workers: int) -> list:
+    """Run func over items concurrently and return the results in input order.
+
+    At most max_workers calls run at once. When any call fails, items that have
+    not started yet are cancelled and a TaskError carrying the failing index is
+    raised without waiting for the calls still in flight. Errors that are not
+    Exceptions, such as utils.deadlines.Cancelled, are re-raised as they are.
+    The calling scope is checked while waiting, so a cancelled run raises
+    Cancelled here at once; the calls in flight share its scope and stop at
+    their next check.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    cancelled = threading.Event()
+
+    def _run(index, item):
+        if cancelled.is_set():
+            return None
+        return func(index, item)
+
+    executor = thread_pool(max(1, min(max_workers, len(items))))
+    futures = {}
+    try:
+        for index, item in enumerate(items):
+            future = executor.submit(contextvars.copy_context().run, _run, index, item)
+            futures[future] = index
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_EXCEPTION)
+            failed = sorted(
+                (futures[f], f.exception()) for f in done if f.exception() is not None
+            )
+            if failed:
+                cancelled.set()
+                index, error = failed[0]
+                if not isinstance(error, Exception):
+                    raise error
+                raise TaskError(index, error) from error
+            try:
+                check_cancelled()
+            except BaseException:
+                cancelled.set()
+                raise
+
+        results = [None] * len(items)
+        for future, index in futures.items():
+            results[index] = future.result()
+        return results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,134 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds between checks of a cancellation that is not signalled directly,
+# e.g. a passed deadline or a cancel request recorded by another process
+CANCEL_POLL_INTERVAL = 0.25
+# Requests never get a timeout shorter than this, so a nearly spent
+# deadline fails the request instead of sending one that cannot finish
+MIN_REQUEST_TIMEOUT = 1.0
+
+_token = contextvars.ContextVar("cancel_token", default=None)
+
+
+class Cancelled(BaseException):
+    """Raised inside a run that was cancelled.
+
+    Like KeyboardInterrupt it is not an Exception, so the agents' error
+    handling, which turns failures into empty results, lets it through and
+    the whole run stops.
+    """
+
+
+class DeadlineExceeded(Cancelled):
+    """Raised inside a run or stage that ran past its deadline."""
+
+
+class CancelToken:
+    """Cancellation state of a run or stage, shared by every thread working for it.
+
+    A token is cancelled by cancel(), by its parent, once its deadline has
+    passed or when poll() returns a reason. poll lets a cancel request come
+    from somewhere that cannot call cancel(), such as a job store written by
+    another process; it is called at most every CANCEL_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, timeout: float = None, parent=None, poll=None, label: str = "the run"):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.parent = parent
+        self.label = label
+        self.reason = None
+        self.kind = Cancelled
+        self._poll = poll
+        self._polled = 0.0
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str = "The run was cancelled", kind=Cancelled):
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+                self.kind = kind
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.parent is not None and self.parent.cancelled:
+            self.cancel(self.parent.reason, self.parent.kind)
+        elif self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(f"{self.label[:1].upper()}{self.label[1:]} ran past its deadline of {self.timeout:g}s",
+                        DeadlineExceeded)
+        elif self._poll is not None and time.monotonic() - self._polled >= CANCEL_POLL_INTERVAL:
+            self._polled = time.monotonic()
+            reason = self._poll()
+            if reason:
+                self.cancel(reason)
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds until the nearest deadline of this token or its parents, None without one."""
+        remaining = self.deadline - time.monotonic() if self.deadline is not None else None
+        inherited = self.parent.remaining() if self.parent is not None else None
+        if remaining is None or (inherited is not None and inherited < remaining):
+            return inherited
+        return remaining
+
+    def check(self):
+        if self.cancelled:
+            raise self.kind(self.reason)
+
+    def sleep(self, seconds: float):
+        """Sleep for seconds, raising as soon as the token is cancelled."""
+        end = time.monotonic() + seconds
+        while True:
+            self.check()
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            self._event.wait(min(left, CANCEL_POLL_INTERVAL))
+
+
+@contextmanager
+def cancel_scope(timeout: float = None, poll=None, label: str = "the run"):
+    """Run the block under a new CancelToken and yield it.
+
+    The token is cancelled together with the one of the enclosing scope, so
+    cancelling a run stops all of its stages. Threads started through
+    utils.concurrency inherit the scope.
+    """
+    token = CancelToken(timeout, _token.get(), poll, label)
+    reset = _token.set(token)
+    try:
+        yield token
+    finally:
+        _token.reset(reset)
+
+
+def check_cancelled():
+    """Raise Cancelled (or DeadlineExceeded) if the calling scope has been cancelled."""
+    token = _token.get()
+    if token is not None:
+        token.check()
+
+
+def sleep(seconds: float):
+    """time.sleep that stops with Cancelled as soon as the calling scope is cancelled."""
+    token = _token.get()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+
+def request_timeout():
+    """Timeout for a request sent now: what is left of the nearest deadline, None without one."""
+    token = _token.get()
+    remaining = token.remaining() if token is not None else None
+    if remaining is None:
+        return None
+    return max(MIN_REQUEST_TIMEOUT, remaining)
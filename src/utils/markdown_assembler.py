@@ -0,0 +1,140 @@
+import re
+
+from utils.minhash import LSHIndex, MinHasher, shingles
+
+# Paragraphs whose estimated word 3-gram overlap reaches this are treated as repeats
+DUPLICATE_THRESHOLD = 0.6
+SHINGLE_WORDS = 3
+# Short lines such as "Thank you for reading." are legitimately repeated and never deduplicated
+MIN_DEDUP_WORDS = 8
+# 16 bands of 3 rows: paragraphs at the 0.6 threshold share a band with
+# probability about 0.98, at 0.3 with about 0.35, so repeats are rarely
+# missed and few candidates are compared
+DEDUP_NUM_PERM = 48
+DEDUP_BANDS = 16
+# Headings that frame the whole post. Chunks written separately each tend to
+# open or close with one, so only the first of each is kept; other headings
+# may repeat, e.g. an "Example" in two sections
+FRAMING_HEADINGS = {
+    "introduction", "intro", "overview", "background", "summary", "conclusion", "conclusions", "in conclusion",
+    "final thoughts", "closing thoughts", "key takeaways", "takeaways", "wrap up", "wrapping up",
+}
+
+_HEADING = re.compile(r"^(#{1,6})\s*(.*?)\s*#*\s*$")
+
+
+class MarkdownAssembler:
+    """Build one markdown document from blog sections as they arrive.
+
+    Each add() makes a single pass over the new section's lines:
+    - headings get exactly one blank line around them;
+    - only the first section may carry a level-1 title, and later ones are
+      demoted to "##";
+    - a heading that repeats the title or an earlier framing heading (a
+      second "Introduction" or "Conclusion") is dropped, while other
+      repeated headings are kept;
+    - paragraphs that nearly repeat an earlier paragraph, found by MinHash
+      signatures with an LSH index, are dropped;
+    - a heading whose paragraphs were all dropped is dropped with them.
+
+    The work done is linear in the size of the output.
+    """
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD, hasher: MinHasher = None):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher(num_perm=DEDUP_NUM_PERM)
+        self.index = LSHIndex(num_perm=self.hasher.num_perm, bands=DEDUP_BANDS)
+        self.parts = []
+        self.dropped_paragraphs = 0
+        self.dropped_headings = 0
+        self._headings = set()
+        self._title = None
+        self._sections = 0
+        self._pending_heading = None
+        self._pending_lost_content = False
+
+    def add(self, section: str) -> str:
+        """Append a section and return the normalised markdown it added."""
+        added = []
+        paragraph = []
+        in_fence = False
+        first_section = self._sections == 0
+        self._sections += 1
+
+        def flush():
+            if paragraph:
+                self._add_paragraph("\n".join(paragraph), added)
+                paragraph.clear()
+
+        for line in section.splitlines():
+            stripped = line.strip()
+            if stripped.startswith(("```", "~~~")):
+                in_fence = not in_fence
+            if in_fence or stripped.startswith(("```", "~~~")):
+                # Code is copied as is, blank lines and "#" comments included
+                paragraph.append(line.rstrip())
+                continue
+            match = _HEADING.match(stripped)
+            if match and match.group(2):
+                flush()
+                level = len(match.group(1))
+                if level == 1 and not (first_section and not self._headings):
+                    level = 2
+                if level == 1:
+                    self._title = heading_key(match.group(2))
+                self._add_heading(level, match.group(2), added)
+            elif stripped:
+                paragraph.append(line.rstrip())
+            else:
+                flush()
+        flush()
+        return "".join(added)
+
+    def _add_heading(self, level: int, title: str, added: list):
+        key = heading_key(title)
+        if key in self._headings and (key in FRAMING_HEADINGS or key == self._title):
+            self.dropped_headings += 1
+            return
+        self._headings.add(key)
+        if self._pending_heading is not None and not self._pending_lost_content:
+            # A heading directly followed by a subheading, e.g. the title
+            self._emit(self._pending_heading, added)
+        self._pending_heading = f"{'#' * level} {title}"
+        self._pending_lost_content = False
+
+    def _add_paragraph(self, text: str, added: list):
+        if len(text.split()) >= MIN_DEDUP_WORDS:
+            signature = self.hasher.signature(shingles(text, SHINGLE_WORDS))
+            if self.index.query(signature, self.threshold):
+                self.dropped_paragraphs += 1
+                self._pending_lost_content = self._pending_heading is not None
+                return
+            self.index.add(len(self.index.signatures), signature)
+        if self._pending_heading is not None:
+            self._emit(self._pending_heading, added)
+            self._pending_heading = None
+        self._emit(text, added)
+
+    def _emit(self, block: str, added: list):
+        piece = ("\n\n" if self.parts else "") + block
+        self.parts.append(piece)
+        added.append(piece)
+
+    def text(self) -> str:
+        """The document so far, including a trailing heading that is still waiting for content."""
+        if self._pending_heading is not None and not self._pending_lost_content:
+            self._emit(self._pending_heading, [])
+            self._pending_heading = None
+        return "".join(self.parts)
+
+
+def heading_key(title: str) -> str:
+    """The heading text lower-cased, without punctuation or a leading number such as "2."."""
+    return re.sub(r"^(\d+ )+", "", re.sub(r"\W+", " ", title.lower()).strip())
+
+
+def assemble(sections) -> str:
+    assembler = MarkdownAssembler()
+    for section in sections:
+        assembler.add(section)
+    return assembler.text()
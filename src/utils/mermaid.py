@@ -0,0 +1,133 @@
+import re
+
+DIAGRAM_TYPES = (
+    "flowchart", "graph", "sequenceDiagram", "classDiagram", "stateDiagram-v2", "stateDiagram", "erDiagram",
+    "gantt", "pie", "journey", "mindmap", "timeline", "quadrantChart", "gitGraph", "requirementDiagram",
+    "xychart-beta", "sankey-beta", "block-beta",
+)
+FLOWCHART_DIRECTIONS = ("TB", "TD", "BT", "RL", "LR")
+SEQUENCE_BLOCKS = ("loop", "alt", "opt", "par", "rect", "critical", "break")
+SEQUENCE_KEYWORDS = SEQUENCE_BLOCKS + (
+    "else", "and", "end", "participant", "actor", "note", "activate", "deactivate", "autonumber", "title",
+    "box", "create", "destroy", "option",
+)
+
+_BRACKETS = {")": "(", "]": "[", "}": "{"}
+_FENCE = re.compile(r"^```(?:mermaid)?\s*|\s*```$")
+_SEQUENCE_MESSAGE = re.compile(r"^[^\s:>-][^:>]*?\s*(->>|-->>|->|-->|-x|--x|-\)|--\))[+-]?\s*[^:]+:")
+_PIE_SLICE = re.compile(r'^"[^"]+"\s*:\s*-?\d+(\.\d+)?$')
+_BAD_FLOW_ARROW = re.compile(r"(?<![-=.<>ox])->(?!>)")
+
+
+def strip_fences(code: str) -> str:
+    return _FENCE.sub("", code.strip()).strip()
+
+
+def _statements(code: str) -> list:
+    """(line number, text) of every line that is neither blank nor a %% comment."""
+    return [(number, line.strip()) for number, line in enumerate(code.splitlines(), 1)
+            if line.strip() and not line.strip().startswith("%%")]
+
+
+def _check_brackets(statements: list) -> list:
+    errors = []
+    stack = []
+    for number, line in statements:
+        in_quotes = False
+        for char in line:
+            if char == '"':
+                in_quotes = not in_quotes
+            elif in_quotes:
+                continue
+            elif char in "([{":
+                stack.append((char, number))
+            elif char in _BRACKETS:
+                if not stack or stack[-1][0] != _BRACKETS[char]:
+                    errors.append(f"line {number}: unmatched '{char}'")
+                    return errors
+                stack.pop()
+        if in_quotes:
+            errors.append(f"line {number}: unterminated string")
+    if stack:
+        errors.append(f"line {stack[-1][1]}: '{stack[-1][0]}' is never closed")
+    return errors
+
+
+def _check_flowchart(header: str, body: list) -> list:
+    errors = []
+    parts = header.split()
+    if len(parts) > 1 and parts[1] not in FLOWCHART_DIRECTIONS:
+        errors.append(f"line 1: unknown direction '{parts[1]}'")
+    depth = 0
+    for number, line in body:
+        keyword = line.split()[0]
+        if keyword == "subgraph":
+            depth += 1
+        elif keyword == "end":
+            depth -= 1
+            if depth < 0:
+                errors.append(f"line {number}: 'end' without a subgraph")
+                depth = 0
+        elif _BAD_FLOW_ARROW.search(re.sub(r'"[^"]*"|\[[^\]]*\]|\([^)]*\)|\{[^}]*\}|\|[^|]*\|', "", line)):
+            errors.append(f"line {number}: flowchart links use '-->', not '->'")
+    if depth > 0:
+        errors.append(f"{depth} subgraph(s) without 'end'")
+    return errors
+
+
+def _check_sequence(body: list) -> list:
+    errors = []
+    depth = 0
+    for number, line in body:
+        keyword = line.split()[0].rstrip(":")
+        if keyword.lower() in SEQUENCE_BLOCKS:
+            depth += 1
+        elif keyword == "end":
+            depth -= 1
+            if depth < 0:
+                errors.append(f"line {number}: 'end' without an open block")
+                depth = 0
+        elif keyword.lower() in SEQUENCE_KEYWORDS:
+            continue
+        elif not _SEQUENCE_MESSAGE.match(line):
+            errors.append(f"line {number}: expected 'A->>B: message', got '{line[:40]}'")
+    if depth > 0:
+        errors.append(f"{depth} block(s) without 'end'")
+    return errors
+
+
+def _check_pie(body: list) -> list:
+    return [f"line {number}: expected '\"label\" : value', got '{line[:40]}'"
+            for number, line in body
+            if not (line.startswith("title") or line == "showData" or _PIE_SLICE.match(line))]
+
+
+def validate_mermaid(code: str) -> list:
+    """Syntax errors found in a Mermaid diagram; an empty list means it looks valid.
+
+    This is a local approximation of the Mermaid parser: it recognises the
+    diagram type and checks brackets, quotes and block nesting everywhere,
+    plus the statement syntax of flowcharts, sequence diagrams and pie charts.
+    """
+    if not isinstance(code, str) or not code.strip():
+        return ["diagram is empty"]
+    statements = _statements(strip_fences(code))
+    if not statements:
+        return ["diagram is empty"]
+    header_number, header = statements[0]
+    diagram_type = next((kind for kind in DIAGRAM_TYPES
+                         if header == kind or header.startswith(kind + " ")), None)
+    if diagram_type is None:
+        return [f"line {header_number}: unknown diagram type '{header.split()[0]}'"]
+    body = statements[1:]
+    if not body and diagram_type != "pie":
+        return ["diagram has no content"]
+
+    errors = _check_brackets(statements)
+    if diagram_type in ("flowchart", "graph"):
+        errors += _check_flowchart(header, body)
+    elif diagram_type == "sequenceDiagram":
+        errors += _check_sequence(body)
+    elif diagram_type == "pie":
+        errors += _check_pie(body)
+    return errors
@@ -0,0 +1,349 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.deadlines import Cancelled
+
+# Estimated USD per million tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4": (30.0, 30.0, 60.0),
+    "gpt-4-turbo": (10.0, 10.0, 30.0),
+    "gpt-4o": (2.5, 1.25, 10.0),
+    "gpt-4o-mini": (0.15, 0.075, 0.6),
+    "chatgpt-4o-latest": (5.0, 5.0, 15.0),
+}
+
+LATENCY_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH")
+
+_stage = contextvars.ContextVar("metrics_stage", default="unknown")
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    return ((prompt_tokens - cached_tokens) * input_price
+            + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+
+
+class CallRecord:
+    """Everything measured about one chat completion request."""
+
+    def __init__(self, model: str, streamed: bool = False):
+        self.stage = _stage.get()
+        self.model = model
+        self.streamed = streamed
+        self.started = time.perf_counter()
+        self.wall_seconds = 0.0
+        self.queue_seconds = 0.0
+        self.retries = 0
+        self.cache_hit = False
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.finish_reason = None
+        self.error = None
+
+    def add_usage(self, usage):
+        if usage is None:
+            return
+        self.prompt_tokens = usage.prompt_tokens or 0
+        self.completion_tokens = usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+
+    @property
+    def cost(self) -> float:
+        if self.cache_hit:
+            return 0.0
+        return estimate_cost(self.model, self.prompt_tokens, self.completion_tokens, self.cached_tokens)
+
+    def as_dict(self) -> dict:
+        return {
+            "type": "call",
+            "stage": self.stage,
+            "model": self.model,
+            "streamed": self.streamed,
+            "cache_hit": self.cache_hit,
+            "wall_seconds": round(self.wall_seconds, 4),
+            "queue_seconds": round(self.queue_seconds, 4),
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "finish_reason": self.finish_reason,
+            "cost_usd": round(self.cost, 6),
+            "error": self.error,
+        }
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def inc(self, name: str, labels: dict, value: float = 1.0, help_text: str = ""):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, (help_text, "counter"))
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: dict, value: float, help_text: str = ""):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, (help_text, "histogram"))
+            series = self._histograms.setdefault(name, {})
+            buckets, total, count = series.get(key, ([0] * len(LATENCY_BUCKETS), 0.0, 0))
+            buckets = [b + (1 if value <= bound else 0) for b, bound in zip(buckets, LATENCY_BUCKETS)]
+            series[key] = (buckets, total + value, count + 1)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                help_text, kind = self._help[name]
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                help_text, kind = self._help[name]
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for key, (buckets, total, count) in sorted(series.items()):
+                    for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{_labels(key + (('le', f'{bound:g}'),))} {bucket}")
+                    lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_labels(key)} {total:g}")
+                    lines.append(f"{name}_count{_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key) -> str:
+    if not key:
+        return ""
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in key
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class RunTrace:
+    """Structured record of the stages and API calls of one pipeline run."""
+
+    def __init__(self, run_id: str = None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+
+    def stage_summary(self) -> list:
+        """Per-stage wall time, queue time, tokens and cost, in the order the stages ran."""
+        summary = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            row = summary.setdefault(span["stage"], {
+                "stage": span["stage"], "wall_seconds": 0.0, "calls": 0, "cache_hits": 0, "queue_seconds": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "retries": 0, "cost_usd": 0.0,
+            })
+            if span["type"] == "stage":
+                row["wall_seconds"] = span["wall_seconds"]
+                continue
+            if span["type"] == "reuse":
+                row["chunks_reused"] = row.get("chunks_reused", 0) + span["reused"]
+                row["chunks_total"] = row.get("chunks_total", 0) + span["total"]
+                continue
+            if span["type"] == "quality":
+                row["sections_failed"] = row.get("sections_failed", 0) + span["failed"]
+                row["sections_rewritten"] = row.get("sections_rewritten", 0) + span["rewritten"]
+                row["sections_fixed"] = row.get("sections_fixed", 0) + span["fixed"]
+                continue
+            if span["type"] == "notice":
+                row["notices"] = row.get("notices", 0) + 1
+                continue
+            row["calls"] += 1
+            row["cache_hits"] += int(span["cache_hit"])
+            for field in ("queue_seconds", "prompt_tokens", "completion_tokens", "cached_tokens",
+                          "retries", "cost_usd"):
+                row[field] += span[field]
+        for row in summary.values():
+            row["queue_seconds"] = round(row["queue_seconds"], 3)
+            row["cost_usd"] = round(row["cost_usd"], 6)
+            row["cached_ratio"] = cached_token_ratio(row)
+        return list(summary.values())
+
+    def notices(self) -> list:
+        """(stage, message) of every problem the run recovered from, in the order they happened."""
+        with self._lock:
+            return [(span["stage"], span["message"]) for span in self.spans if span["type"] == "notice"]
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {"run_id": self.run_id, "started_at": self.started_at, "spans": spans,
+                "stages": self.stage_summary(), "notices": self.notices()}
+
+
+def cached_token_ratio(rows) -> float:
+    """Share of prompt tokens the provider served from its prompt cache, for one summary row or several."""
+    if isinstance(rows, dict):
+        rows = [rows]
+    prompt_tokens = sum(row["prompt_tokens"] for row in rows)
+    return round(sum(row["cached_tokens"] for row in rows) / prompt_tokens, 3) if prompt_tokens else 0.0
+
+
+@contextmanager
+def trace_run(run_id: str = None):
+    """Collect a RunTrace for everything executed inside the block.
+
+    When TRACE_LOG_PATH is set the finished trace is appended to that file
+    as one JSON line.
+    """
+    trace = RunTrace(run_id)
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        if TRACE_LOG_PATH:
+            with open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace.as_dict()) + "\n")
+
+
+@contextmanager
+def stage_scope(stage: str):
+    """Attribute the API calls made inside the block to stage and time the stage."""
+    token = _stage.set(stage)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Cancelled:
+        status = "cancelled"
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _stage.reset(token)
+        record_stage(stage, time.perf_counter() - started, status)
+
+
+def record_stage(stage: str, seconds: float, status: str = "ok"):
+    labels = {"stage": stage}
+    REGISTRY.observe("pipeline_stage_seconds", labels, seconds, "Wall time of pipeline stages")
+    REGISTRY.inc("pipeline_stages_total", {**labels, "status": status}, help_text="Pipeline stages run")
+    trace = _trace.get()
+    if trace is not None:
+        trace.add({"type": "stage", "stage": stage, "status": status, "wall_seconds": round(seconds, 4)})
+
+
+def record_call(record: CallRecord):
+    labels = {"stage": record.stage, "model": record.model}
+    REGISTRY.inc("llm_requests_total",
+                 {**labels, "cache": "hit" if record.cache_hit else "miss",
+                  "finish_reason": record.finish_reason or ("error" if record.error else "unknown")},
+                 help_text="Chat completion requests")
+    REGISTRY.observe("llm_request_seconds", labels, record.wall_seconds, "Wall time of chat completion requests")
+    if not record.cache_hit:
+        REGISTRY.observe("llm_queue_seconds", labels, record.queue_seconds,
+                         "Time requests waited for the rate limiter")
+        for kind, value in (("prompt", record.prompt_tokens), ("completion", record.completion_tokens),
+                            ("cached", record.cached_tokens)):
+            REGISTRY.inc("llm_tokens_total", {**labels, "kind": kind}, value, "Tokens billed by the API")
+        REGISTRY.inc("llm_retries_total", labels, record.retries, "Retried requests")
+        REGISTRY.inc("llm_cost_usd_total", labels, record.cost, "Estimated spend in USD")
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(record.as_dict())
+
+
+def record_chunk_reuse(reused: int, total: int):
+    """Count blog chunks taken from an earlier run instead of being generated again."""
+    stage = _stage.get()
+    REGISTRY.inc("blog_chunks_total", {"stage": stage, "source": "reused"}, reused, "Blog chunks by origin")
+    REGISTRY.inc("blog_chunks_total", {"stage": stage, "source": "generated"}, total - reused, "Blog chunks by origin")
+    trace = _trace.get()
+    if trace is not None:
+        trace.add({"type": "reuse", "stage": stage, "reused": reused, "total": total})
+
+
+def record_section_quality(total: int, failed: int, rewritten: int, fixed: int):
+    """Count blog sections that failed the local quality checks and how many rewrites fixed."""
+    stage = _stage.get()
+    for result, value in (("passed", total - failed), ("failed", failed)):
+        REGISTRY.inc("blog_sections_checked_total", {"stage": stage, "result": result}, value,
+                     "Blog sections checked for quality")
+    REGISTRY.inc("blog_sections_rewritten_total", {"stage": stage, "result": "fixed"}, fixed,
+                 "Blog sections rewritten after failing the quality checks")
+    REGISTRY.inc("blog_sections_rewritten_total", {"stage": stage, "result": "kept_original"}, rewritten - fixed,
+                 "Blog sections rewritten after failing the quality checks")
+    trace = _trace.get()
+    if trace is not None:
+        trace.add({"type": "quality", "stage": stage, "total": total, "failed": failed,
+                   "rewritten": rewritten, "fixed": fixed})
+
+
+def record_notice(message: str):
+    """Keep a problem the current stage recovered from, e.g. a fallback, in the trace so it can be reported.
+
+    Agents run in worker threads and processes without a Streamlit session,
+    so this is how they tell the user about anything short of a failure.
+    """
+    stage = _stage.get()
+    REGISTRY.inc("pipeline_notices_total", {"stage": stage}, help_text="Problems pipeline stages recovered from")
+    trace = _trace.get()
+    if trace is not None:
+        trace.add({"type": "notice", "stage": stage, "message": message})
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Serve /metrics on a background thread; later calls reuse the running server."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
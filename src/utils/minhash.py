@@ -0,0 +1,80 @@
+import random
+import re
+import zlib
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN = re.compile(r"\w+")
+
+DEFAULT_NUM_PERM = 32
+DEFAULT_BANDS = 8
+
+
+def shingles(text: str, size: int = 5) -> set:
+    """Word n-grams of the lower-cased text; short texts become a single shingle."""
+    tokens = _TOKEN.findall(text.lower())
+    if len(tokens) <= size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+class MinHasher:
+    """Fixed-length MinHash signatures whose agreement estimates Jaccard similarity.
+
+    The permutations come from a seeded generator, so signatures made by
+    different processes (or stored earlier) stay comparable.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._permutations = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                              for _ in range(num_perm)]
+
+    def signature(self, features: set) -> tuple:
+        hashes = [zlib.crc32(feature.encode("utf-8")) for feature in features]
+        if not hashes:
+            return (_MAX_HASH,) * self.num_perm
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+                     for a, b in self._permutations)
+
+
+def similarity(first: tuple, second: tuple) -> float:
+    """Estimated Jaccard similarity of the sets behind two signatures."""
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+class LSHIndex:
+    """Locality-sensitive hashing over MinHash signatures.
+
+    Signatures are cut into bands; two items become candidates when any band
+    matches exactly, so a lookup touches only likely duplicates instead of
+    every stored item.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+
+    def band_keys(self, signature: tuple) -> list:
+        return [signature[band * self.rows:(band + 1) * self.rows] for band in range(self.bands)]
+
+    def add(self, key, signature: tuple):
+        self.signatures[key] = signature
+        for bucket, band in zip(self._buckets, self.band_keys(signature)):
+            bucket.setdefault(band, []).append(key)
+
+    def candidates(self, signature: tuple) -> set:
+        found = set()
+        for bucket, band in zip(self._buckets, self.band_keys(signature)):
+            found.update(bucket.get(band, ()))
+        return found
+
+    def query(self, signature: tuple, threshold: float) -> list:
+        """(key, similarity) of stored items at least threshold similar, most similar first."""
+        matches = [(key, similarity(signature, self.signatures[key])) for key in self.candidates(signature)]
+        return sorted((match for match in matches if match[1] >= threshold), key=lambda match: -match[1])
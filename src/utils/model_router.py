@@ -0,0 +1,248 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from config.models import load_routes
+from utils.concurrency import thread_pool
+from utils.deadlines import CANCEL_POLL_INTERVAL, cancel_scope, check_cancelled
+from utils.metrics import REGISTRY
+from utils.prompt_assembly import continuation_messages
+from utils.streaming import StreamCollector, stream_chat_completion
+from utils.tokens import PromptTooLong, output_room, plan_max_tokens
+
+
+@dataclass(frozen=True)
+class Route:
+    """The models a stage tries in order, the quality gates between them and its time limits."""
+
+    stage: str
+    models: tuple
+    min_words: int = 0
+    timeout: float = None
+    hedge_after: float = 0
+
+    @property
+    def primary(self) -> str:
+        return self.models[0]
+
+
+# A continuation is only sent while at least this many tokens of the
+# context window are left for it; a shorter one would mostly repeat itself
+MIN_CONTINUATION_TOKENS = 512
+
+_routes = None
+_routes_lock = threading.Lock()
+_hedging = contextvars.ContextVar("hedged_requests", default=False)
+
+
+@contextmanager
+def hedged_requests(enabled: bool = True):
+    """Hedge the non-streamed requests made inside the block (see complete_with_route)."""
+    token = _hedging.set(enabled)
+    try:
+        yield
+    finally:
+        _hedging.reset(token)
+
+
+def get_route(stage: str) -> Route:
+    global _routes
+    with _routes_lock:
+        if _routes is None:
+            _routes = load_routes()
+    config = _routes.get(stage)
+    if config is None:
+        raise ValueError(f"No model route configured for stage '{stage}'")
+    return Route(stage, tuple(config["models"]), int(config.get("min_words", 0)),
+                 config.get("timeout"), float(config.get("hedge_after") or 0))
+
+
+def route_request(request: dict, model: str) -> dict:
+    """The request sent to model, with max_tokens clamped to what that model accepts."""
+    routed = {**request, "model": model}
+    if request.get("max_tokens"):
+        routed["max_tokens"] = plan_max_tokens(request["messages"], model, request["max_tokens"])
+    return routed
+
+
+def continuation_request(request: dict, partial: str):
+    """A request that resumes the truncated answer partial instead of starting over.
+
+    None when the original prompt and partial leave fewer than
+    MIN_CONTINUATION_TOKENS for the continuation.
+    """
+    messages = continuation_messages(request["messages"], partial)
+    room = output_room(messages, request["model"])
+    if room < MIN_CONTINUATION_TOKENS:
+        return None
+    continued = {**request, "messages": messages}
+    if request.get("max_tokens"):
+        continued["max_tokens"] = min(request["max_tokens"], room)
+    return continued
+
+
+def quality_problem(route: Route, content: str, finish_reason: str, check=None) -> str:
+    """Why an answer should go to the next model, or None when it passes.
+
+    check(content) may return a description of what is wrong with the
+    answer, e.g. a JSON schema error.
+    """
+    if finish_reason == "length":
+        return "truncated"
+    if len((content or "").split()) < route.min_words:
+        return "too_short"
+    if check is not None and check(content or ""):
+        return "check_failed"
+    return None
+
+
+def record_escalation(stage: str, model: str, reason: str):
+    REGISTRY.inc("llm_escalations_total", {"stage": stage, "model": model, "reason": reason},
+                 help_text="Answers passed on to a stronger model")
+
+
+def record_continuation(stage: str, model: str):
+    REGISTRY.inc("llm_continuations_total", {"stage": stage, "model": model},
+                 help_text="Requests that resumed an answer cut off by the length limit")
+
+
+def record_hedge(stage: str, model: str, winner: str):
+    REGISTRY.inc("llm_hedged_requests_total", {"stage": stage, "model": model, "winner": winner},
+                 help_text="Requests duplicated because the first copy was slow, by the copy that answered")
+
+
+def _attempt(send, tokens: list):
+    with cancel_scope() as token:
+        tokens.append(token)
+        return send()
+
+
+def _hedged(send, stage: str, model: str, hedge_after: float):
+    """send(), and once more if the first call has not answered after hedge_after seconds; the first answer wins.
+
+    The copy that loses is cancelled: it leaves the rate limiter queue or
+    stops retrying, though a request already on the wire runs to its end.
+    """
+    executor = thread_pool(2)
+    tokens = []
+    futures = {executor.submit(contextvars.copy_context().run, _attempt, send, tokens): "primary"}
+    started = time.monotonic()
+    hedged = False
+    error = None
+    try:
+        while futures:
+            done, _ = wait(futures, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                copy = futures.pop(future)
+                if future.exception() is None:
+                    if hedged:
+                        record_hedge(stage, model, copy)
+                    return future.result()
+                error = future.exception()
+            check_cancelled()
+            if futures and not hedged and time.monotonic() - started >= hedge_after:
+                futures[executor.submit(contextvars.copy_context().run, _attempt, send, tokens)] = "hedge"
+                hedged = True
+        raise error
+    finally:
+        for token in tokens:
+            token.cancel("Another copy of the request answered first")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _create(client, stage: str, request: dict):
+    hedge_after = get_route(stage).hedge_after
+    if not (_hedging.get() and hedge_after):
+        return client.chat.completions.create(**request)
+    return _hedged(lambda: client.chat.completions.create(**request), stage, request["model"], hedge_after)
+
+
+def _complete(client, stage: str, request: dict, max_continuations: int):
+    """(content, finish_reason) of request, resuming up to max_continuations times while it is truncated."""
+    response = _create(client, stage, request)
+    content = response.choices[0].message.content or ""
+    finish_reason = response.choices[0].finish_reason
+    for _ in range(max_continuations):
+        continued = continuation_request(request, content) if finish_reason == "length" else None
+        if continued is None:
+            break
+        record_continuation(stage, request["model"])
+        response = _create(client, stage, continued)
+        content += response.choices[0].message.content or ""
+        finish_reason = response.choices[0].finish_reason
+    return content, finish_reason
+
+
+def complete_with_route(client, stage: str, request: dict, check=None, start: int = 0,
+                        max_continuations: int = 0) -> str:
+    """Send request to the stage's models in order until an answer passes the quality gates.
+
+    Returns the answer of the first model that passes, or of the last model
+    if none does. start skips the models already tried. An answer cut off by
+    the length limit is first resumed up to max_continuations times, which
+    is cheaper than asking the next model for the whole answer again, as
+    long as the context window has room for it; after that the truncated
+    answer escalates. A model whose context window cannot hold the prompt
+    is skipped. Inside hedged_requests() a request still unanswered after the route's
+    hedge_after seconds is sent a second time and the first answer is used,
+    which trims the slowest calls at the price of some duplicate spend.
+    """
+    route = get_route(stage)
+    models = route.models[start:] or route.models[-1:]
+    for position, model in enumerate(models):
+        try:
+            routed = route_request(request, model)
+        except PromptTooLong:
+            if position == len(models) - 1:
+                raise
+            record_escalation(stage, model, "prompt_too_long")
+            continue
+        content, finish_reason = _complete(client, stage, routed, max_continuations)
+        problem = quality_problem(route, content, finish_reason, check)
+        if problem is None or position == len(models) - 1:
+            return content
+        record_escalation(stage, model, problem)
+
+
+def _stream(client, stage: str, request: dict):
+    """Yield the deltas of a streamed request and return (content, finish_reason)."""
+    parts = []
+    stream = StreamCollector(stream_chat_completion(client, stage, **request))
+    for delta in stream:
+        parts.append(delta)
+        yield delta
+    return "".join(parts), stream.value
+
+
+def stream_with_route(client, stage: str, request: dict, check=None, max_continuations: int = 0):
+    """Stream the answer of the stage's first model, escalating if it fails the quality gates.
+
+    Yields the first model's text deltas, including those of any
+    continuations, and returns the final answer. When that answer fails, the
+    remaining models are asked without streaming and the answer that
+    replaces it is returned, not yielded.
+    """
+    route = get_route(stage)
+    try:
+        routed = route_request(request, route.primary)
+    except PromptTooLong:
+        if len(route.models) == 1:
+            raise
+        record_escalation(stage, route.primary, "prompt_too_long")
+        return complete_with_route(client, stage, request, check, start=1, max_continuations=max_continuations)
+    content, finish_reason = yield from _stream(client, stage, routed)
+    for _ in range(max_continuations):
+        continued = continuation_request(routed, content) if finish_reason == "length" else None
+        if continued is None:
+            break
+        record_continuation(stage, routed["model"])
+        more, finish_reason = yield from _stream(client, stage, continued)
+        content += more
+    problem = quality_problem(route, content, finish_reason, check)
+    if problem is None or len(route.models) == 1:
+        return content
+    record_escalation(stage, route.primary, problem)
+    return complete_with_route(client, stage, request, check, start=1, max_continuations=max_continuations)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.minhash import MinHasher, similarity, shingles
+
+NEWSLETTER_INDEX_PATH = os.environ.get("NEWSLETTER_INDEX_PATH", os.path.join(".cache", "newsletters.sqlite3"))
+# Estimated Jaccard similarity of word 5-grams above which a newsletter counts as a re-send
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+DEFAULT_MAX_RUNS = 50000
+SHINGLE_WORDS = 5
+# 16 bands of 4 rows: pairs at 0.8 similarity share a band with probability
+# above 0.99, pairs at 0.3 with about 0.12, so few candidates are compared
+INDEX_NUM_PERM = 64
+INDEX_BANDS = 16
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def newsletter_digest(newsletter: str) -> str:
+    return hashlib.sha256(" ".join(newsletter.lower().split()).encode("utf-8")).hexdigest()
+
+
+def _band_key(band: int, rows: tuple) -> int:
+    digest = hashlib.blake2b(f"{band}:{','.join(map(str, rows))}".encode("ascii"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class NewsletterIndex:
+    """Processed newsletters and their outputs, searchable for near duplicates.
+
+    Every run stores the MinHash signature of the newsletter with one
+    indexed row per LSH band. A lookup reads only the runs that share a band
+    with the new newsletter, so it takes a few indexed queries no matter how
+    many runs are stored. Only the newest max_runs runs are kept.
+    """
+
+    def __init__(self, path: str = NEWSLETTER_INDEX_PATH, max_runs: int = DEFAULT_MAX_RUNS):
+        self.path = path
+        self.max_runs = max_runs
+        self.hasher = MinHasher(num_perm=INDEX_NUM_PERM)
+        self.rows = INDEX_NUM_PERM // INDEX_BANDS
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " digest TEXT NOT NULL,"
+            " signature TEXT NOT NULL,"
+            " label TEXT,"
+            " context TEXT NOT NULL,"
+            " results TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS runs_digest ON runs (digest)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS bands (key INTEGER NOT NULL, run_id INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands (key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_run_id ON bands (run_id)")
+        self._conn.commit()
+
+    def signature(self, newsletter: str) -> tuple:
+        return self.hasher.signature(shingles(newsletter, SHINGLE_WORDS))
+
+    def band_keys(self, signature: tuple) -> list:
+        return [_band_key(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(INDEX_BANDS)]
+
+    def add(self, newsletter: str, context: str, results: dict, label: str = None) -> int:
+        """Store a finished run; an earlier run of the same text is replaced."""
+        digest = newsletter_digest(newsletter)
+        signature = self.signature(newsletter)
+        with self._lock:
+            self._delete("SELECT id FROM runs WHERE digest = ?", (digest,))
+            cursor = self._conn.execute(
+                "INSERT INTO runs (digest, signature, label, context, results, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, json.dumps(signature), label, context, json.dumps(results), time.time())
+            )
+            run_id = cursor.lastrowid
+            self._conn.executemany("INSERT INTO bands (key, run_id) VALUES (?, ?)",
+                                   [(key, run_id) for key in self.band_keys(signature)])
+            self._prune()
+            self._conn.commit()
+        return run_id
+
+    def find(self, newsletter: str, threshold: float = NEAR_DUPLICATE_THRESHOLD) -> dict:
+        """The most similar stored run at least threshold similar, without its outputs; None if there is none.
+
+        The result holds the run's id, label, created_at and similarity.
+        """
+        digest = newsletter_digest(newsletter)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, label, created_at FROM runs WHERE digest = ? ORDER BY id DESC LIMIT 1", (digest,)
+            ).fetchone()
+        if row is not None:
+            return {"run_id": row[0], "label": row[1], "created_at": row[2], "similarity": 1.0}
+
+        signature = self.signature(newsletter)
+        keys = self.band_keys(signature)
+        with self._lock:
+            candidates = self._conn.execute(
+                "SELECT id, label, created_at, signature FROM runs WHERE id IN"
+                f" (SELECT run_id FROM bands WHERE key IN ({','.join('?' * len(keys))}))",
+                keys
+            ).fetchall()
+        best = None
+        for run_id, label, created_at, stored in candidates:
+            score = similarity(signature, tuple(json.loads(stored)))
+            if score >= threshold and (best is None or score > best["similarity"]):
+                best = {"run_id": run_id, "label": label, "created_at": created_at, "similarity": score}
+        return best
+
+    def get(self, run_id: int) -> dict:
+        """The context and results stored for a run, or None if it has been pruned."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, label, created_at, context, results FROM runs WHERE id = ?", (run_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"run_id": row[0], "label": row[1], "created_at": row[2], "context": row[3],
+                "results": json.loads(row[4])}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def _prune(self):
+        self._delete("SELECT id FROM runs ORDER BY id DESC LIMIT -1 OFFSET ?", (self.max_runs,))
+
+    def _delete(self, select_ids: str, params: tuple):
+        run_ids = [row[0] for row in self._conn.execute(select_ids, params).fetchall()]
+        if run_ids:
+            placeholders = ",".join("?" * len(run_ids))
+            self._conn.execute(f"DELETE FROM bands WHERE run_id IN ({placeholders})", run_ids)
+            self._conn.execute(f"DELETE FROM runs WHERE id IN ({placeholders})", run_ids)
+
+
+def get_newsletter_index() -> NewsletterIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NewsletterIndex()
+        return _index
@@ -1,17 +1,245 @@
+import contextvars
+import json
+import threading
+import time
+
 import openai
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from utils.response_cache import ResponseCache, cache_bypassed, make_cache_key
+from utils.usage import record_usage
+from utils.client_pool import ClientPool
+from utils.rate_limiter import RequestScheduler
+from utils.metrics import CallRecord, record_call
+from utils.output_budget import pin_output_budget
+from utils.deadlines import Cancelled, check_cancelled, request_timeout
+
+_current_api_key = contextvars.ContextVar("openai_api_key", default=None)
+
+
+class _Completions:
+    """Drop-in for `chat.completions` that answers repeated requests from the cache.
+
+    Every request, cached or not, is measured and reported to utils.metrics.
+    Requests sent inside a utils.deadlines scope get what is left of its
+    deadline as their timeout, and streams stop reading once it is cancelled.
+    """
+
+    def __init__(self, lease, cache, scheduler=None):
+        self._lease = lease
+        self._cache = cache
+        self._scheduler = scheduler
+
+    def create(self, use_cache: bool = True, **kwargs):
+        record = CallRecord(kwargs.get("model", ""), streamed=bool(kwargs.get("stream")))
+        if kwargs.get("stream"):
+            # Ask for a final usage event so streamed calls are metered too
+            kwargs["stream_options"] = {"include_usage": True, **(kwargs.get("stream_options") or {})}
+
+        if self._cache is None or not use_cache or cache_bypassed():
+            return self._call(kwargs, record)
+
+        key = make_cache_key(kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            completion = ChatCompletion.model_validate_json(cached)
+            record.cache_hit = True
+            record.finish_reason = completion.choices[0].finish_reason if completion.choices else None
+            _finish(record)
+            if kwargs.get("stream"):
+                return iter([_completion_to_chunk(completion)])
+            return completion
+
+        if kwargs.get("stream"):
+            return self._record_stream(key, kwargs, record)
+        response = self._call(kwargs, record)
+        if response.choices and response.choices[0].finish_reason is not None:
+            self._cache.put(key, response.model_dump_json(), kwargs.get("model", ""))
+        return response
+
+    def _call(self, kwargs, record):
+        if kwargs.get("stream"):
+            return self._stream(kwargs, record)
+        try:
+            with self._lease() as backend:
+                response = self._send(lambda: _create(backend, kwargs), kwargs, record)
+        except (Exception, Cancelled) as e:
+            record.error = str(e)
+            _finish(record)
+            raise
+        record_usage(response.usage)
+        record.add_usage(response.usage)
+        record.finish_reason = response.choices[0].finish_reason if response.choices else None
+        _finish(record)
+        return response
+
+    def _stream(self, kwargs, record):
+        # The client stays leased until the stream has been read to the end
+        try:
+            with self._lease() as backend:
+                stream = self._send(lambda: _create(backend, kwargs), kwargs, record)
+                try:
+                    for event in stream:
+                        check_cancelled()
+                        if getattr(event, "usage", None) is not None:
+                            record_usage(event.usage)
+                            record.add_usage(event.usage)
+                            self._settle(kwargs, event.usage)
+                        if event.choices and event.choices[0].finish_reason:
+                            record.finish_reason = event.choices[0].finish_reason
+                        yield event
+                finally:
+                    # Closing the response aborts the HTTP request of a stream left early
+                    close = getattr(stream, "close", None)
+                    if close is not None:
+                        close()
+        except (Exception, Cancelled) as e:
+            record.error = str(e)
+            raise
+        finally:
+            _finish(record)
+
+    def _send(self, send, kwargs, record):
+        if self._scheduler is None:
+            return send()
+        return self._scheduler.run(kwargs, send, record)
+
+    def _settle(self, kwargs, usage):
+        # A stream reports its usage in the last event, long after the scheduler handed it over
+        if self._scheduler is not None:
+            self._scheduler.settle(kwargs.get("model", ""), self._scheduler.estimate_tokens(kwargs), usage)
+
+    def _record_stream(self, key, kwargs, record):
+        parts = []
+        finish_reason = None
+        last = None
+        for event in self._call(kwargs, record):
+            last = event
+            if event.choices:
+                choice = event.choices[0]
+                if choice.delta.content:
+                    parts.append(choice.delta.content)
+                finish_reason = choice.finish_reason or finish_reason
+            yield event
+
+        # Only streams that ran to completion are worth replaying
+        if last is not None and finish_reason is not None:
+            completion = {
+                "id": last.id,
+                "object": "chat.completion",
+                "created": last.created,
+                "model": last.model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(parts)},
+                    "finish_reason": finish_reason,
+                }],
+            }
+            self._cache.put(key, json.dumps(completion), kwargs.get("model", ""))
+
+
+def _create(backend, kwargs):
+    check_cancelled()
+    timeout = request_timeout()
+    if timeout is not None:
+        kwargs = {**kwargs, "timeout": timeout}
+    return backend.chat.completions.create(**kwargs)
+
+
+def _finish(record):
+    record.wall_seconds = time.perf_counter() - record.started
+    record_call(record)
+
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class CachedClient:
+    """Wraps the OpenAI client so every agent's completions go through the cache.
+
+    lease is a callable returning a context manager that yields the
+    underlying OpenAI client for a single request.
+    """
+
+    def __init__(self, lease, cache=None, scheduler=None):
+        self.cache = cache
+        self.scheduler = scheduler
+        self.chat = _Chat(_Completions(lease, cache, scheduler))
+
+
+def _completion_to_chunk(completion: ChatCompletion) -> ChatCompletionChunk:
+    choice = completion.choices[0]
+    return ChatCompletionChunk.model_validate({
+        "id": completion.id,
+        "object": "chat.completion.chunk",
+        "created": completion.created or int(time.time()),
+        "model": completion.model,
+        "choices": [{
+            "index": 0,
+            "delta": {"role": "assistant", "content": choice.message.content},
+            "finish_reason": choice.finish_reason,
+        }],
+    })
+
 
 class OpenAIClient:
+    """Entry point the agents use to reach the OpenAI API.
+
+    initialize() records the API key for the calling session (a context
+    variable, inherited by threads started through utils.concurrency); the
+    first key initialized also serves threads that carry no session context.
+    Requests are served by a shared ClientPool holding one connection-pooled
+    client per key, after passing the shared RequestScheduler.
+    """
     _instance = None
     client = None
+    cache = None
+    pool = None
+    scheduler = None
+    _default_api_key = None
+    _lock = threading.Lock()
 
     @classmethod
-    def initialize(cls, api_key):
-        if not cls._instance:
-            openai.api_key = api_key
-            cls.client = openai
-            cls._instance = cls()
+    def initialize(cls, api_key, cache=None):
+        with cls._lock:
+            if not cls._instance:
+                cls.pool = ClientPool()
+                cls.cache = cache if cache is not None else ResponseCache()
+                cls.scheduler = RequestScheduler()
+                cls.client = CachedClient(cls.lease, cls.cache, cls.scheduler)
+                cls._default_api_key = api_key
+                cls._instance = cls()
+        _current_api_key.set(api_key)
         return cls._instance
 
+    @classmethod
+    def use_cassette(cls, cassette):
+        """Route every agent's requests through a utils.cassette.Cassette.
+
+        Replay cassettes bypass the response cache and the rate limiter so
+        that timings reflect the pipeline itself; record cassettes still go
+        through the scheduler on their way upstream. The output budget is
+        pinned to its default ratio in both modes, so the max_tokens in the
+        cassette keys does not depend on earlier runs' observations.
+        """
+        pin_output_budget()
+        with cls._lock:
+            scheduler = cls.scheduler if cassette.mode == "record" else None
+            cls.client = CachedClient(cassette.lease, None, scheduler)
+            if not cls._instance:
+                cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def lease(cls):
+        """Borrow the pooled client for the current session's API key."""
+        api_key = _current_api_key.get() or cls._default_api_key
+        if not api_key:
+            raise openai.OpenAIError("OpenAI API key has not been initialized")
+        return cls.pool.lease(api_key)
+
     @classmethod
     def get_client(cls):
-        return cls.client 
\ No newline at end of file
+        return cls.client
@@ -0,0 +1,143 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+
+OUTPUT_BUDGET_PATH = os.environ.get("OUTPUT_BUDGET_PATH", os.path.join(".cache", "output_budget.sqlite3"))
+# Output-to-input ratio assumed until a stage has enough observations
+DEFAULT_RATIO = 2.0
+MIN_OBSERVATIONS = 5
+# Only the most recent answers of a stage are used, so the plan follows prompt changes
+WINDOW = 50
+# The reservation covers this quantile of the observed ratios, times HEADROOM
+QUANTILE = 0.9
+HEADROOM = 1.15
+# Plans are rounded up to a multiple of this, so max_tokens, which is part
+# of the response cache key and the cassette key, only changes when the
+# observed ratios move by a whole step
+PLAN_STEP = 512
+
+_planner = None
+_planner_lock = threading.Lock()
+
+
+class OutputBudgetPlanner:
+    """Plan max_tokens from the output-to-input ratios of earlier answers.
+
+    A fixed guess either cuts answers off or reserves far more than they
+    use, and every reserved token counts against the tokens-per-minute
+    budget of the rate limiter. The ratios are kept in a SQLite file so the
+    plan improves across runs. An answer is only recorded once, so answers
+    replayed from the response cache do not shift the plan.
+    """
+
+    def __init__(self, path: str = OUTPUT_BUDGET_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS output_ratios ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " stage TEXT NOT NULL,"
+            " input_tokens INTEGER NOT NULL,"
+            " output_tokens INTEGER NOT NULL,"
+            " digest TEXT,"
+            " created_at REAL NOT NULL)"
+        )
+        # Files created before answers were recorded only once
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(output_ratios)")}
+        if "digest" not in columns:
+            self._conn.execute("ALTER TABLE output_ratios ADD COLUMN digest TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS output_ratios_stage ON output_ratios (stage, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS output_ratios_digest ON output_ratios (stage, digest)")
+        self._conn.commit()
+
+    def observe(self, stage: str, input_tokens: int, output_tokens: int, answer: str = None):
+        """Record the size of a finished answer, continuations included.
+
+        With answer given, an answer recorded before (e.g. replayed from the
+        response cache) is skipped.
+        """
+        if input_tokens <= 0:
+            return
+        digest = hashlib.sha256(answer.encode("utf-8")).hexdigest() if answer is not None else None
+        with self._lock:
+            if digest is not None and self._conn.execute(
+                "SELECT 1 FROM output_ratios WHERE stage = ? AND digest = ?", (stage, digest)
+            ).fetchone():
+                return
+            self._conn.execute(
+                "INSERT INTO output_ratios (stage, input_tokens, output_tokens, digest, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (stage, input_tokens, output_tokens, digest, time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM output_ratios WHERE stage = ? AND id NOT IN"
+                " (SELECT id FROM output_ratios WHERE stage = ? ORDER BY id DESC LIMIT ?)",
+                (stage, stage, WINDOW)
+            )
+            self._conn.commit()
+
+    def observed_ratio(self, stage: str):
+        """The QUANTILE of the stage's recent ratios, None until MIN_OBSERVATIONS answers were recorded."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT output_tokens * 1.0 / input_tokens FROM output_ratios WHERE stage = ?"
+                " ORDER BY id DESC LIMIT ?",
+                (stage, WINDOW)
+            ).fetchall()
+        if len(rows) < MIN_OBSERVATIONS:
+            return None
+        ratios = sorted(row[0] for row in rows)
+        return ratios[min(len(ratios) - 1, math.ceil(QUANTILE * len(ratios)) - 1)]
+
+    def plan(self, stage: str, input_tokens: int, minimum: int, maximum: int) -> int:
+        ratio = self.observed_ratio(stage)
+        return _plan(input_tokens, DEFAULT_RATIO if ratio is None else ratio * HEADROOM, minimum, maximum)
+
+
+class FixedOutputBudget:
+    """Plans every answer from one fixed ratio and records nothing.
+
+    Used while a cassette is active: max_tokens is part of the cassette key,
+    so a plan that followed the observations stored on one machine would
+    make another machine's replay miss.
+    """
+
+    def __init__(self, ratio: float = DEFAULT_RATIO):
+        self.ratio = ratio
+
+    def observe(self, stage: str, input_tokens: int, output_tokens: int, answer: str = None):
+        pass
+
+    def observed_ratio(self, stage: str):
+        return None
+
+    def plan(self, stage: str, input_tokens: int, minimum: int, maximum: int) -> int:
+        return _plan(input_tokens, self.ratio, minimum, maximum)
+
+
+def _plan(input_tokens: int, ratio: float, minimum: int, maximum: int) -> int:
+    desired = math.ceil(input_tokens * ratio)
+    return max(minimum, min(maximum, math.ceil(desired / PLAN_STEP) * PLAN_STEP))
+
+
+def get_output_budget() -> OutputBudgetPlanner:
+    global _planner
+    with _planner_lock:
+        if _planner is None:
+            _planner = OutputBudgetPlanner()
+        return _planner
+
+
+def pin_output_budget(ratio: float = DEFAULT_RATIO) -> FixedOutputBudget:
+    """Make get_output_budget() return a FixedOutputBudget from now on."""
+    global _planner
+    with _planner_lock:
+        _planner = FixedOutputBudget(ratio)
+        return _planner
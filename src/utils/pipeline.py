@@ -0,0 +1,151 @@
+import contextvars
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from utils.concurrency import thread_pool
+from utils.metrics import stage_scope
+from utils.deadlines import cancel_scope
+
+
+class StageFailed(Exception):
+    """Raised by a stage to stop the pipeline with a user-facing message."""
+
+
+class Stage:
+    """A named pipeline step.
+
+    func receives a dict with the results of every stage finished so far and
+    returns this stage's result. depends_on lists the stages that must finish
+    before this one may start. A stage still running timeout seconds after it
+    started is stopped with utils.deadlines.DeadlineExceeded.
+    """
+
+    def __init__(self, name: str, func, depends_on=(), label: str = "", timeout: float = None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.label = label or name
+        self.timeout = timeout
+
+
+def _run_stage(stage, results):
+    with stage_scope(stage.name), cancel_scope(stage.timeout, label=f"the {stage.name} stage"):
+        return stage.func(results)
+
+
+def run_stages(stages, concurrent: bool = True, max_workers: int = 4,
+               on_stage_start=None, on_stage_done=None) -> dict:
+    """Run stages and return their results keyed by stage name.
+
+    With concurrent=False the stages run one after another in the given order.
+    Otherwise every stage starts as soon as its dependencies have finished.
+    The callbacks are always invoked from the calling thread, so they may
+    update Streamlit elements directly. The first exception raised by a stage
+    cancels the stages that have not started yet, stops the API calls of
+    those still running (see utils.deadlines) and is re-raised. Each stage
+    is timed and its API calls are attributed to it in utils.metrics.
+    """
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        unknown = [dep for dep in stage.depends_on if dep not in names]
+        if unknown:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {', '.join(unknown)}")
+
+    with cancel_scope() as token:
+        try:
+            return _run(stages, concurrent, max_workers, on_stage_start, on_stage_done)
+        except BaseException as e:
+            token.cancel(f"Another stage failed: {e}")
+            raise
+
+
+def _run(stages, concurrent, max_workers, on_stage_start, on_stage_done) -> dict:
+    results = {}
+
+    if not concurrent:
+        for stage in stages:
+            if on_stage_start:
+                on_stage_start(stage)
+            results[stage.name] = _run_stage(stage, dict(results))
+            if on_stage_done:
+                on_stage_done(stage, results[stage.name], dict(results))
+        return results
+
+    pending = list(stages)
+    running = {}
+    executor = thread_pool(max_workers)
+    try:
+        while pending or running:
+            ready = [stage for stage in pending if all(dep in results for dep in stage.depends_on)]
+            if not ready and not running:
+                blocked = ", ".join(stage.name for stage in pending)
+                raise ValueError(f"Stages can never start (circular dependencies): {blocked}")
+
+            for stage in ready:
+                pending.remove(stage)
+                if on_stage_start:
+                    on_stage_start(stage)
+                future = executor.submit(contextvars.copy_context().run, _run_stage, stage, dict(results))
+                running[future] = stage
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                results[stage.name] = future.result()
+                if on_stage_done:
+                    on_stage_done(stage, results[stage.name], dict(results))
+        return results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SectionStream:
+    """Blog sections published by one stage while other stages are still running.
+
+    The producer calls put() as each section is finished, in any order, and
+    close() (or fail()) once it is done. Every consumer iterates the stream
+    independently and receives (index, section) pairs in arrival order; the
+    iteration ends when the stream is closed. Safe to use from any thread.
+    """
+
+    def __init__(self):
+        self._items = []
+        self._closed = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    def put(self, index: int, section: str):
+        with self._condition:
+            self._items.append((index, section))
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def fail(self, error: BaseException):
+        with self._condition:
+            self._error = error
+            self._closed = True
+            self._condition.notify_all()
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: position < len(self._items) or self._closed)
+                if position < len(self._items):
+                    item = self._items[position]
+                elif self._error is not None:
+                    # Same message as the producer's own failure, whichever is reported first
+                    raise StageFailed(str(self._error))
+                else:
+                    return
+            position += 1
+            yield item
+
+    def sections(self) -> list:
+        """All sections published so far, in index order."""
+        with self._condition:
+            return [section for _, section in sorted(self._items)]
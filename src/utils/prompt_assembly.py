@@ -0,0 +1,152 @@
+import hashlib
+import string
+from dataclasses import dataclass, field
+
+from config.prompts import (
+    BLOG_BODY_INSTRUCTIONS,
+    BLOG_CHUNK_SYSTEM_PROMPT,
+    BLOG_CONCLUSION_INSTRUCTIONS,
+    BLOG_INTRO_INSTRUCTIONS,
+    CONTEXT_MERGE_PROMPT,
+    CONTINUATION_PROMPT,
+    NEWSLETTER_CONTEXT_PROMPT,
+    REVISION_PROMPT,
+    SEO_EDITS_PROMPT,
+    SEO_EXPERT_PROMPT,
+    VISUALIZATION_EXPERT_PROMPT,
+)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """Chat messages ordered so that everything static comes before anything variable.
+
+    The system prompt and the instructions never change between requests;
+    only the content, filled in from a format string, does. Every request
+    made from a template therefore starts with the same tokens, which is
+    what provider-side prompt caching matches on. Bump version whenever the
+    wording changes on purpose; key also changes whenever the text does.
+
+    The provider only caches prompts of 1024 tokens or more, and no template's
+    static part (system prompt plus instructions, at most about 400 tokens
+    for the blog templates) reaches that yet. Requests for different content
+    therefore do not hit the cache through this shared prefix. Hits come only
+    when a whole earlier prompt is sent again: continuations, revisions,
+    retries and hedged requests.
+    """
+
+    name: str
+    version: str
+    system: str
+    instructions: str
+    content: str
+    fields: tuple = field(init=False)
+    key: str = field(init=False)
+
+    def __post_init__(self):
+        names = tuple(name for _, name, _, _ in string.Formatter().parse(self.content) if name)
+        digest = hashlib.sha256("\0".join((self.system, self.instructions, self.content)).encode("utf-8"))
+        object.__setattr__(self, "fields", names)
+        object.__setattr__(self, "key", f"{self.name}:{self.version}:{digest.hexdigest()[:12]}")
+
+    def messages(self, **values) -> list:
+        missing = [name for name in self.fields if name not in values]
+        if missing:
+            raise ValueError(f"Prompt template '{self.name}' needs {', '.join(missing)}")
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": f"{self.instructions}\n\n{self.content.format(**values)}"},
+        ]
+
+
+TEMPLATES = {template.name: template for template in (
+    PromptTemplate(
+        "context", "1", NEWSLETTER_CONTEXT_PROMPT,
+        "Process this newsletter and extract its complete context:",
+        "{newsletter}"
+    ),
+    PromptTemplate(
+        "context_segment", "1", NEWSLETTER_CONTEXT_PROMPT,
+        "Process this part of a newsletter and extract its complete context:",
+        "PART {part} OF {total}:\n\n{segment}"
+    ),
+    PromptTemplate(
+        "context_merge", "1", CONTEXT_MERGE_PROMPT,
+        "Merge these partial contexts into one:",
+        "{parts}"
+    ),
+    PromptTemplate(
+        "blog_intro", "2", BLOG_CHUNK_SYSTEM_PROMPT,
+        BLOG_INTRO_INSTRUCTIONS,
+        "NEWSLETTER CONTENT PART {part}:\n\n{chunk}"
+    ),
+    PromptTemplate(
+        "blog_body", "2", BLOG_CHUNK_SYSTEM_PROMPT,
+        BLOG_BODY_INSTRUCTIONS,
+        "CONTINUE WITH NEWSLETTER PART {part}:\n\n{chunk}"
+    ),
+    PromptTemplate(
+        "blog_final", "2", BLOG_CHUNK_SYSTEM_PROMPT,
+        f"{BLOG_BODY_INSTRUCTIONS}\n{BLOG_CONCLUSION_INSTRUCTIONS}",
+        "CONTINUE WITH NEWSLETTER PART {part}:\n\n{chunk}"
+    ),
+    PromptTemplate(
+        "seo_rewrite", "1", SEO_EXPERT_PROMPT,
+        "Optimize this content and generate SEO metadata:",
+        "{blog}"
+    ),
+    PromptTemplate(
+        "seo_edits", "1", SEO_EDITS_PROMPT,
+        "Suggest SEO edits and generate SEO metadata for this blog:",
+        "{numbered_blog}"
+    ),
+    PromptTemplate(
+        "visuals", "1", VISUALIZATION_EXPERT_PROMPT,
+        "Create 2-3 strategic visualizations using Mermaid.js for the following blog content. "
+        "Explain the Mermaid.js code briefly. "
+        "Return a valid JSON response containing the diagrams and a brief code explanations.",
+        "Content:\n{blog}"
+    ),
+    PromptTemplate(
+        "visuals_section", "1", VISUALIZATION_EXPERT_PROMPT,
+        "Create exactly 1 strategic visualization using Mermaid.js for the following blog section. "
+        "Explain the Mermaid.js code briefly. "
+        "Return a valid JSON response containing the diagram and a brief code explanation.",
+        "Section: {heading}\n{body}"
+    ),
+    PromptTemplate(
+        "visuals_repair", "1", VISUALIZATION_EXPERT_PROMPT,
+        "The Mermaid.js diagram below does not parse. "
+        "Return a valid JSON response with one corrected diagram in the same structure.",
+        "Errors:\n- {errors}\n\n{mermaid_code}"
+    ),
+)}
+
+
+def get_template(name: str) -> PromptTemplate:
+    template = TEMPLATES.get(name)
+    if template is None:
+        raise ValueError(f"Unknown prompt template '{name}'")
+    return template
+
+
+def continuation_messages(messages: list, partial: str) -> list:
+    """The original messages, the answer cut off so far and a request to carry on from where it stopped.
+
+    The original messages stay in front unchanged, so the continuation shares
+    their cached prefix.
+    """
+    return [
+        *messages,
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": CONTINUATION_PROMPT},
+    ]
+
+
+def revision_messages(messages: list, previous: str, problems: list) -> list:
+    """The original messages, the answer that failed the quality checks and the problems to fix."""
+    return [
+        *messages,
+        {"role": "assistant", "content": previous},
+        {"role": "user", "content": REVISION_PROMPT.format(problems="\n".join(f"- {problem}" for problem in problems))},
+    ]
@@ -0,0 +1,206 @@
+import contextvars
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import openai
+
+from config.models import FALLBACK_RATE_LIMIT, load_rate_limits
+from utils.tokens import count_message_tokens
+from utils.deadlines import CANCEL_POLL_INTERVAL, check_cancelled, sleep
+
+# Output reserved for requests that do not set max_tokens
+DEFAULT_EXPECTED_OUTPUT_TOKENS = 1000
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+_session = contextvars.ContextVar("scheduler_session", default="default")
+
+
+@contextmanager
+def scheduler_session(session_id: str):
+    """Attribute every request made inside the block to session_id for fair queuing."""
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+class TokenBucket:
+    """Budget that refills continuously up to capacity over one minute. Not thread-safe on its own."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken; requests larger than capacity only wait for a full bucket."""
+        self._refill()
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+    def refund(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    def __init__(self, model, session, tokens, arrival):
+        self.model = model
+        self.session = session
+        self.tokens = tokens
+        self.arrival = arrival
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                          openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: Exception):
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RequestScheduler:
+    """Shared gate in front of the OpenAI API.
+
+    Every request waits until its model has both a request and a token
+    budget left for the current minute. The prompt plus max_tokens is
+    reserved up front and the unused part is refunded once the real usage
+    is known; an attempt that fails gets its whole reservation back, so
+    retries under rate-limit pressure do not use the budget several times
+    over. The limits come from config.models.load_rate_limits, with
+    rate_limits overriding single models. Waiting requests from different sessions are served fairly:
+    the session that has been granted the fewest requests goes first.
+    Rate-limit and transient errors are retried with jittered exponential
+    backoff. A request whose run is cancelled (see utils.deadlines) leaves
+    the queue or stops retrying straight away.
+    """
+
+    def __init__(self, rate_limits: dict = None, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        self.rate_limits = {**load_rate_limits(), **(rate_limits or {})}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._buckets = {}
+        self._waiting = []
+        self._granted = {}
+        self._arrivals = itertools.count()
+        self._condition = threading.Condition()
+
+    def _buckets_for(self, model: str):
+        if model not in self._buckets:
+            limits = self.rate_limits.get(model, FALLBACK_RATE_LIMIT)
+            self._buckets[model] = (TokenBucket(limits["rpm"]), TokenBucket(limits["tpm"]))
+        return self._buckets[model]
+
+    def estimate_tokens(self, kwargs: dict) -> int:
+        model = kwargs.get("model", "")
+        max_tokens = kwargs.get("max_tokens") or DEFAULT_EXPECTED_OUTPUT_TOKENS
+        return count_message_tokens(kwargs.get("messages", []), model) + max_tokens
+
+    def acquire(self, model: str, tokens: int, session: str = None):
+        """Block until the request may be sent and reserve its budget."""
+        session = session or _session.get()
+        with self._condition:
+            # A session that was idle starts level with the busiest waiting
+            # sessions instead of jumping ahead of them
+            active = [self._granted.get(t.session, 0) for t in self._waiting]
+            if active:
+                self._granted[session] = max(self._granted.get(session, 0), min(active))
+            ticket = _Ticket(model, session, tokens, next(self._arrivals))
+            self._waiting.append(ticket)
+            try:
+                while True:
+                    check_cancelled()
+                    delay = self._ready_in(ticket)
+                    if delay == 0:
+                        requests, budget = self._buckets_for(model)
+                        requests.take(1)
+                        budget.take(tokens)
+                        self._granted[session] = self._granted.get(session, 0) + 1
+                        return
+                    self._condition.wait(timeout=min(delay, CANCEL_POLL_INTERVAL))
+            finally:
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+
+    def _ready_in(self, ticket) -> float:
+        """0 if ticket may go now, otherwise how long to wait before checking again."""
+        same_model = [t for t in self._waiting if t.model == ticket.model]
+        first = min(same_model, key=lambda t: (self._granted.get(t.session, 0), t.arrival))
+        requests, budget = self._buckets_for(ticket.model)
+        delay = max(requests.wait_time(1), budget.wait_time(first.tokens))
+        if first is not ticket:
+            return max(delay, 0.05)
+        return delay
+
+    def settle(self, model: str, reserved: int, usage):
+        """Refund the part of a reservation the request did not use."""
+        if usage is None:
+            return
+        used = (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+        if used < reserved:
+            self.release(model, reserved - used)
+
+    def release(self, model: str, tokens: int):
+        """Give tokens of a reservation back, e.g. all of it after a failed attempt."""
+        with self._condition:
+            self._buckets_for(model)[1].refund(tokens)
+            self._condition.notify_all()
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def run(self, kwargs: dict, send, record=None):
+        """Send a request through the scheduler, retrying transient failures.
+
+        record, a utils.metrics.CallRecord, receives the time spent waiting
+        for budget and the number of retries. A streamed response carries no
+        usage yet; its reader settles the reservation once the final usage
+        event arrives.
+        """
+        model = kwargs.get("model", "")
+        tokens = self.estimate_tokens(kwargs)
+        for attempt in range(self.max_retries + 1):
+            queued = time.perf_counter()
+            self.acquire(model, tokens)
+            if record is not None:
+                record.queue_seconds += time.perf_counter() - queued
+                record.retries = attempt
+            try:
+                response = send()
+            except BaseException as e:
+                # A failed attempt gives its reservation back before the retry reserves again
+                self.release(model, tokens)
+                if not isinstance(e, Exception) or attempt == self.max_retries or not is_retryable(e):
+                    raise
+                sleep(self.backoff(attempt, e))
+                continue
+            self.settle(model, tokens, getattr(response, "usage", None))
+            return response
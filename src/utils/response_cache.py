@@ -0,0 +1,133 @@
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite3"))
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Request options that change how a response is delivered, not what it contains
+NON_SEMANTIC_PARAMS = {"stream", "stream_options", "timeout", "extra_headers", "use_cache"}
+
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_cache(enabled: bool = True):
+    """Skip the response cache for every completion requested inside the block."""
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def cache_bypassed() -> bool:
+    return _bypass.get()
+
+
+def make_cache_key(params: dict) -> str:
+    """Hash the model, messages and sampling parameters of a completion request."""
+    semantic = {k: v for k, v in params.items() if k not in NON_SEMANTIC_PARAMS}
+    payload = json.dumps(semantic, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed store of chat completion responses backed by SQLite.
+
+    Entries older than ttl_seconds are dropped on read, and the least recently
+    used entries are evicted once the cache grows past max_entries or max_bytes.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT,"
+            " payload TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        """Return the cached payload for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, payload: str, model: str = ""):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, payload, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, payload, len(payload.encode("utf-8")), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+        stale = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            stale.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": total}
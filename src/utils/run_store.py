@@ -0,0 +1,182 @@
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import zipfile
+
+RUN_STORE_DIR = os.environ.get("RUN_STORE_DIR", os.path.join(".cache", "runs"))
+
+_store = None
+_store_lock = threading.Lock()
+_TITLE = re.compile(r"^#+\s*(.+?)\s*#*\s*$", re.MULTILINE)
+_HEADING_MARK = re.compile(r"^#+\s*", re.MULTILINE)
+
+
+def write_files_atomically(final_dir: str, files: dict):
+    """Write files into a temporary directory next to final_dir and move it into place in one step.
+
+    Readers see either no directory or all of the files, never a partial set.
+    """
+    partial_dir = final_dir + ".partial"
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.makedirs(partial_dir)
+    for name, content in files.items():
+        with open(os.path.join(partial_dir, name), "w", encoding="utf-8") as f:
+            f.write(content)
+    os.replace(partial_dir, final_dir)
+
+
+def result_files(results: dict) -> dict:
+    """The files every stored run or bundle has: context, blog, SEO metadata and diagrams."""
+    return {
+        "context.md": results["context"],
+        "blog.md": results["blog"],
+        "seo.json": json.dumps(results["seo"], indent=2, ensure_ascii=False),
+        "visuals.json": json.dumps(results["visuals"], indent=2, ensure_ascii=False),
+    }
+
+
+def _fts_query(query: str) -> str:
+    """Quote every word so user input cannot break the FTS5 syntax; the last word matches as a prefix."""
+    terms = [f'"{term.replace(chr(34), chr(34) * 2)}"' for term in query.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class RunStore:
+    """Finished runs as one directory of files each, indexed for full-text search.
+
+    Every run is written once into its own directory, so concurrent sessions
+    never overwrite each other's output. The blog, title, focus keywords and
+    URL slug are indexed in an SQLite FTS5 table.
+    """
+
+    def __init__(self, root: str = RUN_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id TEXT PRIMARY KEY,"
+            " title TEXT NOT NULL,"
+            " slug TEXT,"
+            " keywords TEXT,"
+            " meta_description TEXT,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at)")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS runs_fts USING fts5("
+            " run_id UNINDEXED, title, keywords, slug, blog, tokenize = 'porter unicode61')"
+        )
+        self._conn.commit()
+
+    def run_dir(self, run_id: str) -> str:
+        return os.path.join(self.root, "".join(c if c.isalnum() or c in "-_" else "_" for c in run_id))
+
+    def save(self, run_id: str, results: dict) -> str:
+        """Write the run's files and index it; a run id is only ever written once.
+
+        The index rows are inserted first and committed only once the files
+        are in place, so a failure leaves neither behind and the save can be
+        retried. A directory without an index row, left by a save that was
+        interrupted, is replaced.
+        """
+        final_dir = self.run_dir(run_id)
+        seo = results.get("seo") or {}
+        blog = seo.get("seo_enhanced_content") or results["blog"]
+        files = result_files(results)
+        if blog != results["blog"]:
+            files["blog_seo.md"] = blog
+        for number, visual in enumerate(results.get("visuals") or [], 1):
+            if isinstance(visual, dict) and visual.get("mermaid_code"):
+                files[f"diagram_{number}.mmd"] = visual["mermaid_code"]
+
+        title_match = _TITLE.search(blog)
+        title = seo.get("page_title") or (title_match.group(1) if title_match else run_id)
+        keywords = ", ".join(seo.get("focus_keywords") or [])
+        slug = seo.get("url_slug") or ""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM runs WHERE id = ?", (run_id,)).fetchone():
+                raise ValueError(f"Run '{run_id}' has already been saved")
+            try:
+                self._conn.execute(
+                    "INSERT INTO runs (id, title, slug, keywords, meta_description, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (run_id, title, slug, keywords, seo.get("meta_description"), time.time())
+                )
+                self._conn.execute(
+                    "INSERT INTO runs_fts (run_id, title, keywords, slug, blog) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, title, keywords, slug.replace("-", " "), blog)
+                )
+                shutil.rmtree(final_dir, ignore_errors=True)
+                write_files_atomically(final_dir, files)
+                try:
+                    self._conn.commit()
+                except BaseException:
+                    shutil.rmtree(final_dir, ignore_errors=True)
+                    raise
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return final_dir
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Runs matching query, best match first, with a snippet of the blog around the match."""
+        if not query.strip():
+            return self.recent(limit)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT runs.id, runs.title, runs.slug, runs.keywords, runs.created_at,"
+                " snippet(runs_fts, 4, '**', '**', '…', 16)"
+                " FROM runs_fts JOIN runs ON runs.id = runs_fts.run_id"
+                " WHERE runs_fts MATCH ? ORDER BY bm25(runs_fts, 10.0, 5.0, 5.0, 1.0) LIMIT ?",
+                (_fts_query(query), limit)
+            ).fetchall()
+        # Snippets are shown inline, so heading marks and line breaks are flattened
+        return [dict(zip(("id", "title", "slug", "keywords", "created_at"), row[:5]),
+                     snippet=" ".join(_HEADING_MARK.sub(" ", row[5]).split())) for row in rows]
+
+    def recent(self, limit: int = 20) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, slug, keywords, created_at FROM runs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(("id", "title", "slug", "keywords", "created_at"), row), snippet="") for row in rows]
+
+    def files(self, run_id: str) -> dict:
+        """File name → text of a stored run; empty if the run is unknown."""
+        run_dir = self.run_dir(run_id)
+        if not os.path.isdir(run_dir):
+            return {}
+        files = {}
+        for name in sorted(os.listdir(run_dir)):
+            with open(os.path.join(run_dir, name), encoding="utf-8") as f:
+                files[name] = f.read()
+        return files
+
+    def archive(self, run_id: str) -> bytes:
+        """All files of a stored run as a zip archive; empty if the run is unknown."""
+        files = self.files(run_id)
+        if not files:
+            return b""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+        return buffer.getvalue()
+
+
+def get_run_store() -> RunStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RunStore()
+        return _store
@@ -0,0 +1,142 @@
+import re
+
+from utils.chunk_memo import chunk_position
+from utils.markdown_assembler import DEDUP_BANDS, DEDUP_NUM_PERM, DUPLICATE_THRESHOLD, MIN_DEDUP_WORDS, SHINGLE_WORDS
+from utils.minhash import LSHIndex, MinHasher, shingles
+
+# Word counts the blog prompts ask for (config/prompts.py): at least 500
+# words per section, introductions of 300-400 and conclusions of 200-300.
+# The model splits a chunk's answer under several headings, so the section
+# target applies to the chunk as a whole; answers within LENGTH_SLACK of a
+# target pass
+PROMPT_SECTION_WORDS = 500
+PROMPT_INTRO_WORDS = 300
+PROMPT_CONCLUSION_WORDS = 200
+LENGTH_SLACK = 0.2
+MIN_CHUNK_WORDS = round(PROMPT_SECTION_WORDS * (1 - LENGTH_SLACK))
+MIN_INTRO_WORDS = round(PROMPT_INTRO_WORDS * (1 - LENGTH_SLACK))
+MIN_CONCLUSION_WORDS = round(PROMPT_CONCLUSION_WORDS * (1 - LENGTH_SLACK))
+# The prompts forbid sections explained in 2-3 lines; a heading with less
+# than about three lines of text under it fails on its own
+MIN_HEADING_WORDS = 60
+# A section is a repeat when at least this share of its words is in
+# paragraphs that nearly duplicate paragraphs of earlier sections
+MAX_REPEATED_SHARE = 0.5
+MIN_SENTENCE_WORDS = 6
+
+_HEADING = re.compile(r"^(#{1,6})\s*(.*?)\s*#*\s*$")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*+•]|\d+[.)])\s+\S")
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+_CONCLUSION = re.compile(r"\b(conclusion|concluding|final thoughts|wrapping up|in closing|key takeaways)\b", re.IGNORECASE)
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+def heading_blocks(section: str) -> list:
+    """(heading, words) of every level-1 or level-2 heading and the text under it, subheadings included.
+
+    Text before the first such heading belongs to the heading "".
+    """
+    blocks = [["", 0]]
+    in_fence = False
+    for line in section.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(("```", "~~~")):
+            in_fence = not in_fence
+            continue
+        match = None if in_fence else _HEADING.match(stripped)
+        if match and len(match.group(1)) <= 2:
+            blocks.append([match.group(2), 0])
+        elif not match:
+            blocks[-1][1] += len(stripped.split())
+    return [(heading, words) for heading, words in blocks if heading or words]
+
+
+def _formatting_problems(section: str) -> list:
+    lines = section.splitlines()
+    problems = []
+    list_items = sum(bool(_LIST_ITEM.match(line)) for line in lines)
+    if list_items:
+        problems.append(f"uses {list_items} bullet or numbered list item(s); write paragraphs instead")
+    if any(_TABLE_ROW.match(line) for line in lines):
+        problems.append("contains a table; write paragraphs instead")
+    if any(line.strip().startswith(("```", "~~~")) for line in lines):
+        problems.append("contains a code block or diagram; write paragraphs instead")
+    return problems
+
+
+def _length_problems(blocks: list, position: str, has_conclusion: bool) -> list:
+    problems = []
+    total = sum(words for _, words in blocks)
+    if total < MIN_CHUNK_WORDS:
+        problems.append(f"the section has {total} words, it needs at least {MIN_CHUNK_WORDS}")
+    if position == "first" and len(blocks) > 1 and blocks[0][1] == 0:
+        # A title directly followed by the introduction's own heading
+        blocks = blocks[1:]
+    for index, (heading, words) in enumerate(blocks):
+        if position == "first" and index == 0:
+            minimum, name = MIN_INTRO_WORDS, "the introduction"
+        elif _CONCLUSION.search(heading):
+            minimum, name = MIN_CONCLUSION_WORDS, f"the conclusion \"{heading}\""
+        elif heading:
+            minimum, name = MIN_HEADING_WORDS, f"the part under \"{heading}\""
+        else:
+            continue
+        if words < minimum:
+            problems.append(f"{name} has {words} words, it needs at least {minimum}")
+    if position == "last" and not has_conclusion:
+        problems.append("there is no conclusion; end with a \"Conclusion\" section that ties the key points together")
+    return problems
+
+
+def _repeated_sentences(section: str) -> int:
+    seen = set()
+    repeats = 0
+    for sentence in _SENTENCE.split(" ".join(section.split())):
+        key = re.sub(r"\W+", " ", sentence.lower()).strip()
+        if len(key.split()) < MIN_SENTENCE_WORDS:
+            continue
+        if key in seen:
+            repeats += 1
+        seen.add(key)
+    return repeats
+
+
+def section_problems(sections: list) -> list:
+    """The problems found in each blog section, one section per newsletter chunk; an empty list passes.
+
+    Checks the word count of the section and of its introduction,
+    conclusion and headings, list, table and code formatting that
+    the prompts forbid, the conclusion of the last section, sentences
+    repeated within a section and paragraphs that repeat earlier sections.
+    """
+    hasher = MinHasher(num_perm=DEDUP_NUM_PERM)
+    index = LSHIndex(num_perm=hasher.num_perm, bands=DEDUP_BANDS)
+    results = []
+    for section_index, section in enumerate(sections):
+        position = chunk_position(section_index, len(sections)) if len(sections) > 1 else "first"
+        blocks = heading_blocks(section)
+        has_conclusion = any(_CONCLUSION.search(heading) for heading, _ in blocks)
+        problems = _length_problems(blocks, position, has_conclusion) + _formatting_problems(section)
+
+        repeats = _repeated_sentences(section)
+        if repeats:
+            problems.append(f"repeats {repeats} sentence(s) word for word")
+
+        repeated_words = total_words = 0
+        signatures = []
+        for paragraph in re.split(r"\n\s*\n", section):
+            words = len(paragraph.split())
+            total_words += words
+            if words < MIN_DEDUP_WORDS or _HEADING.match(paragraph.strip()):
+                continue
+            signature = hasher.signature(shingles(paragraph, SHINGLE_WORDS))
+            if index.query(signature, DUPLICATE_THRESHOLD):
+                repeated_words += words
+            signatures.append(signature)
+        if total_words and repeated_words / total_words >= MAX_REPEATED_SHARE:
+            problems.append("mostly repeats earlier sections of the blog; cover the new newsletter content instead")
+        # Paragraphs are indexed after the whole section so it is only compared with earlier ones
+        for signature in signatures:
+            index.add(len(index.signatures), signature)
+        results.append(problems)
+    return results
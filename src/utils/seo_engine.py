@@ -0,0 +1,246 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+SEO_INDEX_PATH = os.environ.get("SEO_INDEX_PATH", os.path.join(".cache", "seo_index.sqlite3"))
+
+TITLE_MAX_CHARS = 60
+TITLE_MIN_CHARS = 30
+DESCRIPTION_MAX_CHARS = 160
+DESCRIPTION_MIN_CHARS = 120
+SLUG_MAX_CHARS = 60
+
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her here
+hers herself him himself his how i if in into is it its itself just let like make makes many me more most much
+my myself no nor not now of off on once one only or other our ours ourselves out over own same she should so
+some such than that the their theirs them themselves then there these they this those through to too under
+until up upon us very via was we well were what when where which while who whom why will with within without
+would yet you your yours yourself yourselves
+""".split())
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9'+-]*")
+_PHRASE_BREAK = re.compile(r"[.,;:!?()\[\]{}\"“”‘’|/\\\n—–]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_MARKDOWN = re.compile(r"(\*\*|__|`|\*|_|~~|!?\[([^\]]*)\]\([^)]*\))")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def strip_markdown(line: str) -> str:
+    line = re.sub(r"^\s*(#{1,6}|[-*+]|\d+\.)\s+", "", line)
+    return _MARKDOWN.sub(lambda m: m.group(2) or "", line).strip()
+
+
+def words(text: str) -> list:
+    return [word.lower() for word in _WORD.findall(text)]
+
+
+def slugify(text: str, max_length: int = SLUG_MAX_CHARS) -> str:
+    """ASCII, lower-case, hyphen-separated slug cut at a word boundary.
+
+    Stop words are dropped first when the full slug would be too long.
+    """
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    tokens = re.findall(r"[a-z0-9]+", ascii_text.lower())
+    if len("-".join(tokens)) > max_length:
+        tokens = [token for token in tokens if token not in STOP_WORDS] or tokens
+    slug = ""
+    for token in tokens:
+        candidate = f"{slug}-{token}" if slug else token
+        if len(candidate) > max_length:
+            break
+        slug = candidate
+    return slug or "-".join(tokens)[:max_length].strip("-")
+
+
+def trim_to_words(text: str, max_chars: int, ellipsis: str = "…") -> str:
+    """Cut text at the last word boundary that fits max_chars."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - len(ellipsis) + 1].rsplit(" ", 1)[0].rstrip(" ,;:-—")
+    return cut + ellipsis
+
+
+def describe(blog_text: str, max_chars: int = DESCRIPTION_MAX_CHARS, min_chars: int = DESCRIPTION_MIN_CHARS) -> str:
+    """Meta description made of whole sentences from the opening paragraphs."""
+    sentences = []
+    for line in blog_text.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        sentences += [s for s in _SENTENCE_END.split(strip_markdown(line)) if s]
+        if sum(len(s) + 1 for s in sentences) >= max_chars:
+            break
+
+    description = ""
+    for sentence in sentences:
+        candidate = f"{description} {sentence}".strip()
+        if len(candidate) > max_chars:
+            break
+        description = candidate
+    if len(description) < min_chars and sentences:
+        # The next sentence does not fit whole; fill up to the limit instead
+        description = trim_to_words(" ".join(sentences), max_chars)
+    return description
+
+
+def headline(blog_text: str) -> str:
+    for line in blog_text.splitlines():
+        text = strip_markdown(line)
+        if text:
+            return text
+    return ""
+
+
+def fit_title(title: str, keyword: str = "", max_chars: int = TITLE_MAX_CHARS,
+              min_chars: int = TITLE_MIN_CHARS) -> str:
+    """Trim a long title at a word boundary; lengthen a short one with the keyword."""
+    title = " ".join(title.split())
+    if len(title) < min_chars and keyword and keyword.lower() not in title.lower():
+        extended = f"{title}: {keyword.title()}" if title else keyword.title()
+        if len(extended) <= max_chars:
+            title = extended
+    return trim_to_words(title, max_chars, ellipsis="")
+
+
+def candidate_phrases(text: str, max_words: int = 3) -> list:
+    """RAKE candidates: runs of content words between stop words and punctuation."""
+    phrases = []
+    for fragment in _PHRASE_BREAK.split(text):
+        current = []
+        for word in words(fragment):
+            if word in STOP_WORDS or len(word) < 3 or word.isdigit():
+                if current:
+                    phrases.append(tuple(current))
+                current = []
+                continue
+            current.append(word)
+            if len(current) == max_words:
+                phrases.append(tuple(current))
+                current = []
+        if current:
+            phrases.append(tuple(current))
+    return phrases
+
+
+class DocumentFrequencyIndex:
+    """How many past posts contain each word, kept in SQLite.
+
+    The inverse document frequency of a word tells how specific it is to a
+    post: terms that every post uses ("data", "team") rank below the ones
+    that set this post apart.
+    """
+
+    def __init__(self, path: str = SEO_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS documents (hash TEXT PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, documents INTEGER NOT NULL)")
+        self._conn.commit()
+
+    def add_document(self, text: str, key: str = None) -> bool:
+        """Count text's words once per key, by default the text itself; returns False if the key was added before.
+
+        Pass a stable id of the post, such as the digest of its newsletter,
+        so that regenerated or edited versions of one post count once.
+        """
+        digest = hashlib.sha256((text if key is None else f"key:{key}").encode("utf-8")).hexdigest()
+        terms = {word for word in words(text) if word not in STOP_WORDS}
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM documents WHERE hash = ?", (digest,)).fetchone():
+                return False
+            self._conn.execute("INSERT INTO documents (hash) VALUES (?)", (digest,))
+            self._conn.executemany(
+                "INSERT INTO terms (term, documents) VALUES (?, 1)"
+                " ON CONFLICT(term) DO UPDATE SET documents = documents + 1",
+                [(term,) for term in terms]
+            )
+            self._conn.commit()
+        return True
+
+    def document_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def idf(self, terms) -> dict:
+        terms = list(set(terms))
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            counts = {}
+            for start in range(0, len(terms), 500):
+                batch = terms[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT term, documents FROM terms WHERE term IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                counts.update(rows)
+        return {term: math.log((total + 1) / (counts.get(term, 0) + 1)) + 1 for term in terms}
+
+
+def rank_keywords(text: str, index: DocumentFrequencyIndex = None, limit: int = 5) -> list:
+    """Key phrases of text, best first.
+
+    Phrases get the RAKE score (sum of word degree / frequency), weighted by
+    the words' IDF against the index of past posts when one is given.
+    """
+    phrases = candidate_phrases(text)
+    if not phrases:
+        return []
+    frequency = Counter()
+    degree = defaultdict(int)
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] += 1
+            degree[word] += len(phrase)
+    idf = index.idf(frequency) if index is not None else {}
+
+    scores = {}
+    occurrences = Counter(phrases)
+    for phrase, count in occurrences.items():
+        rake = sum(degree[word] / frequency[word] for word in phrase)
+        specificity = sum(idf.get(word, 1.0) for word in phrase) / len(phrase)
+        # Phrases that recur are topics; one-off phrases are usually incidental
+        scores[phrase] = rake * specificity * (1 + math.log(count))
+
+    keywords = []
+    for phrase, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0])):
+        keyword = " ".join(phrase)
+        if any(keyword in chosen or chosen in keyword for chosen in keywords):
+            continue
+        keywords.append(keyword)
+        if len(keywords) == limit:
+            break
+    return keywords
+
+
+def analyze(blog_text: str, index: DocumentFrequencyIndex = None) -> dict:
+    """SEO metadata computed locally, in the same shape the SEO agent returns."""
+    keywords = rank_keywords(blog_text, index, limit=3)
+    primary = keywords[0] if keywords else ""
+    title = fit_title(headline(blog_text), primary)
+    return {
+        "page_title": title,
+        "meta_title": title,
+        "meta_description": describe(blog_text),
+        "focus_keywords": keywords,
+        "url_slug": slugify(title or primary),
+    }
+
+
+def get_seo_index() -> DocumentFrequencyIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DocumentFrequencyIndex()
+        return _index
@@ -0,0 +1,66 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+_time_to_first_token = contextvars.ContextVar("time_to_first_token", default=None)
+
+
+@contextmanager
+def track_time_to_first_token():
+    """Collect the time to first token of every stage streamed inside the block.
+
+    Yields a dict mapping stage name to seconds. Threads started through
+    utils.concurrency inherit the context, so concurrent stages report into
+    the same dict.
+    """
+    timings = {}
+    token = _time_to_first_token.set(timings)
+    try:
+        yield timings
+    finally:
+        _time_to_first_token.reset(token)
+
+
+def record_time_to_first_token(stage: str, seconds: float):
+    timings = _time_to_first_token.get()
+    if timings is not None:
+        timings.setdefault(stage, seconds)
+
+
+def stream_chat_completion(client, stage: str, **kwargs):
+    """Yield the text deltas of a streamed chat completion and return its finish_reason."""
+    started = time.perf_counter()
+    response = client.chat.completions.create(stream=True, **kwargs)
+    first = True
+    finish_reason = None
+    for event in response:
+        if not event.choices:
+            continue
+        finish_reason = event.choices[0].finish_reason or finish_reason
+        delta = event.choices[0].delta.content
+        if not delta:
+            continue
+        if first:
+            record_time_to_first_token(stage, time.perf_counter() - started)
+            first = False
+        yield delta
+    return finish_reason
+
+
+class StreamCollector:
+    """Iterate an agent stream while keeping the value the generator returns."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.value = None
+
+    def __iter__(self):
+        self.value = yield from self._stream
+
+
+def drain(stream):
+    """Consume an agent stream and return its final value."""
+    collector = StreamCollector(stream)
+    for _ in collector:
+        pass
+    return collector.value
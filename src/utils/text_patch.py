@@ -0,0 +1,73 @@
+import re
+
+_LINE = re.compile(r"[^\n]*\S[^\n]*")
+
+
+class PatchReport:
+    """Which edits were applied to a text and why the others were skipped."""
+
+    def __init__(self):
+        self.applied = 0
+        self.skipped = []
+
+    def skip(self, edit, reason: str):
+        self.skipped.append({"edit": edit, "reason": reason})
+
+    def as_dict(self) -> dict:
+        return {"applied": self.applied, "skipped": len(self.skipped),
+                "skipped_reasons": [item["reason"] for item in self.skipped]}
+
+
+def line_spans(text: str) -> list:
+    """(start, end) offsets of every non-blank line; these are the addressable blocks."""
+    return [match.span() for match in _LINE.finditer(text)]
+
+
+def number_blocks(text: str) -> str:
+    """The text with each non-blank line prefixed by its block number, e.g. "[3] ## Heading"."""
+    return "\n".join(f"[{number}] {text[start:end]}" for number, (start, end) in enumerate(line_spans(text), 1))
+
+
+def apply_edits(text: str, edits: list):
+    """Apply block edits to text and return (patched_text, PatchReport).
+
+    Each edit is a dict with the 1-based "block" number from number_blocks
+    and the "replace" text. With a "find" snippet only that snippet is
+    replaced inside the block, otherwise the whole block is. Edits that
+    point at a missing block or snippet are skipped and reported; the rest
+    of the text is left byte for byte as it was.
+    """
+    report = PatchReport()
+    spans = line_spans(text)
+    blocks = {}
+    for edit in edits:
+        number = edit.get("block") if isinstance(edit, dict) else None
+        replacement = edit.get("replace") if isinstance(edit, dict) else None
+        if not isinstance(number, int) or not isinstance(replacement, str):
+            report.skip(edit, "edit needs an integer block and a replace string")
+            continue
+        if not 1 <= number <= len(spans):
+            report.skip(edit, f"block {number} does not exist")
+            continue
+
+        start, end = spans[number - 1]
+        current = blocks.get(number, text[start:end])
+        find = edit.get("find")
+        if find:
+            if find not in current:
+                report.skip(edit, f"snippet not found in block {number}")
+                continue
+            current = current.replace(find, replacement, 1)
+        else:
+            current = replacement
+        blocks[number] = current
+        report.applied += 1
+
+    pieces = []
+    position = 0
+    for number, (start, end) in enumerate(spans, 1):
+        if number in blocks:
+            pieces += [text[position:start], blocks[number]]
+            position = end
+    pieces.append(text[position:])
+    return "".join(pieces), report
@@ -0,0 +1,99 @@
+import functools
+
+try:
+    import tiktoken
+except ImportError:  # fall back to the word-count estimate
+    tiktoken = None
+
+# Total context window and largest completion each model accepts
+MODEL_LIMITS = {
+    "gpt-4": {"context": 8192, "output": 8192},
+    "gpt-4-turbo": {"context": 128000, "output": 4096},
+    "gpt-4o": {"context": 128000, "output": 16384},
+    "gpt-4o-mini": {"context": 128000, "output": 16384},
+    "chatgpt-4o-latest": {"context": 128000, "output": 16384},
+}
+DEFAULT_LIMITS = {"context": 8192, "output": 4096}
+
+# Tokens added per chat message for the role and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class WordTokenizer:
+    """Offline estimate used when tiktoken is not available (1 token ≈ 0.75 words)."""
+
+    name = "words"
+
+    def count(self, text: str) -> int:
+        return len(text.split()) * 4 // 3
+
+    def split(self, text: str, max_tokens: int) -> list:
+        words = text.split()
+        step = max(1, max_tokens * 3 // 4)
+        return [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+
+
+class TiktokenTokenizer:
+    """Exact token counts from the model's own BPE encoding."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.name = encoding.name
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def split(self, text: str, max_tokens: int) -> list:
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return [self.encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model: str = "gpt-4"):
+    """Return the tokenizer for model.
+
+    tiktoken works offline once its encoding files are in the local cache
+    (see TIKTOKEN_CACHE_DIR). If the package or the encoding is unavailable
+    the word-count estimate is used instead.
+    """
+    if tiktoken is None:
+        return WordTokenizer()
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base" if "4o" in model else "cl100k_base")
+        return TiktokenTokenizer(encoding)
+    except Exception:
+        return WordTokenizer()
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    return get_tokenizer(model).count(text)
+
+
+def count_message_tokens(messages: list, model: str = "gpt-4") -> int:
+    tokenizer = get_tokenizer(model)
+    return sum(tokenizer.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages) + 2
+
+
+class PromptTooLong(ValueError):
+    """Raised when a prompt leaves no room for an answer in the model's context window."""
+
+
+def output_room(messages: list, model: str) -> int:
+    """The longest completion that fits next to messages in model's context window."""
+    limits = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+    return min(limits["output"], limits["context"] - count_message_tokens(messages, model))
+
+
+def plan_max_tokens(messages: list, model: str, desired: int) -> int:
+    """Clamp a desired completion length to what fits next to the prompt.
+
+    Raises PromptTooLong when the prompt alone fills the context window,
+    since such a request can only fail.
+    """
+    room = output_room(messages, model)
+    if room < 1:
+        raise PromptTooLong(f"The prompt does not fit in the context window of {model}")
+    return min(desired, room)
@@ -0,0 +1,51 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+
+_tally = contextvars.ContextVar("usage_tally", default=None)
+
+
+class UsageTally:
+    """Running totals of API calls and billed tokens; safe to share between threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+        }
+
+
+@contextmanager
+def track_usage():
+    """Total the usage of every completion made inside the block, including worker threads."""
+    tally = UsageTally()
+    token = _tally.set(tally)
+    try:
+        yield tally
+    finally:
+        _tally.reset(token)
+
+
+def record_usage(usage):
+    """Add an OpenAI `usage` object to the active tally, if any."""
+    tally = _tally.get()
+    if tally is not None and usage is not None:
+        tally.add(usage.prompt_tokens or 0, usage.completion_tokens or 0)